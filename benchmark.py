@@ -0,0 +1,1303 @@
+# Codeup Data Science
+# Ada Group 2
+# Benchmarks for the checkbook application
+
+import argparse
+import asyncio
+import calendar
+import concurrent.futures
+import contextlib
+import csv
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import checkbook
+
+
+BENCHMARK_FILENAME = "benchmark_ledger.csv"
+CATEGORIES = ("grocery", "rent", "utilities", "income", "dining", "travel")
+WORDS = (
+    "ACH", "payment", "transfer", "refund", "check", "deposit", "store",
+    "online", "market", "invoice", "subscription", "fuel", "coffee", "rent",
+)
+KEYWORDS = ("ACH", "refund", "invoice 42", "coffee", "market online", "zzz")
+# how often each category occurs, so that a few categories account for most
+# transactions as in a real ledger
+CATEGORY_CUM_WEIGHTS = tuple(itertools.accumulate((40, 6, 10, 4, 30, 10)))
+# mu and sigma of the lognormal distribution of amounts in each category
+AMOUNT_SCALES = {
+    "grocery": (3.8, 0.8),
+    "rent": (7.2, 0.2),
+    "utilities": (4.5, 0.5),
+    "income": (7.8, 0.4),
+    "dining": (3.2, 0.7),
+    "travel": (5.5, 1.2),
+}
+# fraction of debit categories recorded as credits
+REFUND_FRACTION = 0.03
+# generated timestamps run from 2015 to the end of 2023, a fraction of them
+# backdated by up to 30 days so that the ledger is not in timestamp order
+GENERATED_START = calendar.timegm((2015, 1, 1, 0, 0, 0))
+GENERATED_SECONDS = calendar.timegm((2024, 1, 1, 0, 0, 0)) - GENERATED_START
+BACKDATED_FRACTION = 0.05
+BACKDATED_SECONDS = 30 * 24 * 60 * 60
+# fractions of descriptions with a long memo, with quotes and a comma, and
+# spanning two lines
+LONG_DESCRIPTION_FRACTION = 0.05
+QUOTED_DESCRIPTION_FRACTION = 0.03
+MULTILINE_DESCRIPTION_FRACTION = 0.001
+# rows generated and written at a time
+GENERATE_BATCH_ROWS = 10_000
+# each timing of the suite repeats a call until it has taken this long
+SUITE_MIN_SECONDS = 0.2
+# results of the suite and the baseline they are compared with by default
+RESULTS_FILENAME = "benchmark_results.json"
+# slowdown or growth in peak memory, as a fraction of the baseline, and
+# absolute changes below which a result is not flagged as a regression
+REGRESSION_TOLERANCE = 0.25
+REGRESSION_MIN_SECONDS = 1e-6
+REGRESSION_MIN_BYTES = 64 * 1024
+# ledgers generated for the consolidated view, sharing the rows
+CONSOLIDATE_ACCOUNTS = 50
+# clients of the ledger server benchmark and requests sent by each one
+SERVER_CONNECTIONS = 16
+SERVER_REQUESTS = 250
+# threads appending to a ledger at once and records appended by each one
+APPEND_THREADS = 16
+APPEND_RECORDS = 125
+
+
+def generate_ledger(ledger_file, num_rows, seed=0):
+    """
+    str, int, int -> None
+
+    ledger_file is the name of the ledger file to create
+    num_rows is the number of transactions to generate
+    seed seeds the random number generator
+
+    write a synthetic ledger of num_rows transactions to ledger_file, a
+    batch of rows at a time so that ledgers of any size can be generated;
+    categories are skewed by CATEGORY_WEIGHTS, timestamps mostly increase
+    but some are backdated, and some descriptions are long or need quoting
+    """
+    rng = random.Random(seed)
+    step = GENERATED_SECONDS / max(num_rows, 1)
+    checkbook.create_ledger_file(ledger_file)
+    with open(ledger_file, "a", newline="") as lf:
+        writer = csv.writer(lf)
+        for first in range(1, num_rows + 1, GENERATE_BATCH_ROWS):
+            last = min(first + GENERATE_BATCH_ROWS, num_rows + 1)
+            categories = rng.choices(
+                CATEGORIES, cum_weights=CATEGORY_CUM_WEIGHTS, k=last - first
+            )
+            rows = []
+            for row_id, category in zip(range(first, last), categories):
+                offset = int((row_id - 1 + rng.random()) * step)
+                epoch = GENERATED_START + offset
+                if rng.random() < BACKDATED_FRACTION:
+                    epoch -= rng.randint(0, BACKDATED_SECONDS)
+                mu, sigma = AMOUNT_SCALES[category]
+                amount = max(round(rng.lognormvariate(mu, sigma), 2), 0.01)
+                if category != "income" and rng.random() >= REFUND_FRACTION:
+                    amount = -amount
+                rows.append(
+                    (
+                        row_id,
+                        time.strftime(
+                            "%Y-%m-%d %H:%M:%S", time.gmtime(max(epoch, 0))
+                        ),
+                        category,
+                        generate_description(rng, row_id),
+                        f"{amount:.2f}",
+                    )
+                )
+            writer.writerows(rows)
+
+
+def generate_description(rng, row_id):
+    """
+    random.Random, int -> str
+
+    rng is the random number generator
+    row_id is the ID of the transaction
+
+    return a description of two words and the row ID, sometimes followed by
+    a long memo, by a comma and a quoted word, or by a second line
+    """
+    description = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {row_id}"
+    kind = rng.random()
+    if kind < LONG_DESCRIPTION_FRACTION:
+        words = rng.choices(WORDS, k=rng.randint(20, 60))
+        return description + " " + " ".join(words)
+    kind -= LONG_DESCRIPTION_FRACTION
+    if kind < QUOTED_DESCRIPTION_FRACTION:
+        return f'{description}, "{rng.choice(WORDS)}"'
+    kind -= QUOTED_DESCRIPTION_FRACTION
+    if kind < MULTILINE_DESCRIPTION_FRACTION:
+        return f"{description}\n{rng.choice(WORDS)}"
+    return description
+
+
+def time_call(func, *args):
+    """
+    function, ... -> float, object, str
+
+    func is the function to time
+    args are the arguments to call func with
+
+    return seconds taken by func, its result and everything it printed
+    """
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+    return elapsed, result, out.getvalue()
+
+
+def compare(name, baseline, candidate, *args):
+    """
+    str, function, function, ... -> None
+
+    name is the name of the benchmark
+    baseline is the function to compare against
+    candidate is the function expected to be faster
+    args are the arguments to call both functions with
+
+    print the time taken by both functions and check that they print the
+    same output
+    """
+    base_time, _, base_out = time_call(baseline, *args[0])
+    cand_time, _, cand_out = time_call(candidate, *args[1])
+    same = "identical" if base_out == cand_out else "DIFFERENT OUTPUT"
+    print(
+        f"{name:<24}|{base_time:>10.4f}s|{cand_time:>10.4f}s|"
+        f"{base_time / cand_time:>9.1f}x| {same}"
+    )
+
+
+def bench_columns(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    compare the dict-based statistics and searches with the columnar ones,
+    on columns already loaded and then end to end, where the load of a CSV
+    ledger takes most of the time
+    """
+    load_time, ledg_list, _ = time_call(checkbook.get_trans, ledger_file)
+    columns_time, columns, _ = time_call(checkbook.load_columns, ledger_file)
+    print(f"get_trans: {load_time:.4f}s, load_columns: {columns_time:.4f}s\n")
+
+    print(f"{'benchmark':<24}|{'dicts':>11}|{'columns':>11}|{'speedup':>10}|")
+    compare(
+        "print_ledger_stats",
+        checkbook.print_ledger_stats,
+        checkbook.print_ledger_stats_columns,
+        (ledg_list,),
+        (columns,),
+    )
+    compare(
+        "print_by_date",
+        checkbook.print_by_date,
+        checkbook.print_by_date_columns,
+        ("2019-06-15", ledg_list),
+        ("2019-06-15", columns),
+    )
+    compare(
+        "print_by_cat",
+        checkbook.print_by_cat,
+        checkbook.print_by_cat_columns,
+        ("travel", ledg_list),
+        ("travel", columns),
+    )
+    compare(
+        "print_by_desc",
+        checkbook.print_by_desc,
+        checkbook.print_by_desc_columns,
+        ("invoice 4242", ledg_list),
+        ("invoice 4242", columns),
+    )
+
+    # end to end, including the load, as the history command runs
+    compare(
+        "history (with load)",
+        history_transactions,
+        checkbook.print_history,
+        (ledger_file,),
+        (ledger_file,),
+    )
+    compare(
+        "stats (with load)",
+        lambda f: checkbook.print_ledger_stats(checkbook.get_trans(f)),
+        checkbook.print_stats,
+        (ledger_file,),
+        (ledger_file,),
+    )
+
+
+def history_transactions(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    print the ledger and its statistics as the history command did before
+    it loaded columns
+    """
+    ledger_list = checkbook.get_transactions(ledger_file)
+    checkbook.print_ledger(ledger_list)
+    checkbook.print_ledger_stats(ledger_list)
+
+
+def bench_description_index(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    compare keyword searches by linear scan, both of a ledger already in
+    memory and including the time to load it, with searches narrowed down
+    by the trigram index
+    """
+    build_time, _, _ = time_call(
+        checkbook.refresh_trigram_index, ledger_file
+    )
+    load_time, ledg_list, _ = time_call(checkbook.get_trans, ledger_file)
+    print(f"\ntrigram index built in {build_time:.4f}s\n")
+    print(
+        f"{'keyword':<24}|{'scan':>11}|{'load+scan':>11}|{'index':>11}|"
+        f"{'speedup':>10}|"
+    )
+    for keyword in KEYWORDS:
+        scan_time, _, scan_out = time_call(
+            checkbook.print_by_desc, keyword, ledg_list
+        )
+        index_time, _, index_out = time_call(
+            lambda term: checkbook.print_by_desc(
+                term, checkbook.description_transactions(ledger_file, [term])
+            ),
+            keyword,
+        )
+        same = "identical" if scan_out == index_out else "DIFFERENT OUTPUT"
+        print(
+            f"{keyword:<24}|{scan_time:>10.4f}s|"
+            f"{load_time + scan_time:>10.4f}s|{index_time:>10.4f}s|"
+            f"{(load_time + scan_time) / index_time:>9.1f}x| {same}"
+        )
+
+
+def bench_binary(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    compare reading the CSV ledger with reading a binary copy of it
+    """
+    binary_file = os.path.splitext(ledger_file)[0] + ".bin"
+    checkbook.remove_ledger_file(binary_file)
+    convert_time, _, _ = time_call(
+        checkbook.migrate_ledger, ledger_file, binary_file
+    )
+    print(f"\nconverted to binary in {convert_time:.4f}s\n")
+    print(f"{'benchmark':<24}|{'csv':>11}|{'binary':>11}|{'speedup':>10}|")
+    try:
+        for name, func, *args in (
+            ("get_trans", checkbook.get_trans),
+            ("last_row_id", checkbook.last_row_id),
+            ("is_valid_transaction_id", checkbook.is_valid_transaction_id, 7),
+            ("read_page", checkbook.read_page, 5000, 50),
+            ("load_columns", checkbook.load_columns),
+            # the columnar paths only skip the parse for a binary ledger
+            ("print_history", checkbook.print_history),
+            ("print_stats", checkbook.print_stats),
+        ):
+            compare(
+                name, func, func, (ledger_file, *args), (binary_file, *args)
+            )
+        # the CSV balance is served from its checkpoint after the first call
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(ledger_file + checkbook.BALANCE_SUFFIX)
+        compare(
+            "view_balance (no cache)",
+            checkbook.view_balance,
+            checkbook.view_balance,
+            (ledger_file,),
+            (binary_file,),
+        )
+    finally:
+        checkbook.remove_ledger_file(binary_file)
+
+
+def bench_parallel(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    compare parsing the ledger in one process with parsing it in chunks
+    across one process per CPU
+    """
+
+    def uncached_balance(ledger_file):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(ledger_file + checkbook.BALANCE_SUFFIX)
+        return checkbook.view_balance(ledger_file)
+
+    settings = checkbook.PARALLEL_WORKERS, checkbook.PARALLEL_MIN_BYTES
+    print(f"\n{os.cpu_count()} CPUs\n")
+    print(
+        f"{'benchmark':<24}|{'serial':>11}|{'parallel':>11}|{'speedup':>10}|"
+    )
+    try:
+        for name, func in (
+            ("get_trans", checkbook.get_trans),
+            ("view_balance (no cache)", uncached_balance),
+        ):
+            checkbook.PARALLEL_WORKERS = 1
+            serial_time, serial, _ = time_call(func, ledger_file)
+            checkbook.PARALLEL_WORKERS = settings[0]
+            checkbook.PARALLEL_MIN_BYTES = 0
+            parallel_time, parallel, _ = time_call(func, ledger_file)
+            checkbook.PARALLEL_MIN_BYTES = settings[1]
+            same = "identical" if serial == parallel else "DIFFERENT OUTPUT"
+            print(
+                f"{name:<24}|{serial_time:>10.4f}s|{parallel_time:>10.4f}s|"
+                f"{serial_time / parallel_time:>9.1f}x| {same}"
+            )
+    finally:
+        checkbook.PARALLEL_WORKERS, checkbook.PARALLEL_MIN_BYTES = settings
+
+
+def menu_actions(ledger_file, rounds=5):
+    """
+    str, int -> list
+
+    ledger_file is the name of the ledger file
+    rounds is the number of times to go through the actions
+
+    go through the ledger lookups of a session of menu actions (balance,
+    history, deposit and modify) and return their results
+    """
+    results = []
+    for _ in range(rounds):
+        results.append(checkbook.view_balance(ledger_file))
+        results.append(checkbook.get_trans(ledger_file)[-1])
+        results.append(checkbook.last_row_id(ledger_file))
+        results.append(checkbook.is_valid_transaction_id(ledger_file, 7))
+    return results
+
+
+def bench_cache(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    compare a session of menu actions with and without the ledger cache
+    """
+    print(
+        f"\n{'benchmark':<24}|{'no cache':>11}|{'cache':>11}|{'speedup':>10}|"
+    )
+    uncached_time, uncached, _ = time_call(menu_actions, ledger_file)
+    checkbook.CACHE_LEDGERS = True
+    try:
+        cached_time, cached, _ = time_call(menu_actions, ledger_file)
+    finally:
+        checkbook.CACHE_LEDGERS = False
+        checkbook.LEDGER_CACHE.clear()
+    same = "identical" if cached == uncached else "DIFFERENT OUTPUT"
+    print(
+        f"{'menu actions':<24}|{uncached_time:>10.4f}s|{cached_time:>10.4f}s|"
+        f"{uncached_time / cached_time:>9.1f}x| {same}"
+    )
+
+
+def print_ledger_per_row(ledg_list):
+    """
+    list of dict -> None
+
+    ledg_list is a list of dictionaries representing transactions
+
+    print the ledger a row at a time, as print_ledger used to
+    """
+    print(
+        f"\n{checkbook.ID_COL:<4}|{checkbook.TIMESTAMP_COL:<20}|"
+        f"{checkbook.CATEGORY_COL:<20}|{checkbook.DESCRIPTION_COL:<50}|"
+        f"{checkbook.AMOUNT_COL:<15}"
+    )
+    for transaction in ledg_list:
+        checkbook.print_transaction(transaction)
+
+
+def bench_render(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    compare printing the ledger a row at a time with batched rendering
+    """
+    ledg_list = checkbook.get_trans(ledger_file)
+    print(f"\n{'benchmark':<24}|{'per row':>11}|{'batched':>11}|"
+          f"{'speedup':>10}|")
+    compare(
+        "print_ledger",
+        print_ledger_per_row,
+        checkbook.print_ledger,
+        (ledg_list,),
+        (ledg_list,),
+    )
+
+
+def bench_transactions(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    compare the memory held by the ledger loaded as dictionaries with the
+    memory held by it loaded as Transactions, and the time taken to load
+    and print both
+    """
+    print(
+        f"\n{'benchmark':<24}|{'dicts':>11}|{'Transactions':>12}|"
+        f"{'saving':>9}|"
+    )
+    held = {}
+    for func in (checkbook.get_trans, checkbook.get_transactions):
+        tracemalloc.start()
+        try:
+            ledg_list = func(ledger_file)
+            held[func] = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del ledg_list
+    (dict_bytes, dict_peak), (tuple_bytes, tuple_peak) = held.values()
+    for name, dicts, tuples in (
+        ("held (MB)", dict_bytes, tuple_bytes),
+        ("peak while loading (MB)", dict_peak, tuple_peak),
+    ):
+        print(
+            f"{name:<24}|{dicts / 2**20:>11.1f}|{tuples / 2**20:>12.1f}|"
+            f"{dicts / tuples:>8.1f}x|"
+        )
+    print(f"\n{'benchmark':<24}|{'dicts':>11}|{'tuples':>11}|{'speedup':>10}|")
+    compare(
+        "load",
+        checkbook.get_trans,
+        checkbook.get_transactions,
+        (ledger_file,),
+        (ledger_file,),
+    )
+    compare(
+        "load and print_ledger",
+        lambda loader: checkbook.print_ledger(loader(ledger_file)),
+        lambda loader: checkbook.print_ledger(loader(ledger_file)),
+        (checkbook.get_trans,),
+        (checkbook.get_transactions,),
+    )
+
+
+def bench_archive(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    archive the history before the last generated year of copies of the
+    ledger with each codec, then compare reading the ledger with reading
+    the archived copy
+    """
+    archived_file = os.path.splitext(ledger_file)[0] + "_archived.csv"
+    print(f"\n{'codec':<24}|{'archive':>11}|{'on disk (MB)':>13}|")
+    size = os.path.getsize(ledger_file)
+    print(f"{'none':<24}|{'':>11}|{size / 2**20:>13.1f}|")
+    try:
+        for codec in checkbook.ARCHIVE_CODECS:
+            checkbook.remove_ledger_file(archived_file)
+            shutil.copyfile(ledger_file, archived_file)
+            archive_time, _, _ = time_call(
+                checkbook.archive_ledger, archived_file, "2023", codec
+            )
+            size = os.path.getsize(archived_file) + os.path.getsize(
+                archived_file + checkbook.ARCHIVE_SUFFIX
+            )
+            print(f"{codec:<24}|{archive_time:>10.4f}s|{size / 2**20:>13.1f}|")
+
+        print(
+            f"\n{'benchmark':<24}|{'csv':>11}|{'archived':>11}|"
+            f"{'speedup':>10}|"
+        )
+        date_range = checkbook.date_range_transactions
+        recent = checkbook.period_bounds("2023-06")
+        old = checkbook.period_bounds("2016-06")
+        for name, func, *args in (
+            ("get_trans", checkbook.get_trans),
+            ("read_page", checkbook.read_page, 5000, 50),
+            ("date_range (2023-06)", date_range, *recent),
+            ("date_range (2016-06)", date_range, *old),
+            ("category_transactions", checkbook.category_transactions, "rent"),
+        ):
+            compare(
+                name, func, func, (ledger_file, *args), (archived_file, *args)
+            )
+        # the balances are served from their checkpoints after the first call
+        for filename in (ledger_file, archived_file):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(filename + checkbook.BALANCE_SUFFIX)
+        compare(
+            "view_balance (no cache)",
+            lambda filename: print(checkbook.view_balance(filename)),
+            lambda filename: print(checkbook.view_balance(filename)),
+            (ledger_file,),
+            (archived_file,),
+        )
+    finally:
+        checkbook.remove_ledger_file(archived_file)
+
+
+def bench_consolidate(num_rows):
+    """
+    int -> None
+
+    num_rows is the number of transactions in all the generated ledgers
+
+    generate CONSOLIDATE_ACCOUNTS ledgers and compare consolidating them
+    one at a time with consolidating them in a pool of processes
+    """
+    accounts_dir = os.path.splitext(BENCHMARK_FILENAME)[0] + "_accounts"
+    shutil.rmtree(accounts_dir, ignore_errors=True)
+    os.mkdir(accounts_dir)
+    try:
+        ledger_files = []
+        for i in range(CONSOLIDATE_ACCOUNTS):
+            ledger_file = os.path.join(accounts_dir, f"account{i:03}.csv")
+            generate_ledger(
+                ledger_file, num_rows // CONSOLIDATE_ACCOUNTS, seed=i
+            )
+            ledger_files.append(ledger_file)
+        print(
+            f"\n{CONSOLIDATE_ACCOUNTS} accounts\n\n"
+            f"{'benchmark':<24}|{'1 thread':>11}|{'processes':>11}|"
+            f"{'speedup':>10}|"
+        )
+        for name, history in (("consolidate", False), ("history", True)):
+            compare(
+                name,
+                checkbook.consolidate_ledgers,
+                checkbook.consolidate_ledgers,
+                (ledger_files, history, False, 1),
+                (ledger_files, history, True),
+            )
+    finally:
+        shutil.rmtree(accounts_dir, ignore_errors=True)
+
+
+async def http_request(reader, writer, method, path, payload=None):
+    """
+    asyncio.StreamReader, asyncio.StreamWriter, str, str, dict -> int, dict
+
+    reader and writer are a keep-alive connection to the ledger server
+    method and path are the HTTP method and path (with query) to request
+    payload is the JSON body of the request, if any
+
+    return the status and JSON body of the response
+    """
+    body = b"" if payload is None else json.dumps(payload).encode()
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode().partition(":")
+        headers[name.strip().lower()] = value.strip()
+    content = await reader.readexactly(int(headers["content-length"]))
+    return status, json.loads(content)
+
+
+def server_requests(rng, last_id, count):
+    """
+    random.Random, int, int -> list of (str, str, str, dict)
+
+    rng is the random number generator
+    last_id is the ID of the last transaction in the ledger
+    count is the number of requests
+
+    return a mix of reads and writes, each one the name of its endpoint,
+    HTTP method, path and JSON body
+    """
+    requests = []
+    for _ in range(count):
+        kind = rng.choices(
+            ("balance", "history", "search", "deposit", "modify"),
+            (30, 30, 20, 10, 10),
+        )[0]
+        if kind == "balance":
+            requests.append((kind, "GET", "/balance", None))
+        elif kind == "history":
+            first_id = rng.randint(1, max(last_id, 1))
+            path = f"/history?first={first_id}&count=50"
+            requests.append((kind, "GET", path, None))
+        elif kind == "search":
+            day = (
+                f"{rng.randint(2015, 2023)}-{rng.randint(1, 12):02}-"
+                f"{rng.randint(1, 28):02}"
+            )
+            requests.append((kind, "GET", f"/search?date={day}", None))
+        elif kind == "deposit":
+            payload = {"amount": rng.randint(1, 10_000) / 100}
+            requests.append((kind, "POST", "/deposit", payload))
+        else:
+            payload = {
+                "id": rng.randint(1, max(last_id, 1)),
+                "description": "modified by load test",
+            }
+            requests.append((kind, "POST", "/modify", payload))
+    return requests
+
+
+async def load_client(host, port, requests, latencies):
+    """
+    str, int, list, dict -> int
+
+    host and port are the address of the ledger server
+    requests are returned by server_requests
+    latencies is a dictionary of endpoint name: list of seconds taken
+
+    send requests one after the other over a single connection, recording
+    how long each one took
+
+    return the number of requests that failed
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    failed = 0
+    try:
+        for name, method, path, payload in requests:
+            start = time.perf_counter()
+            status, _ = await http_request(
+                reader, writer, method, path, payload
+            )
+            latencies.setdefault(name, []).append(
+                time.perf_counter() - start
+            )
+            failed += status >= 400
+    finally:
+        writer.close()
+    return failed
+
+
+async def run_load(host, port, last_id, connections, requests, seed=0):
+    """
+    str, int, int, int, int, int -> float, dict, int
+
+    host and port are the address of the ledger server
+    last_id is the ID of the last transaction in the ledger
+    connections is the number of concurrent clients
+    requests is the number of requests sent by each client
+    seed seeds the random number generator
+
+    return the seconds taken, the latencies of each endpoint and the
+    number of failed requests
+    """
+    rng = random.Random(seed)
+    latencies = {}
+    start = time.perf_counter()
+    failed = await asyncio.gather(
+        *(
+            load_client(
+                host,
+                port,
+                server_requests(rng, last_id, requests),
+                latencies,
+            )
+            for _ in range(connections)
+        )
+    )
+    return time.perf_counter() - start, latencies, sum(failed)
+
+
+def bench_server(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    serve a copy of the ledger in another process and report the latency
+    of each endpoint and the throughput under concurrent clients
+    """
+    server_file = os.path.splitext(ledger_file)[0] + "_server.csv"
+    shutil.copyfile(ledger_file, server_file)
+    last_id = checkbook.last_row_id(server_file)
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        (
+            sys.executable,
+            checkbook.__file__,
+            "--ledger",
+            server_file,
+            "serve",
+            "--port",
+            "0",
+        ),
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        address = server.stdout.readline().rsplit("/", 1)[-1]
+        host, port = address.strip().rsplit(":", 1)
+        print(f"\nserver loaded ledger in {time.perf_counter() - start:.4f}s")
+        elapsed, latencies, failed = asyncio.run(
+            run_load(
+                host, int(port), last_id, SERVER_CONNECTIONS, SERVER_REQUESTS
+            )
+        )
+    finally:
+        server.terminate()
+        server.wait()
+        checkbook.remove_ledger_file(server_file)
+
+    total = sum(len(seconds) for seconds in latencies.values())
+    print(
+        f"{total} requests from {SERVER_CONNECTIONS} clients in "
+        f"{elapsed:.4f}s: {total / elapsed:,.0f} requests/s, "
+        f"{failed} failed\n"
+    )
+    print(
+        f"{'endpoint':<24}|{'requests':>9}|{'p50':>10}|{'p95':>10}|"
+        f"{'p99':>10}|"
+    )
+    for name, seconds in sorted(latencies.items()):
+        cuts = statistics.quantiles(seconds, n=100, method="inclusive")
+        print(
+            f"{name:<24}|{len(seconds):>9}|{cuts[49] * 1000:>8.2f}ms|"
+            f"{cuts[94] * 1000:>8.2f}ms|{cuts[98] * 1000:>8.2f}ms|"
+        )
+
+
+def bench_rollups(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    compare summarizing the ledger by category and month from its rows
+    with reading the maintained rollups
+    """
+    build_time, _, _ = time_call(checkbook.refresh_rollups, ledger_file)
+    print(f"\nrollups built in {build_time:.4f}s\n")
+    print(f"{'benchmark':<24}|{'rows':>11}|{'rollups':>11}|{'speedup':>10}|")
+    compare(
+        "summary",
+        lambda: checkbook.build_rollups(checkbook.get_trans(ledger_file)),
+        lambda: checkbook.ledger_rollups(ledger_file),
+        (),
+        (),
+    )
+
+
+def balance_as_of_rows(ledger_file, epoch):
+    """
+    str, int -> float
+
+    ledger_file is the name of the ledger file
+    epoch is an epoch second
+
+    return the balance just before epoch by filtering the whole ledger, as
+    balance_as_of did before the prefix sums index
+    """
+    return sum(
+        checkbook.amount_to_cents(row[checkbook.AMOUNT_COL])
+        for row in checkbook.get_trans(ledger_file)
+        if checkbook.timestamp_to_epoch(row[checkbook.TIMESTAMP_COL]) < epoch
+    ) / 100
+
+
+def bench_prefix_sums(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    compare finding the balance at the end of a month by filtering the
+    ledger with reading it from the prefix sums index
+    """
+    build_time, _, _ = time_call(checkbook.refresh_prefix_sums, ledger_file)
+    print(f"\nprefix sums built in {build_time:.4f}s\n")
+    print(
+        f"{'benchmark':<24}|{'rows':>11}|{'prefix sums':>11}|"
+        f"{'speedup':>10}|"
+    )
+    _, end = checkbook.period_bounds("2019-06")
+    compare(
+        "balance_as_of",
+        lambda func: print(f"{func(ledger_file, end):.2f}"),
+        lambda func: print(f"{func(ledger_file, end):.2f}"),
+        (balance_as_of_rows,),
+        (checkbook.balance_as_of,),
+    )
+
+
+def append_concurrently(ledger_file, append):
+    """
+    str, function -> float
+
+    ledger_file is the name of the ledger file to create
+    append appends one record to a ledger, given its name and the record
+
+    return seconds taken by APPEND_THREADS threads appending APPEND_RECORDS
+    records each to a new ledger with append
+    """
+
+    def producer(thread):
+        for i in range(APPEND_RECORDS):
+            append(
+                ledger_file,
+                {
+                    checkbook.ID_COL: 1,
+                    checkbook.TIMESTAMP_COL: "2020-01-01 00:00:00",
+                    checkbook.CATEGORY_COL: "load",
+                    checkbook.DESCRIPTION_COL: f"thread {thread} record {i}",
+                    checkbook.AMOUNT_COL: "1.00",
+                },
+            )
+
+    checkbook.create_ledger_file(ledger_file)
+    try:
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(APPEND_THREADS) as pool:
+            list(pool.map(producer, range(APPEND_THREADS)))
+        elapsed = time.perf_counter() - start
+        rows = checkbook.last_row_id(ledger_file)
+        assert rows == APPEND_THREADS * APPEND_RECORDS, rows
+    finally:
+        checkbook.remove_ledger_file(ledger_file)
+    return elapsed
+
+
+def bench_appends(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    compare durable appends from many threads made one write and fsync at
+    a time with appends batched by the group commit writer
+    """
+    append_file = os.path.splitext(ledger_file)[0] + "_appends.csv"
+    records = APPEND_THREADS * APPEND_RECORDS
+    print(
+        f"\n{'benchmark':<24}|{'fsync each':>11}|{'group':>11}|"
+        f"{'speedup':>10}|"
+    )
+    single_time = append_concurrently(
+        append_file,
+        lambda ledger_file, record: checkbook.append_records(
+            ledger_file, [record]
+        ),
+    )
+    group_time = append_concurrently(append_file, checkbook.commit_record)
+    print(
+        f"{f'{records} appends':<24}|{single_time:>10.4f}s|"
+        f"{group_time:>10.4f}s|{single_time / group_time:>9.1f}x|"
+    )
+    print(
+        f"{'appends/s':<24}|{records / single_time:>11,.0f}|"
+        f"{records / group_time:>11,.0f}|"
+    )
+
+
+def suite_benchmarks(ledger_file, seed=0):
+    """
+    str, int -> list of (str, function)
+
+    ledger_file is the name of the ledger file
+    seed seeds the random number generator picking rows to modify
+
+    return the name of each hot path in the suite and a function calling it
+    once, reads first since the writes change the ledger
+    """
+    rng = random.Random(seed)
+    ledg_list = checkbook.get_trans(ledger_file)
+    last_id = checkbook.last_row_id(ledger_file)
+
+    def uncached_balance():
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(ledger_file + checkbook.BALANCE_SUFFIX)
+        return checkbook.view_balance(ledger_file)
+
+    def write():
+        checkbook.write_record(
+            ledger_file,
+            {
+                checkbook.ID_COL: last_id + 1,
+                checkbook.TIMESTAMP_COL: "2024-01-01 00:00:00",
+                checkbook.CATEGORY_COL: "grocery",
+                checkbook.DESCRIPTION_COL: "written by benchmark",
+                checkbook.AMOUNT_COL: "-12.34",
+            },
+        )
+
+    def modify():
+        checkbook.modify_transaction(
+            ledger_file,
+            rng.randint(1, max(last_id, 1)),
+            "2024-01-01",
+            "00:00:00",
+            "dining",
+            "modified by benchmark",
+            12.34,
+        )
+
+    return [
+        ("get_trans", lambda: checkbook.get_trans(ledger_file)),
+        (
+            "get_transactions",
+            lambda: checkbook.get_transactions(ledger_file),
+        ),
+        ("view_balance", lambda: checkbook.view_balance(ledger_file)),
+        ("view_balance (no cache)", uncached_balance),
+        ("last_row_id", lambda: checkbook.last_row_id(ledger_file)),
+        (
+            "is_valid_transaction_id",
+            lambda: checkbook.is_valid_transaction_id(
+                ledger_file, last_id // 2 + 1
+            ),
+        ),
+        ("print_ledger", lambda: checkbook.print_ledger(ledg_list)),
+        (
+            "print_ledger_stats",
+            lambda: checkbook.print_ledger_stats(ledg_list),
+        ),
+        (
+            "print_by_date",
+            lambda: checkbook.print_by_date("2019-06", ledg_list),
+        ),
+        ("print_by_cat", lambda: checkbook.print_by_cat("travel", ledg_list)),
+        (
+            "print_by_desc",
+            lambda: checkbook.print_by_desc("invoice 42", ledg_list),
+        ),
+        (
+            "print_query",
+            lambda: checkbook.print_query(
+                ledger_file,
+                checkbook.make_query(
+                    categories=["rent", "utilities"],
+                    start=checkbook.period_bounds("2019")[0],
+                    end=checkbook.period_bounds("2021")[1],
+                    terms=["ACH"],
+                    max_amount=-100,
+                ),
+            ),
+        ),
+        (
+            "balance_as_of",
+            lambda: checkbook.balance_as_of(
+                ledger_file, checkbook.period_bounds("2019-06")[1]
+            ),
+        ),
+        ("write_record", write),
+        ("modify_transaction", modify),
+    ]
+
+
+def time_repeated(func, repeat):
+    """
+    function, int -> float
+
+    func is the function to time
+    repeat is the number of timings to take
+
+    return the fewest seconds one call to func took, calling it enough
+    times in each timing for the timing to last SUITE_MIN_SECONDS
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= SUITE_MIN_SECONDS:
+            break
+        number *= 10
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+
+def peak_memory(func):
+    """
+    function -> int
+
+    func is the function to measure
+
+    return the most bytes allocated at once by a call to func
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_suite(num_rows, seed=0, repeat=3):
+    """
+    int, int, int -> dict
+
+    num_rows is the number of transactions in the generated ledger
+    seed seeds the random number generator
+    repeat is the number of timings to take of each hot path
+
+    time each hot path of suite_benchmarks on a generated ledger, without
+    tracing, then measure its peak memory with tracemalloc in a separate
+    call
+
+    return a dictionary of benchmark name: {"seconds": float,
+    "peak_bytes": int}
+    """
+    generate_ledger(BENCHMARK_FILENAME, num_rows, seed)
+    # compact the change log in line so that its cost lands in the timing
+    # of modify_transaction rather than in whichever benchmark runs next
+    background = checkbook.COMPACT_IN_BACKGROUND
+    checkbook.COMPACT_IN_BACKGROUND = False
+    results = {}
+    try:
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                for name, func in suite_benchmarks(BENCHMARK_FILENAME, seed):
+                    results[name] = {
+                        "seconds": time_repeated(func, repeat),
+                        "peak_bytes": peak_memory(func),
+                    }
+    finally:
+        checkbook.COMPACT_IN_BACKGROUND = background
+        checkbook.remove_ledger_file(BENCHMARK_FILENAME)
+    return results
+
+
+def format_seconds(seconds):
+    """
+    float -> str
+
+    seconds is a duration
+
+    return seconds in the most readable of s, ms and us
+    """
+    if seconds >= 1:
+        return f"{seconds:.3f}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f}ms"
+    return f"{seconds * 1e6:.3f}us"
+
+
+def report_suite(num_rows, results, baseline=None, tolerance=0.25):
+    """
+    int, dict, dict, float -> list of str
+
+    num_rows is the number of transactions the suite ran on
+    results are returned by run_suite
+    baseline is the results of an earlier run of the suite on num_rows
+    transactions, if any
+    tolerance is the slowdown or growth in peak memory, as a fraction of
+    the baseline, above which a result is a regression
+
+    print the time and peak memory of each benchmark next to its change
+    from the baseline
+
+    return a description of each regression
+    """
+    baseline = baseline or {}
+    regressions = []
+    print(f"\n{num_rows:,} rows\n")
+    print(
+        f"{'benchmark':<24}|{'per call':>12}|{'change':>9}|"
+        f"{'peak MB':>10}|{'change':>9}|"
+    )
+    for name, result in results.items():
+        flagged = len(regressions)
+        changes = []
+        for key, floor in (
+            ("seconds", REGRESSION_MIN_SECONDS),
+            ("peak_bytes", REGRESSION_MIN_BYTES),
+        ):
+            before = baseline.get(name, {}).get(key)
+            if not before:
+                changes.append("")
+                continue
+            change = result[key] / before - 1
+            changes.append(f"{change:+.0%}")
+            if change > tolerance and result[key] - before > floor:
+                regressions.append(
+                    f"{num_rows} rows: {name} {key} {before:g} -> "
+                    f"{result[key]:g} ({change:+.0%})"
+                )
+        print(
+            f"{name:<24}|{format_seconds(result['seconds']):>12}|"
+            f"{changes[0]:>9}|{result['peak_bytes'] / 2**20:>10.2f}|"
+            f"{changes[1]:>9}|"
+            + (" REGRESSION" if len(regressions) > flagged else "")
+        )
+    return regressions
+
+
+def run_comparisons(num_rows):
+    """
+    int -> None
+
+    num_rows is the number of transactions in the generated ledger
+
+    compare each optimized code path with the one it replaced
+    """
+    generate_ledger(BENCHMARK_FILENAME, num_rows)
+    try:
+        print(f"\n{num_rows:,} rows\n")
+        bench_columns(BENCHMARK_FILENAME)
+        bench_description_index(BENCHMARK_FILENAME)
+        bench_render(BENCHMARK_FILENAME)
+        bench_transactions(BENCHMARK_FILENAME)
+        bench_archive(BENCHMARK_FILENAME)
+        bench_consolidate(num_rows)
+        bench_binary(BENCHMARK_FILENAME)
+        bench_parallel(BENCHMARK_FILENAME)
+        bench_cache(BENCHMARK_FILENAME)
+        bench_rollups(BENCHMARK_FILENAME)
+        bench_prefix_sums(BENCHMARK_FILENAME)
+        bench_server(BENCHMARK_FILENAME)
+        bench_appends(BENCHMARK_FILENAME)
+    finally:
+        checkbook.remove_ledger_file(BENCHMARK_FILENAME)
+
+
+def main(argv=None):
+    """
+    list of str -> int
+
+    argv are the command line arguments, sys.argv[1:] if None
+
+    generate a ledger, run the benchmark suite or the comparisons
+
+    return the exit status, 1 if the suite found regressions
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmarks for the checkbook application."
+    )
+    commands = parser.add_subparsers(dest="command")
+    compare_parser = commands.add_parser(
+        "compare",
+        help="compare each optimized code path with the one it replaced",
+    )
+    compare_parser.add_argument(
+        "rows", nargs="?", type=int, default=1_000_000
+    )
+    generate_parser = commands.add_parser(
+        "generate", help="write a synthetic ledger"
+    )
+    generate_parser.add_argument("ledger")
+    generate_parser.add_argument("rows", type=int)
+    generate_parser.add_argument("--seed", type=int, default=0)
+    suite_parser = commands.add_parser(
+        "suite", help="time each hot path and check for regressions"
+    )
+    suite_parser.add_argument(
+        "--rows", nargs="+", type=int, default=[1_000, 100_000]
+    )
+    suite_parser.add_argument("--seed", type=int, default=0)
+    suite_parser.add_argument("--repeat", type=int, default=3)
+    suite_parser.add_argument(
+        "--output",
+        default=RESULTS_FILENAME,
+        help=f"where to write the results (default {RESULTS_FILENAME})",
+    )
+    suite_parser.add_argument(
+        "--baseline", help="results of an earlier run to compare with"
+    )
+    suite_parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="replace the baseline with the results of this run",
+    )
+    suite_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=REGRESSION_TOLERANCE,
+        help="slowdown or growth in peak memory flagged as a regression, "
+        f"as a fraction (default {REGRESSION_TOLERANCE})",
+    )
+    argv = sys.argv[1:] if argv is None else argv
+    # a bare row count runs the comparisons, as before there were commands
+    if not argv or argv[0].isdigit():
+        argv = ["compare", *argv]
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        run_comparisons(args.rows)
+        return 0
+    if args.command == "generate":
+        generate_ledger(args.ledger, args.rows, args.seed)
+        return 0
+
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline needs --baseline")
+    baseline = {}
+    if args.baseline and not args.save_baseline:
+        try:
+            with open(args.baseline) as bf:
+                baseline = json.load(bf)["results"]
+        except FileNotFoundError:
+            parser.error(
+                f"no baseline at {args.baseline}, create it with "
+                "--save-baseline"
+            )
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": {},
+    }
+    regressions = []
+    for num_rows in args.rows:
+        results = run_suite(num_rows, args.seed, args.repeat)
+        report["results"][str(num_rows)] = results
+        regressions += report_suite(
+            num_rows, results, baseline.get(str(num_rows)), args.tolerance
+        )
+    for path in {args.output, args.baseline if args.save_baseline else None}:
+        if path:
+            with open(path, "w") as rf:
+                json.dump(report, rf, indent=2)
+                rf.write("\n")
+    if regressions:
+        print(f"\n{len(regressions)} regressions:", *regressions, sep="\n")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,11 +2,54 @@
 # Ada Group 2
 # By Matthew Capper and Michael P. Moran
 
-import copy
+import argparse
+import array
+import asyncio
+import bisect
+import builtins
+import collections
+import concurrent.futures
+import contextlib
+import cProfile
 import csv
 import datetime
+import functools
+import glob
+import gzip
+import http
+import io
+import heapq
+import itertools
+import json
+import lzma
+import math
+import mmap
+import multiprocessing
+import operator
 import os
+import pstats
+import queue
+import shlex
+import shutil
+import sqlite3
+import struct
 import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # only the columnar loader needs numpy
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks between processes on Windows
+    fcntl = None
 
 
 # CONSTANTS ##################################################################
@@ -16,22 +59,305 @@ CATEGORY_COL = "Category"
 DESCRIPTION_COL = "Description"
 AMOUNT_COL = "Amount"
 COL_NAMES = (ID_COL, TIMESTAMP_COL, CATEGORY_COL, DESCRIPTION_COL, AMOUNT_COL)
+# compact form of a transaction returned by get_transactions: an integer ID,
+# epoch seconds and cents, an interned category and the description
+Transaction = collections.namedtuple(
+    "Transaction", ("id", "epoch", "category", "description", "cents")
+)
+
+EPOCH = datetime.datetime(1970, 1, 1)
+ONE_SECOND = datetime.timedelta(seconds=1)
 
 LEDGER_FILENAME = "ledger.csv"
 
+# default ledger file for each storage backend, chosen with --backend or the
+# CHECKBOOK_BACKEND environment variable; the backend used for a ledger
+# file follows from its extension (see LEDGER_BACKENDS)
+LEDGER_FILENAMES = {
+    "csv": LEDGER_FILENAME,
+    "sqlite": "ledger.db",
+    "binary": "ledger.bin",
+    "sharded": "ledger.shards",
+}
+BACKEND_ENV_VAR = "CHECKBOOK_BACKEND"
+
+# files SQLite keeps next to a database
+SQLITE_SIDECAR_SUFFIXES = ("-wal", "-shm", "-journal")
+SQLITE_SCHEMA = """
+CREATE TABLE transactions (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    category TEXT NOT NULL,
+    description TEXT NOT NULL,
+    cents INTEGER NOT NULL
+);
+CREATE INDEX transactions_timestamp ON transactions (timestamp);
+CREATE INDEX transactions_category ON transactions (category);
+CREATE INDEX transactions_cents ON transactions (cents);
+"""
+SQLITE_COLUMNS = "id, timestamp, category, description, cents"
+
+# a binary ledger is a header followed by fixed-size records of ID, epoch
+# seconds, cents, the offset and length of the description in the string
+# heap sidecar and an index into the category names sidecar
+BINARY_RECORD = struct.Struct("<qqqQII")
+BINARY_FIELDS = ("id", "epoch", "cents", "offset", "length", "category")
+BINARY_MAGIC = b"CHECKBOOK BINARY LEDGER 1\n".ljust(BINARY_RECORD.size, b"\0")
+BINARY_HEAP_SUFFIX = ".heap"
+BINARY_CATEGORIES_SUFFIX = ".category_names"
+
+# a sharded ledger is a directory of CSV shards, one per month or year of
+# transaction timestamps, along with a manifest summarizing each shard
+SHARD_MANIFEST_FILENAME = "manifest.json"
+SHARD_PERIOD_LENGTHS = {"year": len("YYYY"), "month": len("YYYY-MM")}
+SHARD_PERIOD = "month"
+
+# imported rows give Date and Time, or Timestamp, plus Category,
+# Description and a signed Amount; an ID column, if any, is ignored
+DATE_COL = "Date"
+TIME_COL = "Time"
+
+# CSV ledgers with at least PARALLEL_MIN_BYTES to parse are split into
+# chunks of about PARALLEL_CHUNK_BYTES parsed by PARALLEL_WORKERS processes
+# (one per CPU if None)
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+PARALLEL_CHUNK_BYTES = 16 * 1024 * 1024
+PARALLEL_WORKERS = None
+# worker processes are started from a fresh server process (or spawned)
+# rather than forked from this one, whose threads may hold the ledger lock
+# or be writing at the time
+PROCESS_START_METHOD = (
+    "forkserver"
+    if "forkserver" in multiprocessing.get_all_start_methods()
+    else "spawn"
+)
+
+# the interactive session keeps CSV ledgers and their change logs parsed in
+# LEDGER_CACHE, keyed by file name, while CACHE_LEDGERS is True
+CACHE_LEDGERS = False
+LEDGER_CACHE = {}
+
+# rows formatted per write when printing the ledger
+RENDER_BATCH_ROWS = 1000
+# history is shown a page at a time for ledgers with more rows than this
+PAGE_ROWS = 50
+# columns the query engine can sort its matches by
+QUERY_SORT_KEYS = ("id", "timestamp", "category", "amount")
+
+# the consolidated view of many ledgers loads CONSOLIDATE_WORKERS of them at
+# a time (the executor's default if None) and shows the first ACCOUNT_WIDTH
+# characters of each account's name
+CONSOLIDATE_WORKERS = None
+ACCOUNT_WIDTH = 20
+# errors a malformed or unreadable ledger can fail to load with; the
+# consolidated view reports the ledger and carries on with the others
+LOAD_ERRORS = (
+    OSError,
+    ValueError,
+    ArithmeticError,
+    LookupError,
+    TypeError,
+    EOFError,
+    csv.Error,
+    sqlite3.Error,
+    struct.error,
+    zlib.error,
+    lzma.LZMAError,
+)
+
+# address the ledger server listens on by default
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8080
+# larger request bodies are refused without being read
+SERVER_MAX_BODY = 1 << 20
+# query string values that turn a flag on
+TRUE_VALUES = ("1", "true", "yes")
+
+# sidecar files are kept next to the ledger as <ledger_file><suffix>
+BALANCE_SUFFIX = ".balance"
+# bytes read per step when checksumming the ledger up to a checkpoint
+DIGEST_BLOCK_SIZE = 1 << 20
+# bytes read per step when seeking backwards for the last line of a ledger
+TAIL_BLOCK_SIZE = 4096
+
+# modify_transaction appends amendments to <ledger_file>.log; each one holds
+# the new version of the row followed by the version it replaced
+LOG_SUFFIX = ".log"
+OLD_COL_NAMES = tuple(f"Old {name}" for name in COL_NAMES[1:])
+LOG_COL_NAMES = COL_NAMES + OLD_COL_NAMES
+# the log is folded into the ledger once it reaches COMPACT_LOG_BYTES or
+# COMPACT_LOG_RATIO of the ledger's size; until the log is removed,
+# <ledger_file>.log.compacted records the device and inode of the compacted
+# ledger, so that a log already folded into the ledger is never read again
+COMPACTED_SUFFIX = ".log.compacted"
+COMPACT_LOG_BYTES = 64 * 1024 * 1024
+COMPACT_LOG_RATIO = 0.1
+# in a thread started by the write that triggers it, which the CLI waits
+# for before exiting
+COMPACT_IN_BACKGROUND = True
+
+# indexes are sidecars made of a JSON header line followed by packed int64s;
+# the header's "coverage" records how much of the ledger and change log the
+# index reflects, and changes past it are applied when the index is read
+CATEGORY_INDEX_SUFFIX = ".categories"
+TIMESTAMP_INDEX_SUFFIX = ".timestamps"
+TRIGRAM_INDEX_SUFFIX = ".trigrams"
+# the rollups index keeps the count, total, minimum and maximum cents of
+# each category and month in its header; a minimum or maximum that was
+# modified away is null until the group's rows are read again
+ROLLUP_SUFFIX = ".rollups"
+ROLLUP_KINDS = ("category", "month")
+# the prefix sums index keeps the distinct epoch seconds of the transactions,
+# in order, with the total cents of the transactions dated up to each one
+PREFIX_SUM_SUFFIX = ".prefix_sums"
+# an index is saved again once this many bytes of changes are past coverage
+INDEX_REFRESH_BYTES = 1024 * 1024
+# rows are fetched by binary search when fewer than this fraction of the
+# ledger is wanted; otherwise, the ledger is read through once
+FETCH_SCAN_RATIO = 0.02
+
+# closed history can be moved out of a CSV ledger into <ledger_file>.archive:
+# blocks of ARCHIVE_BLOCK_ROWS rows, each compressed on its own, followed by
+# a JSON index holding the footer of each block and the rollups of the
+# archived rows, the index's length and ARCHIVE_MAGIC
+ARCHIVE_SUFFIX = ".archive"
+# a new archive is written to <ledger_file>.archive.pending and only moved
+# into place once the ledger no longer holds the rows it archived
+ARCHIVE_PENDING_SUFFIX = ".archive.pending"
+ARCHIVE_MAGIC = b"CHECKBOOK ARCHIVE 1\n"
+ARCHIVE_TRAILER = struct.Struct("<Q")
+ARCHIVE_BLOCK_ROWS = 10_000
+# compress and decompress functions by codec name
+ARCHIVE_CODECS = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "gzip": (gzip.compress, gzip.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+ARCHIVE_CODEC = "zlib"
+
+# serializes access to the ledger between the CLI and background compaction
+LEDGER_LOCK = threading.RLock()
+# appends and rewrites also take an advisory lock on <ledger_file>.lock so
+# that other processes wait for them; LOCKED_LEDGERS maps each lock file
+# this process holds to its descriptor and how many times it is held
+LOCK_SUFFIX = ".lock"
+LOCKED_LEDGERS = {}
+
+# records queued with queue_record within GROUP_COMMIT_SECONDS of the first
+# one, up to GROUP_COMMIT_MAX_RECORDS, are appended with one write and one
+# fsync by the ledger's group commit writer thread
+GROUP_COMMIT_SECONDS = 0.002
+GROUP_COMMIT_MAX_RECORDS = 10_000
+GROUP_COMMITTERS = {}
+GROUP_COMMIT_LOCK = threading.Lock()
+
+# --profile, or the CHECKBOOK_PROFILE environment variable, reports the time
+# each action spent parsing, computing, rendering and waiting for input, the
+# rows it parsed, the files it opened and the bytes the whole process (its
+# background threads included) read and wrote meanwhile, as a table or a
+# JSON line on stderr; until enable_profiling is called, none of
+# the functions below are wrapped and profiling costs nothing
+PROFILE_ENV_VAR = "CHECKBOOK_PROFILE"
+PROFILE_FORMATS = ("table", "json")
+PROFILE_PHASES = {
+    "parse": (
+        "get_trans",
+        "get_transactions",
+        "parallel_get_trans",
+        "ledger_balance_cents",
+        "read_amendments",
+        "current_row",
+        "fetch_rows",
+        "read_page",
+        "last_row_id",
+        "is_valid_transaction_id",
+        "load_columns",
+        "category_transactions",
+        "date_range_transactions",
+        "description_transactions",
+        "query_rows",
+    ),
+    "compute": (
+        "view_balance",
+        "write_record",
+        "append_records",
+        "modify_transaction",
+        "compact_ledger",
+        "maintain_indexes",
+        "ledger_rollups",
+        "verify_rollups",
+        "import_transactions",
+        "migrate_ledger",
+        "archive_ledger",
+        "consolidate_ledgers",
+        "cents_before",
+        "refresh_category_index",
+        "refresh_timestamp_index",
+        "refresh_trigram_index",
+        "refresh_rollups",
+        "refresh_prefix_sums",
+    ),
+    "render": (
+        "print_ledger",
+        "print_ledger_columns",
+        "page_ledger",
+        "print_ledger_stats",
+        "print_ledger_stats_columns",
+        "print_by_date",
+        "print_by_date_range",
+        "print_by_cat",
+        "print_by_desc",
+        "print_by_keywords",
+        "print_rollups",
+        "print_query",
+    ),
+    "input": ("input",),
+}
+# dispatch tables whose entries are wrapped as well, as calls through them
+# do not look up the wrapped names: an entry is profiled as the function
+# it holds or, for a backend, as the function its key names
+PROFILE_TABLES = (
+    "INDEX_REFRESHERS",
+    "BINARY_BACKEND",
+    "SHARDED_BACKEND",
+    "SQLITE_BACKEND",
+)
+# the action being profiled, the output format and the cProfile or
+# tracemalloc session still to be run, and the functions and table entries
+# that were wrapped
+PROFILE = None
+PROFILE_SETTINGS = {"format": None, "session": None, "session_action": None}
+PROFILED_FUNCTIONS = {}
+PROFILED_TABLES = {}
+# lines of the cProfile or tracemalloc session report
+PROFILE_SESSION_LINES = 20
+# name of the action profiled for each menu choice
+MENU_ACTIONS = {
+    "1": "balance",
+    "2": "withdraw",
+    "3": "deposit",
+    "4": "history",
+    "5": "modify",
+    "7": "as-of",
+}
+
 OPTION_VIEW_BALANCE = "1"
 OPTION_WITHDRAW = "2"
 OPTION_DEPOSIT = "3"
 OPTION_VIEW_HISTORY = "4"
 OPTION_MODIFY_TRANSACTION = "5"
 OPTION_EXIT = "6"
+OPTION_BALANCE_AS_OF = "7"
 
+# in the order of the menu, which lists Exit last while keeping it at 6 for
+# scripts written before the balance as of a date was added
 OPTIONS = (
     OPTION_VIEW_BALANCE,
     OPTION_WITHDRAW,
     OPTION_DEPOSIT,
     OPTION_VIEW_HISTORY,
     OPTION_MODIFY_TRANSACTION,
+    OPTION_BALANCE_AS_OF,
     OPTION_EXIT,
 )
 ##############################################################################
@@ -43,28 +369,149 @@ def get_trans(ledger_file):
 
     ledger_file is name of the ledger file
 
-    composes a list of dictionaries from ledger
+    composes a list of dictionaries from ledger, with the latest amendment
+    from the change log in place of each modified row, after the rows of
+    the ledger's archive
     """
-    with open(ledger_file) as lf:
-        transact_list = [
-            {k: v for k, v in row.items()}
-            for row in csv.DictReader(lf, skipinitialspace=True)
-        ]
-        return transact_list
+    backend = ledger_backend(ledger_file)
+    if backend:
+        return backend["get_trans"](ledger_file)
+    with LEDGER_LOCK, open(ledger_file) as lf:
+        amendments = read_amendments(ledger_file)
+        if CACHE_LEDGERS:
+            rows = cached_ledger(ledger_file)["rows"]
+            transact_list = [dict(row) for row in rows]
+        else:
+            transact_list = parallel_get_trans(ledger_file)
+        if transact_list is None:
+            transact_list = [
+                {k: v for k, v in row.items()}
+                for row in csv.DictReader(lf, skipinitialspace=True)
+            ]
+        if amendments:
+            for transaction in transact_list:
+                amended = amendments.get(transaction.get(ID_COL))
+                if amended:
+                    transaction.update(amended)
+        return archived_rows(ledger_file) + transact_list
+
+
+def get_transactions(ledger_file):
+    """
+    str -> list of Transaction
+
+    ledger_file is name of the ledger file
+
+    return the transactions get_trans returns as Transactions, which take
+    about half the memory of dictionaries; a CSV ledger is parsed straight
+    into Transactions, without making a dictionary per row
+
+    the ledger lock is only held while the ledger, its change log and its
+    archive are opened, so that loads of other ledgers are not held up
+    while this one is parsed
+    """
+    if ledger_backend(ledger_file) or CACHE_LEDGERS:
+        return [row_to_transaction(row) for row in get_trans(ledger_file)]
+    with contextlib.ExitStack() as stack:
+        with LEDGER_LOCK:
+            # the open files still hold the versions a compaction or an
+            # archive may replace once the lock is released
+            lf = stack.enter_context(open(ledger_file))
+            amendments = read_amendments(ledger_file)
+            index, af = open_archive(ledger_file)
+            if af is not None:
+                stack.enter_context(af)
+        reader = csv.reader(lf, skipinitialspace=True)
+        names = next(reader, None) or COL_NAMES
+        columns = [names.index(name) for name in COL_NAMES]
+        transactions = []
+        if af is not None:
+            transactions.extend(
+                map(row_to_transaction, archive_blocks(index, af))
+            )
+        for row in reader:
+            if not row:
+                continue
+            values = [row[column] for column in columns]
+            amended = amendments.get(values[0])
+            if amended:
+                values = [amended[name] for name in COL_NAMES]
+            transactions.append(
+                Transaction(
+                    int(values[0]),
+                    timestamp_to_epoch(values[1]),
+                    sys.intern(values[2]),
+                    values[3],
+                    amount_to_cents(values[4]),
+                )
+            )
+        return transactions
+
+
+def row_to_transaction(row):
+    """
+    dict -> Transaction
+
+    row is a dictionary of "column_name": data, as get_trans returns
+
+    return row as a Transaction
+    """
+    return Transaction(
+        int(row[ID_COL]),
+        timestamp_to_epoch(row[TIMESTAMP_COL]),
+        sys.intern(row[CATEGORY_COL]),
+        row[DESCRIPTION_COL],
+        amount_to_cents(row[AMOUNT_COL]),
+    )
+
+
+def transaction_to_row(transaction):
+    """
+    Transaction -> dict
+
+    transaction is a Transaction
+
+    return transaction as a dictionary of "column_name": data, as get_trans
+    returns
+    """
+    return {
+        ID_COL: str(transaction.id),
+        TIMESTAMP_COL: epoch_to_timestamp(transaction.epoch),
+        CATEGORY_COL: transaction.category,
+        DESCRIPTION_COL: transaction.description,
+        AMOUNT_COL: cents_to_amount(transaction.cents),
+    }
+
+
+def ledger_rows(ledg_list):
+    """
+    list of dict or Transaction -> iterable of dict
+
+    ledg_list is a list of dictionaries or of Transactions
+
+    return ledg_list if it holds dictionaries; otherwise, an iterator of
+    its Transactions as dictionaries, made one at a time
+    """
+    if ledg_list and isinstance(ledg_list[0], Transaction):
+        return map(transaction_to_row, ledg_list)
+    return ledg_list
 
 
 def print_ledger_stats(ledg_list):
     """
-    dict -> None
+    list of dict or Transaction -> None
 
-    ledg_list is a list of dictionaries representing transactions
+    ledg_list is a list of dictionaries or Transactions
 
     print statistics for the ledg_list
     """
     deb_list = []
     cred_list = []
     for transaction in ledg_list:
-        amount = transaction[AMOUNT_COL]
+        if isinstance(transaction, Transaction):
+            amount = cents_to_amount(transaction.cents)
+        else:
+            amount = transaction[AMOUNT_COL]
         if amount.startswith("-"):
             deb_list.append(float(amount.replace("-", "")))
         else:
@@ -72,62 +519,403 @@ def print_ledger_stats(ledg_list):
 
     if cred_list:
         average_cred = sum(cred_list) / len(cred_list)
-        print(
-            f'\n{"Max Credit":<15}|{"Min Credit":<15}|{"Avg Credit":<15}\n'
-            f"{'-'*15}|{'-'*15}|{'-'*15}\n"
-            f"${max(cred_list):<14,.2f}|${min(cred_list):<14,.2f}|"
-            f"${average_cred:<14,.2f}"
+        print_amount_stats(
+            "Credit", max(cred_list), min(cred_list), average_cred
         )
     if deb_list:
         average_dep = sum(deb_list) / len(deb_list)
-        print(
-            f'\n{"Max Debit":<15}|{"Min Debit":<15}|{"Avg Debit":<15}\n'
-            f"{'-'*15}|{'-'*15}|{'-'*15}\n"
-            f"${max(deb_list):<14,.2f}|${min(deb_list):<14,.2f}|"
-            f"${average_dep:<14,.2f}"
-        )
+        print_amount_stats("Debit", max(deb_list), min(deb_list), average_dep)
 
 
-def print_transaction(transaction):
+def print_amount_stats(kind, maximum, minimum, average):
     """
-    dict -> None
+    str, float, float, float -> None
 
-    transaction is a dict of the transaction
+    kind is the kind of transaction (e.g., "Credit" or "Debit")
+    maximum, minimum and average are statistics of the amounts
 
-    print the transaction
+    print a table of the statistics
     """
-    transaction_id = transaction[ID_COL]
-    timestamp = transaction[TIMESTAMP_COL]
-    category = transaction[CATEGORY_COL]
-    description = transaction[DESCRIPTION_COL]
-    amount = transaction[AMOUNT_COL]
-
     print(
+        f'\n{"Max " + kind:<15}|{"Min " + kind:<15}|{"Avg " + kind:<15}\n'
+        f"{'-'*15}|{'-'*15}|{'-'*15}\n"
+        f"${maximum:<14,.2f}|${minimum:<14,.2f}|"
+        f"${average:<14,.2f}"
+    )
+
+
+def format_transaction(transaction):
+    """
+    dict or Transaction -> str
+
+    transaction is a dict or Transaction of the transaction
+
+    return the lines print_transaction prints for the transaction
+    """
+    if isinstance(transaction, Transaction):
+        transaction_id, epoch, category, description, cents = transaction
+        timestamp = epoch_to_timestamp(epoch)
+        amount = cents / 100
+    else:
+        transaction_id = transaction[ID_COL]
+        timestamp = transaction[TIMESTAMP_COL]
+        category = transaction[CATEGORY_COL]
+        description = transaction[DESCRIPTION_COL]
+        amount = float(transaction[AMOUNT_COL])
+    return format_row(transaction_id, timestamp, category, description, amount)
+
+
+def format_row(transaction_id, timestamp, category, description, amount):
+    """
+    int or str, str, str, str, float -> str
+
+    transaction_id, timestamp, category, description and amount are the
+    fields of a transaction
+
+    return the lines format_transaction returns for the transaction
+    """
+    return (
         f"{'-'*4}|{'-'*20}|{'-'*20}|{'-'*50}|{'-'*15}\n"  # 14 + '$' for amount
         f"{transaction_id:<4}|{timestamp:<20}|{category[:20]:<20}|"
-        f"{description[:50]:<50}|${float(amount):<14,.2f}"
+        f"{description[:50]:<50}|${amount:<14,.2f}"
     )
 
 
+def print_transaction(transaction):
+    """
+    dict or Transaction -> None
+
+    transaction is a dict or Transaction of the transaction
+
+    print the transaction
+    """
+    print(format_transaction(transaction))
+
+
 def print_ledger(ledg_list):
     """
-    list of dict -> None
+    list of dict or Transaction -> None
 
-    ledg_list is a list of dictionaries representing transactions
+    ledg_list is a list of dictionaries or Transactions
+
+    print all transactions from ledg_list to console, RENDER_BATCH_ROWS
+    rows per write
+    """
+    print_ledger_header()
+    if ledg_list:
+        write_lines(format_transaction(t) for t in ledg_list)
+    else:
+        print("None.")
 
-    print all transactions from ledg_list to console
+
+def print_ledger_header():
+    """
+    None -> None
+
+    print the column names print_ledger prints above the transactions
     """
-    # print header
     print(
         f"\n{ID_COL:<4}|{TIMESTAMP_COL:<20}|{CATEGORY_COL:<20}|"
         f"{DESCRIPTION_COL:<50}|{AMOUNT_COL:<15}"
     )
 
-    if ledg_list:
-        for transaction in ledg_list:
-            print_transaction(transaction)
+
+def write_lines(lines, batch_rows=None):
+    """
+    iterable of str, int -> None
+
+    lines are the lines to write, without trailing newlines
+    batch_rows is the number of lines per write (RENDER_BATCH_ROWS if None)
+
+    write lines to standard output like print would, joining them into one
+    buffer per batch to avoid a write per line
+    """
+    out = sys.stdout
+    lines = iter(lines)
+    while True:
+        batch = list(itertools.islice(lines, batch_rows or RENDER_BATCH_ROWS))
+        if not batch:
+            break
+        batch.append("")
+        out.write("\n".join(batch))
+    out.flush()
+
+
+def page_ledger(ledger_file, page_rows=None):
+    """
+    str, int -> None
+
+    ledger_file is the name of the ledger file
+    page_rows is the number of transactions per page (PAGE_ROWS if None)
+
+    let the user page through the ledger, next/previous or jumping to an
+    ID; only the transactions on the visible page are read and formatted,
+    and the statistics of the ledger are only computed, in one pass over
+    its rows, if the user asks for them
+    """
+    page_rows = page_rows or PAGE_ROWS
+    last_id = last_row_id(ledger_file)
+    first_id = 1
+    while True:
+        page = read_page(ledger_file, first_id, page_rows)
+        print_ledger(page)
+        if page:
+            print(
+                f"\nTransactions {page[0][ID_COL]}-{page[-1][ID_COL]} "
+                f"of {last_id}"
+            )
+        command = input(
+            "\n(n)ext page, (p)revious page, (j)ump to ID, (s)tatistics or "
+            "(q)uit? "
+        ).lower()
+        if command.startswith("n"):
+            first_id = min(first_id + page_rows, max(last_id, 1))
+        elif command.startswith("p"):
+            first_id = max(first_id - page_rows, 1)
+        elif command.startswith("j"):
+            row_id = input("Jump to ID: ")
+            if row_id.isdigit():
+                first_id = max(int(row_id), 1)
+            else:
+                print("\nInvalid transaction ID.")
+        elif command.startswith("s"):
+            print_stats(ledger_file)
+            input("\nPress Enter to go back to the ledger. ")
+        elif command.startswith("q"):
+            break
+
+
+def sidecar_filename(ledger_file, suffix):
+    """
+    str, str -> str
+
+    ledger_file is the name of the ledger file
+    suffix is the suffix of the sidecar (e.g., BALANCE_SUFFIX)
+
+    return the name of the sidecar file kept next to ledger_file
+    """
+    return ledger_file + suffix
+
+
+def read_sidecar(ledger_file, suffix):
+    """
+    str, str -> dict or None
+
+    ledger_file is the name of the ledger file
+    suffix is the suffix of the sidecar
+
+    return the JSON contents of the sidecar or None if missing or corrupt
+    """
+    try:
+        with open(sidecar_filename(ledger_file, suffix)) as sf:
+            return json.load(sf)
+    except (OSError, ValueError):
+        return None
+
+
+def write_sidecar(ledger_file, suffix, data):
+    """
+    str, str, dict -> None
+
+    ledger_file is the name of the ledger file
+    suffix is the suffix of the sidecar
+    data is the JSON-serializable contents of the sidecar
+
+    atomically replace the sidecar so readers never see a partial file
+    """
+    replace_file(sidecar_filename(ledger_file, suffix), json.dumps(data))
+
+
+@contextlib.contextmanager
+def atomic_write(filename, mode="w"):
+    """
+    str, str -> context manager of file
+
+    filename is the name of the file to replace
+    mode is the mode to open the temp file with ("w" or "wb")
+
+    yield a unique temp file next to filename; on success it is flushed to
+    disk and renamed over filename, on error it is removed
+    """
+    fd, temp_filename = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(filename)),
+        prefix=os.path.basename(filename) + ".",
+        suffix=".tmp",
+    )
+    try:
+        with open(fd, mode) as tf:
+            yield tf
+            tf.flush()
+            os.fsync(tf.fileno())
+        os.replace(temp_filename, filename)
+    except BaseException:
+        os.remove(temp_filename)
+        raise
+
+
+def replace_file(filename, contents):
+    """
+    str, str or bytes -> None
+
+    filename is the name of the file to replace
+    contents is the new contents of the file
+
+    atomically replace filename with contents
+    """
+    mode = "wb" if isinstance(contents, bytes) else "w"
+    with atomic_write(filename, mode) as tf:
+        tf.write(contents)
+
+
+def ledger_digest(lf, offset, start=0, digest=0):
+    """
+    file, int, int, int -> int
+
+    lf is the ledger file opened in binary mode
+    offset is the byte offset covered by a checkpoint
+    start is the byte offset that digest already covers
+    digest is the CRC-32 of the bytes of lf before start
+
+    return the CRC-32 of the bytes of lf before offset, reading only the
+    bytes from start on
+    """
+    lf.seek(start)
+    while start < offset:
+        block = lf.read(min(DIGEST_BLOCK_SIZE, offset - start))
+        if not block:
+            break
+        digest = zlib.crc32(block, digest)
+        start += len(block)
+    return digest
+
+
+def ledger_state(lf, offset, base=None):
+    """
+    file, int, dict or None -> dict
+
+    lf is the ledger file opened in binary mode
+    offset is the byte offset covered by a checkpoint
+    base is a state of lf that verified_offset accepted, covering at most
+    offset bytes, or None
+
+    return the size, mtime, ctime and digest that identify the ledger up
+    to offset; with a base, only the bytes past its offset are read
+    """
+    stat = os.fstat(lf.fileno())
+    if base:
+        digest = ledger_digest(lf, offset, base["offset"], base["digest"])
     else:
-        print("None.")
+        digest = ledger_digest(lf, offset)
+    return {
+        "offset": offset,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "ctime_ns": stat.st_ctime_ns,
+        "digest": digest,
+    }
+
+
+def state_matches(state, stat):
+    """
+    dict, os.stat_result -> bool
+
+    state is a dict returned by ledger_state
+    stat is the current stat of the same file
+
+    return True if the file has not been touched since state was taken
+    """
+    return (
+        state["size"],
+        state["mtime_ns"],
+        state.get("ctime_ns"),
+    ) == (stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns)
+
+
+def verified_offset(lf, state):
+    """
+    file, dict -> int or None
+
+    lf is the ledger file opened in binary mode
+    state is a dict returned by ledger_state, or None
+
+    return the offset covered by state if the ledger has at most been
+    appended to since state was taken; otherwise, None
+
+    an untouched file is trusted as is; a touched one only if it grew and
+    the checksum of every byte before the offset still matches, since an
+    edit in place can hide behind an append
+    """
+    if not state:
+        return None
+    stat = os.fstat(lf.fileno())
+    if stat.st_size < state["offset"]:
+        return None
+    if state_matches(state, stat):
+        return state["offset"]
+    if stat.st_size == state["size"]:
+        # same size but touched: rewritten in place, not appended to
+        return None
+    if ledger_digest(lf, state["offset"]) != state["digest"]:
+        return None
+    return state["offset"]
+
+
+def scan_rows(lf, offset):
+    """
+    file, int -> iterator of list
+
+    lf is the ledger file opened in binary mode
+    offset is the byte offset of the first row to scan
+
+    yield the non-blank csv rows from offset to the end of the file
+    """
+    lf.seek(offset)
+    text = io.TextIOWrapper(lf, encoding="utf-8", newline="")
+    try:
+        for row in csv.reader(text):
+            if row:
+                yield row
+    finally:
+        text.detach()
+
+
+def amount_to_cents(amount):
+    """
+    str -> int
+
+    amount is the amount of a transaction (e.g., "-10.00")
+
+    return amount as a whole number of cents
+    """
+    return round(float(amount) * 100)
+
+
+def cents_to_amount(cents):
+    """
+    int -> str
+
+    cents is an amount in cents
+
+    return cents as the amount stored in the ledger (e.g., "-12.50")
+    """
+    return f"{cents / 100:.2f}"
+
+
+def header_index(lf, column):
+    """
+    file, str -> int, int
+
+    lf is the ledger file opened in binary mode
+    column is the name of a column in the header
+
+    return index of column in the header (or None if it is missing) and
+    byte offset after the header
+    """
+    lf.seek(0)
+    header = lf.readline()
+    names = next(csv.reader([header.decode("utf-8")]), [])
+    index = names.index(column) if column in names else None
+    return index, len(header)
 
 
 def view_balance(ledger_file):
@@ -136,12 +924,179 @@ def view_balance(ledger_file):
 
     ledger_file is the name of the ledger file
 
-    return balance calculated from ledger file
+    return balance calculated from ledger file and the footers of its
+    archive
+    """
+    backend = ledger_backend(ledger_file)
+    if backend:
+        return backend["view_balance"](ledger_file)
+    with LEDGER_LOCK:
+        amendments = read_amendments(ledger_file)
+        if CACHE_LEDGERS:
+            entry = cached_ledger(ledger_file)
+            cents = entry["cents"] + archived_cents(ledger_file)
+            for row_id, amended in amendments.items():
+                if row_id not in entry["positions"]:
+                    continue
+                original = entry["rows"][entry["positions"][row_id]]
+                cents += amount_to_cents(
+                    amended[AMOUNT_COL]
+                ) - amount_to_cents(original[AMOUNT_COL])
+            return cents / 100
+
+        cents = ledger_balance_cents(ledger_file) + archived_cents(ledger_file)
+        if amendments:
+            with open(ledger_file, "rb") as lf:
+                for row_id, amended in amendments.items():
+                    original = find_row(lf, row_id) or logged_original(
+                        ledger_file, row_id
+                    )
+                    if original is None:
+                        continue
+                    cents += amount_to_cents(
+                        amended[AMOUNT_COL]
+                    ) - amount_to_cents(original[AMOUNT_COL])
+        return cents / 100
+
+
+def ledger_balance_cents(ledger_file):
+    """
+    str -> int
+
+    ledger_file is the name of the ledger file
+
+    return balance of the rows in ledger file, ignoring the change log
+
+    only rows appended after the balance checkpoint are parsed; the
+    checkpoint is rebuilt from scratch if the ledger was edited in place
+    """
+    with open(ledger_file, "rb") as lf:
+        amount_index, header_end = header_index(lf, AMOUNT_COL)
+        if amount_index is None:
+            # only a ledger without rows can lack an amount column
+            if next(scan_rows(lf, header_end), None) is not None:
+                raise KeyError(AMOUNT_COL)
+            return 0
+
+        checkpoint = read_sidecar(ledger_file, BALANCE_SUFFIX)
+        base = checkpoint and checkpoint["state"]
+        offset = verified_offset(lf, base)
+        stale = offset is None
+        if stale:
+            base, offset, rows, cents = None, header_end, 0, 0
+        else:
+            rows, cents = checkpoint["rows"], checkpoint["cents"]
+
+        end = os.fstat(lf.fileno()).st_size
+        if stale or offset != end:
+            subtotals = parallel_chunks(
+                ledger_file, offset, end, parse_chunk_cents, amount_index
+            )
+            if subtotals is None:
+                for row in scan_rows(lf, offset):
+                    cents += amount_to_cents(row[amount_index])
+                    rows += 1
+            else:
+                for chunk_rows, chunk_cents in subtotals:
+                    rows += chunk_rows
+                    cents += chunk_cents
+            checkpoint = {
+                "rows": rows,
+                "cents": cents,
+                "state": ledger_state(lf, end, base),
+            }
+            try:
+                write_sidecar(ledger_file, BALANCE_SUFFIX, checkpoint)
+            except OSError:
+                # a read-only directory only costs the next read a rescan
+                pass
+        return cents
+
+
+def update_balance_checkpoint(ledger_file, before, row_delta, cents_delta):
+    """
+    str, os.stat_result, int, int -> None
+
+    ledger_file is the name of the ledger file
+    before is the stat of ledger_file taken before it was written
+    row_delta is the number of rows added by the write
+    cents_delta is the change in balance, in cents, made by the write
+
+    apply a write to the balance checkpoint if the checkpoint was up to date
+    before the write; otherwise, leave it for view_balance to catch up
+    """
+    checkpoint = read_sidecar(ledger_file, BALANCE_SUFFIX)
+    if not checkpoint:
+        return
+    state = checkpoint["state"]
+    if state["offset"] != before.st_size or not state_matches(state, before):
+        return
+    with open(ledger_file, "rb") as lf:
+        end = os.fstat(lf.fileno()).st_size
+        # only an append leaves the bytes under the old digest as they were
+        base = state if row_delta else None
+        checkpoint = {
+            "rows": checkpoint["rows"] + row_delta,
+            "cents": checkpoint["cents"] + cents_delta,
+            "state": ledger_state(lf, end, base),
+        }
+    write_sidecar(ledger_file, BALANCE_SUFFIX, checkpoint)
+
+
+@contextlib.contextmanager
+def ledger_lock(ledger_file):
+    """
+    str -> context manager
+
+    ledger_file is the name of the ledger file
+
+    hold LEDGER_LOCK and an exclusive advisory lock on the ledger's lock
+    file, so that ID allocation, appends and rewrites of the ledger by
+    other threads and processes wait; holding it again in the same thread
+    does not block
+    """
+    with LEDGER_LOCK:
+        if fcntl is None:
+            yield
+            return
+        lock_file = os.path.abspath(sidecar_filename(ledger_file, LOCK_SUFFIX))
+        held = LOCKED_LEDGERS.get(lock_file)
+        if held is None:
+            fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except OSError:
+                os.close(fd)
+                raise
+            held = LOCKED_LEDGERS[lock_file] = [fd, 0]
+        held[1] += 1
+        try:
+            yield
+        finally:
+            held[1] -= 1
+            if not held[1]:
+                # closing the descriptor releases the lock
+                del LOCKED_LEDGERS[lock_file]
+                os.close(held[0])
+
+
+def allocate_ids(ledger_file, records):
+    """
+    str, list of dict -> None
+
+    ledger_file is the name of the ledger file
+    records are records about to be appended, in ID order
+
+    renumber records, keeping their order and spacing, if rows have been
+    appended with their IDs since they were created; call with the ledger
+    lock held so that the IDs stay free until records are appended
     """
-    with open(ledger_file) as lf:
-        reader = csv.DictReader(lf)
-        amounts = [float(row[AMOUNT_COL]) for row in reader]
-        return sum(amounts)
+    if not records or not file_exists(ledger_file):
+        return
+    shift = next_row_id(ledger_file) - int(records[0][ID_COL])
+    if shift > 0:
+        for record in records:
+            record[ID_COL] = int(record[ID_COL]) + shift
 
 
 def write_record(ledger_file, record):
@@ -151,11 +1106,25 @@ def write_record(ledger_file, record):
     ledger_file is the name of the ledger file
     record is a dictionary of "column_name": data
 
-    write record to end of ledger file
+    write record to end of ledger file, giving it the next free ID if
+    its ID has been taken since it was created
     """
-    with open(ledger_file, "a") as lf:
-        writer = csv.DictWriter(lf, COL_NAMES)
-        writer.writerow(record)
+    with ledger_lock(ledger_file):
+        allocate_ids(ledger_file, [record])
+        backend = ledger_backend(ledger_file)
+        if backend:
+            return backend["write_record"](ledger_file, record)
+        before = os.stat(ledger_file) if file_exists(ledger_file) else None
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, COL_NAMES).writerow(record)
+        with open(ledger_file, "a") as lf:
+            lf.write(buffer.getvalue())
+        if before is not None:
+            cache_appended(ledger_file, before, buffer.getvalue(), [record])
+            update_balance_checkpoint(
+                ledger_file, before, 1, amount_to_cents(record[AMOUNT_COL])
+            )
+            maintain_indexes(ledger_file)
 
 
 def create_deposit_record(date, time, category, description, amount):
@@ -170,7 +1139,7 @@ def create_deposit_record(date, time, category, description, amount):
 
     return dictionary of deposit record
     """
-    row_id = last_row_id(LEDGER_FILENAME) + 1
+    row_id = next_row_id(LEDGER_FILENAME)
     return {
         ID_COL: row_id,
         TIMESTAMP_COL: date + " " + time,
@@ -193,7 +1162,7 @@ def create_withdraw_record(date, time, category, description, amount):
 
     return dictionary of withdraw record
     """
-    row_id = last_row_id(LEDGER_FILENAME) + 1
+    row_id = next_row_id(LEDGER_FILENAME)
     return {
         ID_COL: row_id,
         TIMESTAMP_COL: date + " " + time,
@@ -217,473 +1186,7002 @@ def modify_transaction(
     description is a description of the transaction
     amount is the amount of the transaction
 
-    overwrites the row at row_id in ledger_file
+    records a new version of the row at row_id in the ledger's change log;
+    the log is folded back into ledger_file once it grows large enough;
+    raise ValueError if the row is archived
     """
-    temp_filename = "modified_ledger.csv"
-
-    rows = []
-    with open(ledger_file) as lf:
-        reader = csv.DictReader(lf, COL_NAMES)
-        rows += [row for row in reader]
+    with ledger_lock(ledger_file):
+        backend = ledger_backend(ledger_file)
+        if backend:
+            return backend["modify_transaction"](
+                ledger_file, row_id, date, time, category, description, amount
+            )
+        if row_id <= archived_last_id(ledger_file):
+            raise ValueError(f"transaction {row_id} is archived")
+        current = current_row(ledger_file, row_id)
+        if current is None:
+            return
+
+        modified_row = {
+            ID_COL: str(row_id),
+            TIMESTAMP_COL: date + " " + time,
+            CATEGORY_COL: category,
+            DESCRIPTION_COL: description,
+        }
+        if current[AMOUNT_COL][0] == "-":
+            modified_row[AMOUNT_COL] = f"{-1 * amount:.2f}"
+        else:
+            modified_row[AMOUNT_COL] = f"{amount:.2f}"
 
-    modified_rows = []
-    for row in rows:
-        modified_row = copy.deepcopy(row)
-        if modified_row[ID_COL] == str(row_id):
-            modified_row[TIMESTAMP_COL] = date + " " + time
-            modified_row[CATEGORY_COL] = category
-            modified_row[DESCRIPTION_COL] = description
-            if modified_row[AMOUNT_COL][0] == "-":
-                modified_row[AMOUNT_COL] = f"{-1 * amount:.2f}"
-            else:
-                modified_row[AMOUNT_COL] = f"{amount:.2f}"
-        modified_rows.append(modified_row)
+        append_amendment(ledger_file, modified_row, current)
+        maintain_indexes(ledger_file)
+        maybe_compact(ledger_file)
 
-    with open(temp_filename, "w") as mlf:
-        writer = csv.DictWriter(mlf, COL_NAMES)
-        writer.writerows(modified_rows)
 
-    os.remove(ledger_file)
-    os.rename(temp_filename, ledger_file)
+def parallel_workers(num_bytes):
+    """
+    int -> int
 
+    num_bytes is the number of bytes of the ledger to parse
 
-def last_row_id(ledger_file):
+    return the number of processes to parse them with, or 0 to parse them
+    in this process
     """
-    str -> int
+    workers = PARALLEL_WORKERS or os.cpu_count() or 1
+    if workers < 2 or num_bytes < max(PARALLEL_MIN_BYTES, 1):
+        return 0
+    return workers
 
-    ledger_file is the name of the ledger file
 
-    return id of the last row in ledger file or 0 if no last row
+def process_pool(workers):
     """
-    with open(ledger_file) as lf:
-        reader = csv.DictReader(lf, COL_NAMES)
-        rows = [row for row in reader]
-        return int(rows[-1][ID_COL]) if len(rows) > 1 else 0
+    int -> ProcessPoolExecutor
 
+    workers is the number of worker processes
 
-def is_valid_amount(amount):
+    return a process pool whose workers are started with
+    PROCESS_START_METHOD, so that none inherits a lock held by a thread of
+    this process
     """
-    str -> bool
+    return concurrent.futures.ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context(PROCESS_START_METHOD)
+    )
 
-    amount is inputted value from user for debit/credit
 
-    return True if amount is valid; otherwise, False
+def count_quotes(ledger_file, start, end):
     """
-    amount_tokens = amount.split(".")
-    if len(amount_tokens) == 1:
-        return amount_tokens[0].isdigit()
-    elif len(amount_tokens) == 2:
-        if amount_tokens[0].isdigit():
-            if amount_tokens[1].isdigit and len(amount_tokens[1]) == 2:
-                return True
+    str, int, int -> int
 
-    return False
+    ledger_file is the name of the ledger file
+    start and end are the byte offsets of the part of the file to count
+
+    return the number of double quotes in ledger_file from start to end
+    """
+    with open(ledger_file, "rb") as lf:
+        lf.seek(start)
+        return lf.read(end - start).count(b'"')
 
 
-def get_valid_amount(prompt):
+def chunk_boundary(lf, offset, quotes, end):
     """
-    str -> float
+    file, int, int, int -> int
 
-    prompt is prompt to present to user
+    lf is the ledger file opened in binary mode
+    offset is a byte offset in the file
+    quotes is the number of double quotes before offset
+    end is the byte offset to stop at
 
-    return the amount user inputs cast to a float
+    return the offset just after the first newline at or after offset that
+    ends a row, i.e. that is preceded by an even number of double quotes
     """
-    input_amount = input(prompt)
-    if is_valid_amount(input_amount):
-        return float(input_amount)
-    else:
-        print("\nPlease enter a valid dollar value (e.g., $50.50)\n")
-        return get_valid_amount(prompt)
+    lf.seek(offset)
+    while offset < end:
+        line = lf.readline(end - offset)
+        offset += len(line)
+        quotes += line.count(b'"')
+        if line.endswith(b"\n") and quotes % 2 == 0:
+            break
+    return offset
 
 
-def print_by_date(some_date, ledg_list):
+def parallel_chunks(ledger_file, start, end, parse_chunk, *args):
     """
-    str-> str
+    str, int, int, function, ... -> list
 
-    some_date is string inputted date
-    ledg_list is a list of dictionaries representing transactions
+    ledger_file is the name of the ledger file
+    start is the byte offset of the first row to parse
+    end is the byte offset just after the last row to parse
+    parse_chunk is called in a worker process with ledger_file, the byte
+    offsets of a chunk of whole rows and args, and returns a partial result
+    args are passed on to parse_chunk
+
+    return the partial results of the chunks in file order, or None if the
+    range is too small to be worth parsing in parallel
+
+    chunks end at newlines preceded by an even number of double quotes, so
+    a quoted field containing newlines is never split as long as quotes
+    only delimit fields, as csv.writer writes them
+    """
+    workers = parallel_workers(end - start)
+    if not workers:
+        return None
+
+    num_chunks = max(2, -(-(end - start) // max(PARALLEL_CHUNK_BYTES, 1)))
+    targets = [
+        start + (end - start) * i // num_chunks for i in range(num_chunks + 1)
+    ]
+    with process_pool(workers) as pool:
+        counts = list(
+            pool.map(
+                count_quotes,
+                itertools.repeat(ledger_file),
+                targets[:-1],
+                targets[1:],
+            )
+        )
+        boundaries = [start]
+        with open(ledger_file, "rb") as lf:
+            for target, quotes in zip(
+                targets[1:-1], itertools.accumulate(counts)
+            ):
+                if target >= boundaries[-1]:
+                    boundaries.append(chunk_boundary(lf, target, quotes, end))
+        if boundaries[-1] < end:
+            boundaries.append(end)
+        return list(
+            pool.map(
+                parse_chunk,
+                itertools.repeat(ledger_file),
+                boundaries[:-1],
+                boundaries[1:],
+                *(itertools.repeat(arg) for arg in args),
+            )
+        )
 
-    returns string transactions from dictionary where date matches parameters
-    presented
+
+def parse_chunk_rows(ledger_file, start, end, skipinitialspace=True):
     """
-    val_list = []
-    for transaction in ledg_list:
-        if transaction[TIMESTAMP_COL].startswith(some_date):
-            for key in transaction:
-                if key == AMOUNT_COL:
-                    val_list.append(float(transaction[key]))
-                    print("{}: ${:,.2f}".format(key, float(transaction[key])))
-                else:
-                    print("{}: {}".format(key, transaction[key]))
-            print("--------------------")
-    if len(val_list) > 0:
-        average = sum(val_list) / len(val_list)
-        print(
-            "Maximum transaction in {}: ${:,.2f}".format(
-                some_date, max(val_list)
-            )
-        )
-        print(
-            "Minimum transaction in {}: ${:,.2f}".format(
-                some_date, min(val_list)
-            )
-        )
-        print("Average transaction in {}: ${:,.2f}".format(some_date, average))
-        print("------------------")
-    else:
-        print("\nNo results.")
+    str, int, int, bool -> list of list
 
+    ledger_file is the name of the ledger file
+    start and end are the byte offsets of a chunk of whole rows
+    skipinitialspace is passed on to the csv reader
 
-def print_by_cat(some_cat, ledg_list):
+    return the non-blank rows of the chunk, read as get_trans reads them
     """
-    str-> str
+    with open(ledger_file, "rb") as lf:
+        lf.seek(start)
+        text = io.TextIOWrapper(io.BytesIO(lf.read(end - start)))
+    return [
+        row
+        for row in csv.reader(text, skipinitialspace=skipinitialspace)
+        if row
+    ]
 
-    some_cat is string inputted category
-    ledg_list is a list of dictionaries representing transactions
 
-    returns string transactions from dictionary where category matches
-    parameters presented
+def parse_chunk_cents(ledger_file, start, end, amount_index):
     """
-    val_list = []
-    for transaction in ledg_list:
-        if transaction[CATEGORY_COL] == some_cat:
-            for key in transaction:
-                if key == AMOUNT_COL:
-                    val_list.append(float(transaction[key]))
-                    print("{}: ${:,.2f}".format(key, float(transaction[key])))
-                else:
-                    print("{}: {}".format(key, transaction[key]))
-            print("--------------------")
-    if len(val_list) > 0:
-        average = sum(val_list) / len(val_list)
-        print(
-            "Maximum transaction in {}: ${:,.2f}".format(
-                some_cat, max(val_list)
-            )
-        )
-        print(
-            "Minimum transaction in {}: ${:,.2f}".format(
-                some_cat, min(val_list)
-            )
-        )
-        print("Average transaction in {}: ${:,.2f}".format(some_cat, average))
-        print("------------------")
-    else:
-        print("\nNo results.")
+    str, int, int, int -> int, int
 
+    ledger_file is the name of the ledger file
+    start and end are the byte offsets of a chunk of whole rows
+    amount_index is the position of the amount column
 
-def print_by_desc(some_desc, ledg_list):
+    return the number of rows in the chunk and their total in cents, read
+    as ledger_balance_cents reads them
     """
-    str-> str
+    with open(ledger_file, "rb") as lf:
+        lf.seek(start)
+        chunk = io.BytesIO(lf.read(end - start))
+    rows = cents = 0
+    for row in scan_rows(chunk, 0):
+        cents += amount_to_cents(row[amount_index])
+        rows += 1
+    return rows, cents
 
-    some_cat is string inputted category
-    ledg_list is a list of dictionaries representing transactions
 
-    returns string transactions from dictionary where category matches
-    parameters presented
+def parallel_get_trans(ledger_file):
     """
-    val_list = []
-    for transaction in ledg_list:
-        if some_desc in transaction[DESCRIPTION_COL]:
-            for key in transaction:
-                if key == AMOUNT_COL:
-                    val_list.append(float(transaction[key]))
-                    print("{}: ${:,.2f}".format(key, float(transaction[key])))
-                else:
-                    print("{}: {}".format(key, transaction[key]))
+    str -> list of dict
 
-            print("--------------------\n")
+    ledger_file is the name of the ledger file
 
-    if len(val_list) > 0:
-        average = sum(val_list) / len(val_list)
-        print(
-            "Maximum transaction in {}: ${:,.2f}".format(
-                some_desc, max(val_list)
-            )
-        )
-        print(
-            "Minimum transaction in {}: ${:,.2f}".format(
-                some_desc, min(val_list)
+    return the rows of ledger_file as csv.DictReader reads them, parsed in
+    parallel, or None if the ledger is too small to be worth it
+    """
+    end = os.path.getsize(ledger_file)
+    if not parallel_workers(end):
+        return None
+    with open(ledger_file, "rb") as lf:
+        header = lf.readline()
+    if header.count(b'"') % 2:
+        # the header spans lines; leave it to the serial path
+        return None
+    header_text = io.TextIOWrapper(io.BytesIO(header))
+    names = next(csv.reader(header_text, skipinitialspace=True), [])
+    chunks = parallel_chunks(ledger_file, len(header), end, parse_chunk_rows)
+    if chunks is None:
+        return None
+
+    return row_dicts(names, itertools.chain.from_iterable(chunks))
+
+
+def row_dicts(names, rows):
+    """
+    list of str, iterable of list -> list of dict
+
+    names are the column names from the header
+    rows are the non-blank rows read with csv.reader
+
+    return the rows as csv.DictReader would read them, including short and
+    long rows
+    """
+    transact_list = []
+    for row in rows:
+        transaction = dict(zip(names, row))
+        if len(row) > len(names):
+            transaction[None] = row[len(names) :]
+        for name in names[len(row) :]:
+            transaction[name] = None
+        transact_list.append(transaction)
+    return transact_list
+
+
+def complete_rows_end(lf, start, end):
+    """
+    file, int, int -> int
+
+    lf is the file opened in binary mode
+    start is the byte offset of the start of a row
+    end is the size of the file
+
+    return the byte offset just after the last complete row between start
+    and end, leaving out a row still being appended
+    """
+    lf.seek(start)
+    quotes, found = 0, start
+    while start < end:
+        block = lf.read(min(max(PARALLEL_CHUNK_BYTES, 1), end - start))
+        newline = block.rfind(b"\n")
+        # the last newline preceded by an even number of quotes ends a row
+        while newline >= 0 and (quotes + block.count(b'"', 0, newline)) % 2:
+            newline = block.rfind(b"\n", 0, newline)
+        if newline >= 0:
+            found = start + newline + 1
+        quotes += block.count(b'"')
+        start += len(block)
+    return found
+
+
+def cached_csv(filename, skipinitialspace=False):
+    """
+    str, bool -> dict
+
+    filename is the name of a CSV file that is only appended to between
+    rewrites, i.e. a ledger or its change log
+    skipinitialspace is passed on to the csv reader
+
+    return the cache entry of filename, a dictionary of its "names" (the
+    header), its "rows" as csv.DictReader reads them and the "state" of
+    the file they cover; only rows appended since the entry was last used
+    are parsed, and the file is parsed again from the start if it was
+    replaced or changed in any other way
+    """
+    with open(filename, "rb") as lf:
+        stat = os.fstat(lf.fileno())
+        identity = [stat.st_dev, stat.st_ino]
+        entry = LEDGER_CACHE.get(filename)
+        offset = base = None
+        if entry and entry["identity"] == identity:
+            base = entry["state"]
+            offset = verified_offset(lf, base)
+        if offset is None:
+            entry = {"identity": identity, "names": None, "rows": []}
+            LEDGER_CACHE[filename] = entry
+            offset, base = 0, None
+        elif state_matches(base, stat):
+            return entry
+
+        end = complete_rows_end(lf, offset, stat.st_size)
+        if end > offset:
+            chunks = parallel_chunks(
+                filename, offset, end, parse_chunk_rows, skipinitialspace
             )
+            if chunks is None:
+                chunks = [
+                    parse_chunk_rows(filename, offset, end, skipinitialspace)
+                ]
+            rows = itertools.chain.from_iterable(chunks)
+            if entry["names"] is None:
+                entry["names"] = next(rows, [])
+            entry["rows"].extend(row_dicts(entry["names"], rows))
+        entry["state"] = ledger_state(lf, end, base)
+    return entry
+
+
+def cache_appended(filename, before, text, rows):
+    """
+    str, os.stat_result, str, list of dict -> None
+
+    filename is the name of a CSV file in the cache
+    before is the stat of filename taken before it was written
+    text is the text appended to filename
+    rows are the rows that text holds
+
+    add rows to the cache entry of filename without reading them back, if
+    the entry was up to date and nothing else was written; otherwise, drop
+    the entry so that it is read again
+    """
+    entry = LEDGER_CACHE.get(filename)
+    if entry is None:
+        return
+    state = entry["state"]
+    with open(filename, "rb") as lf:
+        after = os.fstat(lf.fileno())
+        if (
+            entry["names"] is None
+            or entry["identity"] != [before.st_dev, before.st_ino]
+            or state["offset"] != before.st_size
+            or not state_matches(state, before)
+            or after.st_size != before.st_size + len(text.encode())
+        ):
+            del LEDGER_CACHE[filename]
+            return
+        entry["rows"].extend(
+            {name: str(row[name]) for name in entry["names"]} for row in rows
         )
-        print("Average transaction in {}: ${:,.2f}".format(some_desc, average))
-        print("------------------")
-    else:
-        print("\nNo results.")
+        entry["state"] = ledger_state(lf, after.st_size, state)
 
 
-def file_exists(ledger_filename):
+def cached_ledger(ledger_file):
     """
-    str -> bool
+    str -> dict
 
-    ledger_filename is the name of the ledger file
+    ledger_file is the name of the ledger file
 
-    return True if ledger file exists; otherwise, False
+    return the cache entry of ledger_file, which also holds the "cents"
+    total of its rows and the "positions" of each ID among them
     """
-    return os.path.isfile(ledger_filename)
+    entry = cached_csv(ledger_file, skipinitialspace=True)
+    if "positions" not in entry:
+        entry.update(positions={}, cents=0, summarized=0)
+    rows, positions = entry["rows"], entry["positions"]
+    for position in range(entry["summarized"], len(rows)):
+        positions[rows[position][ID_COL]] = position
+        entry["cents"] += amount_to_cents(rows[position][AMOUNT_COL])
+    entry["summarized"] = len(rows)
+    return entry
+
+
+def cached_amendments(ledger_file):
+    """
+    str -> dict
 
+    ledger_file is the name of the ledger file
 
-def create_ledger_file(ledger_filename):
+    return dictionary of ID: latest amended row from the cached change log
     """
-    str -> None
+    log_file = sidecar_filename(ledger_file, LOG_SUFFIX)
+    if not file_exists(log_file):
+        LEDGER_CACHE.pop(log_file, None)
+        return {}
+    entry = cached_csv(log_file)
+    if "amendments" not in entry:
+        entry.update(amendments={}, applied=0)
+    for row in entry["rows"][entry["applied"] :]:
+        entry["amendments"][row[ID_COL]] = {
+            name: row[name] for name in COL_NAMES
+        }
+    entry["applied"] = len(entry["rows"])
+    return dict(entry["amendments"])
+
+
+def whole_row(line, names):
+    """
+    bytes, list of str -> list of str or None
 
-    ledger_filename is the name of the ledger file
+    line is a line of a ledger file
+    names is the ledger's header
 
-    create ledger file
-    CAUTION: will overwrite the ledger file if it exists
+    return the fields of line if it is a whole row: as many fields as the
+    header, with a numeric ID, a valid timestamp and amount, and no quote
+    left open; otherwise None, as for a line continuing a quoted field that
+    spans lines
     """
-    with open(ledger_filename, "w") as lf:
-        writer = csv.DictWriter(lf, COL_NAMES)
-        writer.writeheader()
+    if line.count(b'"') % 2:
+        return None
+    try:
+        fields = next(
+            csv.reader([line.decode("utf-8")], skipinitialspace=True), []
+        )
+        if len(fields) != len(names) or not fields[0].isdigit():
+            return None
+        timestamp_to_epoch(fields[names.index(TIMESTAMP_COL)])
+        float(fields[names.index(AMOUNT_COL)])
+    except ValueError:
+        return None
+    return fields
 
 
-def is_valid_action_choice(action_choice):
+def seek_row(lf, row_id):
     """
-    str -> bool
+    file, int -> list of str, int
 
-    action_choice is the user's inputted action choice
+    lf is the ledger file opened in binary mode
+    row_id is the ID of the row to look for
 
-    return True if user's action choice is valid; otherwise, False
+    return the ledger's header and the byte offset of the first row whose
+    ID is at least row_id (the end of the file if there is none)
+
+    ids grow with every append, so the row is found by binary search over
+    byte offsets
     """
-    return action_choice.isdigit() and action_choice in OPTIONS
+    lf.seek(0)
+    names = next(csv.reader([lf.readline().decode("utf-8")]), [])
+    lo, hi = lf.tell(), os.fstat(lf.fileno()).st_size
+    found = hi
+    while lo < hi:
+        mid = (lo + hi) // 2
+        lf.seek(mid - 1)
+        lf.readline()
+        # skip blank lines and the continuations of multi-line fields
+        while True:
+            pos = lf.tell()
+            if pos >= hi:
+                break
+            line = lf.readline()
+            fields = whole_row(line, names)
+            if fields:
+                break
+        if pos >= hi:
+            hi = mid
+        elif int(fields[0]) < row_id:
+            lo = pos + len(line)
+        else:
+            found = pos
+            hi = mid
+    return names, found
 
 
-def get_action_choice(prompt):
+def find_row(lf, row_id):
     """
-    str -> str
+    file, int or str -> dict or None
 
-    prompt is the prompt to present to the user
+    lf is the ledger file opened in binary mode
+    row_id is the ID of the row to find
 
-    return user's action choice
+    return the row with row_id as a dictionary keyed by the ledger's header,
+    or None if there is no such row
+
+    the row is found with seek_row, falling back to a full scan if the ids
+    are out of order
     """
-    action_choice = input(prompt)
-    if is_valid_action_choice(action_choice):
-        return action_choice
-    else:
-        print(
-            f"\nInvalid choice: {action_choice}\n"
-            f"Please enter {OPTION_VIEW_BALANCE}-{OPTION_EXIT}\n"
+    row_id = str(row_id)
+    names, offset = seek_row(lf, int(row_id))
+    fields = next(scan_rows(lf, offset), None)
+    if fields and fields[0] == row_id:
+        return dict(zip(names, fields))
+
+    for fields in scan_rows(lf, 0):
+        if fields[0] == row_id:
+            return dict(zip(names, fields))
+    return None
+
+
+def read_page(ledger_file, first_id, count):
+    """
+    str, int, int -> list of dict
+
+    ledger_file is the name of the ledger file
+    first_id is the ID of the first transaction on the page
+    count is the number of transactions on the page
+
+    return the latest version of count transactions starting at first_id,
+    reading only that part of the ledger
+    """
+    backend = ledger_backend(ledger_file)
+    if backend:
+        return backend["read_page"](ledger_file, first_id, count)
+    amendments = read_amendments(ledger_file)
+    archived = (
+        row
+        for row in stream_archive(
+            ledger_file, lambda footer: footer["last_id"] >= first_id
         )
-        return get_action_choice(prompt)
+        if int(row[ID_COL]) >= first_id
+    )
+    rows = list(itertools.islice(archived, count))
+    with open(ledger_file, "rb") as lf:
+        names, offset = seek_row(lf, first_id)
+        rows += [
+            dict(zip(names, fields))
+            for fields in itertools.islice(
+                scan_rows(lf, offset), count - len(rows)
+            )
+        ]
+    for row in rows:
+        row.update(amendments.get(row[ID_COL], {}))
+    return rows
 
 
-def is_valid_transaction_id(ledger_filename, transaction_id):
+def read_amendments(ledger_file):
     """
-    str, int - > bool
+    str -> dict
 
-    transaction_id is the id whose validity will be determined
-    ledger_filename is the file whose transaction ids will be calculated
+    ledger_file is the name of the ledger file
 
-    return True if
+    return dictionary of ID: latest amended row from the ledger's change log
     """
-    with open(ledger_filename) as lf:
-        reader = csv.reader(lf)
-        return 1 <= transaction_id <= len([row for row in reader]) - 1
+    finish_compaction(ledger_file)
+    if CACHE_LEDGERS:
+        with LEDGER_LOCK:
+            return cached_amendments(ledger_file)
+    log_file = sidecar_filename(ledger_file, LOG_SUFFIX)
+    if not file_exists(log_file):
+        return {}
+    with open(log_file) as logf:
+        return {
+            row[ID_COL]: {name: row[name] for name in COL_NAMES}
+            for row in csv.DictReader(logf)
+        }
+
+
+def logged_original(ledger_file, row_id):
+    """
+    str, str -> dict or None
 
+    ledger_file is the name of the ledger file
+    row_id is the ID of an amended transaction
 
-def get_transaction_id(prompt, ledger_filename):
+    return the row at row_id as it was before its first amendment, from the
+    old columns of that entry of the change log, or None if the log has no
+    entry for row_id
     """
-    str -> str
+    finish_compaction(ledger_file)
+    log_file = sidecar_filename(ledger_file, LOG_SUFFIX)
+    if not file_exists(log_file):
+        return None
+    with open(log_file) as logf:
+        for row in csv.DictReader(logf):
+            if row[ID_COL] == row_id:
+                return {
+                    ID_COL: row_id,
+                    **{
+                        name: row[old_name]
+                        for name, old_name in zip(
+                            COL_NAMES[1:], OLD_COL_NAMES
+                        )
+                    },
+                }
+    return None
+
+
+def current_row(ledger_file, row_id):
+    """
+    str, int -> dict or None
 
-    prompt is prompt to present to user
-    ledger_filename is the ledger's filename
+    ledger_file is the name of the ledger file
+    row_id is the ID of the transaction
 
-    return the transaction id inputted by user
+    return the latest version of the row at row_id or None if no such row
     """
-    transaction_id = input("\n" + prompt)
+    amended = read_amendments(ledger_file).get(str(row_id))
+    if amended:
+        return amended
+    with open(ledger_file, "rb") as lf:
+        return find_row(lf, row_id)
 
-    if transaction_id.isdigit() and is_valid_transaction_id(
-        ledger_filename, int(transaction_id)
-    ):
-        return transaction_id
+
+def fetch_rows(ledger_file, row_ids):
+    """
+    str, iterable of int -> list of dict
+
+    ledger_file is the name of the ledger file
+    row_ids are the IDs of the transactions to fetch
+
+    return the latest version of each row in row_ids, in ID order, without
+    reading the rest of the ledger unless a large share of it is wanted
+    """
+    row_ids = sorted(row_ids)
+    amendments = read_amendments(ledger_file)
+    live_rows = last_row_id(ledger_file) - archived_last_id(ledger_file)
+    if len(row_ids) > FETCH_SCAN_RATIO * live_rows:
+        wanted = {str(row_id) for row_id in row_ids}
+        with open(ledger_file) as lf:
+            rows = [
+                dict(row)
+                for row in csv.DictReader(lf, skipinitialspace=True)
+                if row[ID_COL] in wanted
+            ]
     else:
-        print("\nInvalid transaction ID.")
-        return get_transaction_id(prompt, ledger_filename)
+        with open(ledger_file, "rb") as lf:
+            rows = [find_row(lf, row_id) for row_id in row_ids]
+    for row in rows:
+        if row is not None:
+            row.update(amendments.get(row[ID_COL], {}))
+    return [row for row in rows if row is not None]
 
 
-def is_valid_date(date):
+def append_amendment(ledger_file, modified_row, current):
+    """
+    str, dict, dict -> None
+
+    ledger_file is the name of the ledger file
+    modified_row is the new version of the row
+    current is the version of the row being replaced
+
+    append modified_row to the ledger's change log
+    """
+    finish_compaction(ledger_file)
+    log_file = sidecar_filename(ledger_file, LOG_SUFFIX)
+    is_new_log = not file_exists(log_file)
+    entry = dict(modified_row)
+    for name, old_name in zip(COL_NAMES[1:], OLD_COL_NAMES):
+        entry[old_name] = current[name]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, LOG_COL_NAMES)
+    if is_new_log:
+        writer.writeheader()
+    else:
+        before = os.stat(log_file)
+    writer.writerow(entry)
+    with open(log_file, "a") as logf:
+        logf.write(buffer.getvalue())
+    if not is_new_log:
+        cache_appended(log_file, before, buffer.getvalue(), [entry])
+
+
+def should_compact(ledger_file):
     """
     str -> bool
 
-    date is the date to validate
+    ledger_file is the name of the ledger file
 
-    return True if date is valid (YYYY-MM-DD); otherwise, False
+    return True if the change log has grown past COMPACT_LOG_BYTES or
+    COMPACT_LOG_RATIO of the ledger's size; otherwise, False
     """
-    try:
-        datetime.datetime.strptime(date, "%Y-%m-%d")
-        return True
-    except ValueError:
+    finish_compaction(ledger_file)
+    log_file = sidecar_filename(ledger_file, LOG_SUFFIX)
+    if not file_exists(log_file):
         return False
+    log_size = os.path.getsize(log_file)
+    return (
+        log_size >= COMPACT_LOG_BYTES
+        or log_size >= COMPACT_LOG_RATIO * os.path.getsize(ledger_file)
+    )
 
 
-def get_date_input(prompt):
+def maybe_compact(ledger_file):
     """
-    str -> str
+    str -> None
 
-    prompt is prompt to present to user
+    ledger_file is the name of the ledger file
 
-    return valid date inputted by user
-    """
-    date = input(prompt)
+    compact the ledger if its change log is large enough, in a background
+    thread if COMPACT_IN_BACKGROUND is set
 
-    if is_valid_date(date):
-        return date
+    the thread is not a daemon, so that a compaction is never cut short
+    halfway through rewriting the ledger: the interpreter waits for it
+    before exiting, and the CLI may take that long to exit after a write
+    """
+    if not should_compact(ledger_file):
+        return
+    if COMPACT_IN_BACKGROUND:
+        threading.Thread(target=compact_ledger, args=(ledger_file,)).start()
     else:
-        print("\nInvalid date.")
-        return get_date_input(prompt)
+        compact_ledger(ledger_file)
 
 
-def is_valid_time(time):
+def compact_ledger(ledger_file):
     """
-    str -> bool
+    str -> None
 
-    time is the time to validate
+    ledger_file is the name of the ledger file
 
-    return True if time is in valid 24-hour clock format; otherwise, False
+    fold the change log into ledger_file and remove the log
+
+    the new ledger is written to a unique temp file and renamed over the old
+    one; the rename commits the compaction: the temp file is recorded in a
+    COMPACTED_SUFFIX sidecar first, so that if the log outlives the rename
+    (e.g. after a crash), finish_compaction recognizes the ledger as the
+    compacted one and removes the log before anything reads it again
     """
-    try:
-        datetime.datetime.strptime(time, "%H:%M:%S")
-        return True
-    except ValueError:
-        return False
+    with ledger_lock(ledger_file):
+        amendments = read_amendments(ledger_file)
+        if not amendments:
+            return
+
+        # bring the indexes up to date so they can be carried over as is
+        indexes = [
+            suffix
+            for suffix, refresh in INDEX_REFRESHERS.items()
+            if file_exists(sidecar_filename(ledger_file, suffix))
+            and refresh(ledger_file) is not None
+        ]
+
+        before = os.stat(ledger_file)
+        cents_delta = 0
+        with open(ledger_file) as lf, atomic_write(ledger_file) as tf:
+            reader = csv.DictReader(lf, COL_NAMES)
+            writer = csv.DictWriter(tf, COL_NAMES)
+            for row in reader:
+                amended = amendments.get(row[ID_COL])
+                if amended:
+                    cents_delta += amount_to_cents(
+                        amended[AMOUNT_COL]
+                    ) - amount_to_cents(row[AMOUNT_COL])
+                    row = amended
+                writer.writerow(row)
+            tf.flush()
+            compacted = os.fstat(tf.fileno())
+            write_sidecar(
+                ledger_file,
+                COMPACTED_SUFFIX,
+                {
+                    "ledger": [compacted.st_dev, compacted.st_ino],
+                    "size": compacted.st_size,
+                },
+            )
 
+        finish_compaction(ledger_file)
+        update_balance_checkpoint(ledger_file, before, 0, cents_delta)
+        with open(ledger_file, "rb") as lf:
+            end = os.fstat(lf.fileno()).st_size
+            coverage = {"state": ledger_state(lf, end), "log": None}
+        for suffix in indexes:
+            rebase_index(ledger_file, suffix, coverage)
 
-def get_time_input(prompt):
+
+def finish_compaction(ledger_file):
     """
-    str -> str
+    str -> None
 
-    prompt is prompt to present to user
+    ledger_file is the name of a CSV ledger file
 
-    return valid time inputted by user
+    finish a compaction of the ledger that renamed the compacted ledger
+    into place but did not remove the change log (e.g. because of a crash),
+    by removing the log, which the ledger already holds; a compaction that
+    did not get as far as the rename leaves the log as it is
+
+    called before the log is read or written
     """
-    time = input(prompt)
+    compacted_file = sidecar_filename(ledger_file, COMPACTED_SUFFIX)
+    if not file_exists(compacted_file):
+        return
+    # a compaction under way holds the lock until it is finished
+    with ledger_lock(ledger_file):
+        compacted = read_sidecar(ledger_file, COMPACTED_SUFFIX)
+        stat = os.stat(ledger_file)
+        if (
+            compacted
+            and compacted["ledger"] == [stat.st_dev, stat.st_ino]
+            and stat.st_size >= compacted["size"]
+        ):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(sidecar_filename(ledger_file, LOG_SUFFIX))
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(compacted_file)
+
+
+@contextlib.contextmanager
+def ledger_changes(ledger_file, coverage):
+    """
+    str, dict or None -> context manager of dict
 
-    if is_valid_time(time):
-        return time
-    else:
-        print("\nInvalid time.\n")
-        return get_time_input(prompt)
+    ledger_file is the name of the ledger file
+    coverage is the coverage an index was saved with, or None
+
+    yield the changes made to the ledger since coverage as a dictionary:
+        "complete": False if coverage could not be verified, in which case
+            the changes start from an empty ledger
+        "rows": iterator of dicts of rows appended to ledger_file
+        "amendments": iterator of dicts of entries appended to the log
+        "coverage": coverage of the ledger once the changes are applied
+    """
+    coverage = coverage or {"state": None, "log": None}
+    finish_compaction(ledger_file)
+    log_file = sidecar_filename(ledger_file, LOG_SUFFIX)
+    with contextlib.ExitStack() as stack:
+        lf = stack.enter_context(open(ledger_file, "rb"))
+        names = next(csv.reader([lf.readline().decode("utf-8")]), [])
+        header_end = lf.tell()
+        offset = verified_offset(lf, coverage["state"])
+
+        logf = None
+        log_offset = 0
+        if file_exists(log_file):
+            logf = stack.enter_context(open(log_file, "rb"))
+            if coverage["log"] is not None:
+                log_offset = verified_offset(logf, coverage["log"])
+        elif coverage["log"] is not None:
+            # the log was folded into the ledger by compaction
+            offset = None
+
+        complete = offset is not None and log_offset is not None
+        if not complete:
+            offset, log_offset = header_end, 0
+
+        end = os.fstat(lf.fileno()).st_size
+        base = coverage["state"] if complete else None
+        new_coverage = {"state": ledger_state(lf, end, base), "log": None}
+        amendments = iter(())
+        if logf is not None:
+            log_end = os.fstat(logf.fileno()).st_size
+            log_base = coverage["log"] if complete else None
+            new_coverage["log"] = ledger_state(logf, log_end, log_base)
+            amendments = (
+                dict(zip(LOG_COL_NAMES, entry))
+                for entry in scan_rows(logf, log_offset)
+                if entry[0] != ID_COL
+            )
 
+        yield {
+            "complete": complete,
+            "rows": (dict(zip(names, row)) for row in scan_rows(lf, offset)),
+            "amendments": amendments,
+            "coverage": new_coverage,
+        }
 
-def checkbook_loop():
+
+def uncovered_bytes(ledger_file, coverage):
     """
-    implements CLI for checkbook application
+    str, dict -> int
+
+    ledger_file is the name of the ledger file
+    coverage is the coverage an index was saved with
+
+    return how many bytes of the ledger and change log are past coverage
     """
-    menu = (
-        f"\nWhat would you like to do?\n\n"
-        f"{OPTION_VIEW_BALANCE}) View current balance\n"
-        f"{OPTION_WITHDRAW}) Record a debit (withdraw)\n"
-        f"{OPTION_DEPOSIT}) Record a credit (deposit)\n"
-        f"{OPTION_VIEW_HISTORY}) View and search transaction history\n"
-        f"{OPTION_MODIFY_TRANSACTION}) Modify a transaction\n"
-        f"{OPTION_EXIT}) Exit\n"
-    )
-    print(menu)
-    prompt = "Your choice? "
-    action_choice = get_action_choice(prompt)
+    finish_compaction(ledger_file)
+    uncovered = os.path.getsize(ledger_file) - coverage["state"]["offset"]
+    log_file = sidecar_filename(ledger_file, LOG_SUFFIX)
+    if file_exists(log_file):
+        uncovered += os.path.getsize(log_file)
+        if coverage["log"] is not None:
+            uncovered -= coverage["log"]["offset"]
+    return uncovered
 
-    date_prompt = "\nEnter date (YYYY-MM-DD): "
-    time_prompt = "Enter time (HH:MM:SS in 24-hour clock format): "
-    category_prompt = "Enter a category: "
-    description_prompt = "Enter a description: "
-    amount_prompt = "Enter amount: $"
 
-    # process menu choice #####################################################
-    if action_choice == OPTION_VIEW_BALANCE:
-        balance = view_balance(LEDGER_FILENAME)
-        print(f"\nYour current balance is : ${balance:,.2f}")
-        print()
+def write_index(ledger_file, suffix, header, arrays):
+    """
+    str, str, dict, dict -> None
 
-    elif action_choice == OPTION_WITHDRAW:
-        date = get_date_input(date_prompt)
-        time = get_time_input(time_prompt)
-        category = input(category_prompt)
-        description = input(description_prompt)
+    ledger_file is the name of the ledger file
+    suffix is the suffix of the index
+    header is a dictionary that includes the index's "coverage"
+    arrays is a dictionary of key: iterable of ints
 
-        debit_value = get_valid_amount(amount_prompt)
+    save the index as header followed by the packed arrays; header["keys"]
+    records the position and length of each array
+    """
+    header = dict(header, keys={})
+    packed = []
+    start = 0
+    for key, values in arrays.items():
+        values = array.array("q", values)
+        header["keys"][key] = [start, len(values)]
+        start += len(values)
+        packed.append(values)
+
+    # pad the header so the arrays are aligned when the index is mapped
+    header_line = json.dumps(header).encode("utf-8")
+    header_line += b" " * (-(len(header_line) + 1) % 8) + b"\n"
+    with atomic_write(sidecar_filename(ledger_file, suffix), "wb") as f:
+        f.write(header_line)
+        for values in packed:
+            values.tofile(f)
+
+
+def read_index(ledger_file, suffix, keys=None):
+    """
+    str, str, iterable of str -> dict, dict or None, None
 
-        withdraw_record = create_withdraw_record(
-            date, time, category, description, debit_value
-        )
-        write_record(LEDGER_FILENAME, withdraw_record)
+    ledger_file is the name of the ledger file
+    suffix is the suffix of the index
+    keys are the arrays to read (all of them if None)
 
-    elif action_choice == OPTION_DEPOSIT:
-        date = get_date_input(date_prompt)
-        time = get_time_input(time_prompt)
-        category = input(category_prompt)
-        description = input(description_prompt)
+    return the index's header and a dictionary of key: array for keys, or
+    None, None if there is no readable index
+    """
+    try:
+        with open(sidecar_filename(ledger_file, suffix), "rb") as f:
+            header = json.loads(f.readline())
+            data_start = f.tell()
+            arrays = {}
+            for key in header["keys"] if keys is None else keys:
+                start, length = header["keys"].get(key, (0, 0))
+                values = array.array("q")
+                f.seek(data_start + start * values.itemsize)
+                values.fromfile(f, length)
+                arrays[key] = values
+            return header, arrays
+    except (OSError, ValueError, EOFError, KeyError):
+        return None, None
+
+
+@contextlib.contextmanager
+def mapped_index(ledger_file, suffix):
+    """
+    str, str -> context manager of dict, dict
 
-        credit_value = get_valid_amount(amount_prompt)
+    ledger_file is the name of the ledger file
+    suffix is the suffix of the index
 
-        deposit_record = create_deposit_record(
-            date, time, category, description, credit_value
-        )
-        write_record(LEDGER_FILENAME, deposit_record)
+    yield the index's header and a dictionary of key: memoryview of int64s
+    mapped from the index file, so only the pages used are read
+    """
+    with open(sidecar_filename(ledger_file, suffix), "rb") as f:
+        header = json.loads(f.readline())
+        data_start = f.tell()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = memoryview(mm)[data_start:]
+            views = {
+                key: data[start * 8 : (start + length) * 8].cast("q")
+                for key, (start, length) in header["keys"].items()
+            }
+            try:
+                yield header, views
+            finally:
+                for view in views.values():
+                    view.release()
+                data.release()
+
+
+def current_index_header(ledger_file, suffix):
+    """
+    str, str -> dict
 
-    elif action_choice == OPTION_VIEW_HISTORY:
-        ledger_list = get_trans(LEDGER_FILENAME)
-        print_ledger(ledger_list)
-        print_ledger_stats(ledger_list)
-        history_choice = input("\nSearch transactions (y/n)? ")
-        if history_choice.lower().startswith("y"):
-            search_choice = input(
-                "\n1) Select By Date\n2) Select By Category\n3) Select By "
-                "Description\n4) Exit to main menu\n\nYour Choice? "
-            )
-            while search_choice not in ("1", "2", "3", "4"):
-                search_choice = input(
-                    f"\nInvalid choice: {action_choice}\n\nPlease enter 1-4: "
-                )
-            if int(search_choice) == 1:
-                print("\n1: Search by date")
-                day = get_date_input(date_prompt)
-                print_by_date(day, ledger_list)
-            elif int(search_choice) == 2:
-                print("\n2: Search by category\n")
-                category = input(category_prompt)
-                print_by_cat(category, ledger_list)
-            elif int(search_choice) == 3:
-                print("\n3: Search by description keyword\n")
-                descript = input("Search descriptions with word or phrase: ")
-                print_by_desc(descript, ledger_list)
-            elif int(search_choice) == 4:
-                print("\nReturning to main menu")
-
-    elif action_choice == OPTION_MODIFY_TRANSACTION:
-        tid_prompt = "Enter id of transaction to modify: "
-        transaction_id = int(get_transaction_id(tid_prompt, LEDGER_FILENAME))
-
-        date = get_date_input(date_prompt)
-        time = get_time_input(time_prompt)
-        category = input(category_prompt)
-        description = input(description_prompt)
-        amount = get_valid_amount(amount_prompt)
+    ledger_file is the name of the ledger file
+    suffix is the suffix of the index
 
-        modify_transaction(
-            LEDGER_FILENAME,
-            transaction_id,
-            date,
-            time,
-            category,
-            description,
-            amount,
-        )
+    return the header of the index after building it if it is missing or
+    cannot be verified, or saving it again if it has fallen too far behind
+    """
+    header, _ = read_index(ledger_file, suffix, ())
+    if header is not None and (
+        uncovered_bytes(ledger_file, header["coverage"]) < INDEX_REFRESH_BYTES
+    ):
+        with ledger_changes(ledger_file, header["coverage"]) as changes:
+            if changes["complete"]:
+                return header
+    INDEX_REFRESHERS[suffix](ledger_file)
+    return read_index(ledger_file, suffix, ())[0]
 
-    elif action_choice == OPTION_EXIT:
-        exit(0)
-    ##########################################################################
 
-    return checkbook_loop()
+def rebase_index(ledger_file, suffix, coverage):
+    """
+    str, str, dict -> None
 
+    ledger_file is the name of the ledger file
+    suffix is the suffix of the index
+    coverage is the new coverage of the index
 
-def set_winsize(rows, cols):
-    sys.stdout.write(f"\x1b[8;{rows};{cols}t")
+    mark an up to date index as covering the ledger as it is now, after the
+    ledger was rewritten without changing what it contains
+    """
+    header, arrays = read_index(ledger_file, suffix)
+    if header is not None:
+        del header["keys"]
+        header["coverage"] = coverage
+        write_index(ledger_file, suffix, header, arrays)
 
 
-if __name__ == "__main__":
-    if not file_exists(LEDGER_FILENAME):
-        create_ledger_file(LEDGER_FILENAME)
+def maintain_indexes(ledger_file):
+    """
+    str -> None
 
-    set_winsize(24, 125)
-    print("\n~~~ Welcome to your terminal checkbook! ~~~")
-    checkbook_loop()
+    ledger_file is the name of the ledger file
+
+    save again each index with INDEX_REFRESH_BYTES of changes past it
+    """
+    for suffix, refresh in INDEX_REFRESHERS.items():
+        header, _ = read_index(ledger_file, suffix, ())
+        if header is not None and (
+            uncovered_bytes(ledger_file, header["coverage"])
+            >= INDEX_REFRESH_BYTES
+        ):
+            refresh(ledger_file)
+
+
+def apply_category_changes(postings, changes, categories=None):
+    """
+    dict, dict, set of str -> None
+
+    postings is a dictionary of category: set of IDs
+    changes is a dictionary yielded by ledger_changes
+    categories are the categories to track (all of them if None)
+
+    add new rows to postings and move modified rows between categories
+    """
+    for row in changes["rows"]:
+        category = row[CATEGORY_COL]
+        if categories is None or category in categories:
+            postings.setdefault(category, set()).add(int(row[ID_COL]))
+    for entry in changes["amendments"]:
+        row_id = int(entry[ID_COL])
+        old_category = entry[OLD_COL_NAMES[1]]
+        if old_category in postings:
+            postings[old_category].discard(row_id)
+        category = entry[CATEGORY_COL]
+        if categories is None or category in categories:
+            postings.setdefault(category, set()).add(row_id)
+
+
+def refresh_category_index(ledger_file):
+    """
+    str -> dict
+
+    ledger_file is the name of the ledger file
+
+    bring the category index up to date, building it if needed, save it
+    and return it as a dictionary of category: set of IDs
+    """
+    header, arrays = read_index(ledger_file, CATEGORY_INDEX_SUFFIX)
+    coverage = header and header["coverage"]
+    with ledger_changes(ledger_file, coverage) as changes:
+        if changes["complete"]:
+            postings = {key: set(ids) for key, ids in arrays.items()}
+        else:
+            postings = {}
+        apply_category_changes(postings, changes)
+        postings = {key: ids for key, ids in postings.items() if ids}
+        write_index(
+            ledger_file,
+            CATEGORY_INDEX_SUFFIX,
+            {"coverage": changes["coverage"]},
+            {key: sorted(ids) for key, ids in postings.items()},
+        )
+    return postings
+
+
+def category_ids(ledger_file, category):
+    """
+    str, str -> list of int
+
+    ledger_file is the name of the ledger file
+    category is the category to look up
+
+    return the sorted IDs of the transactions in category, reading only
+    that category's postings and the changes since the index was saved
+    """
+    with LEDGER_LOCK:
+        header = current_index_header(ledger_file, CATEGORY_INDEX_SUFFIX)
+        _, arrays = read_index(ledger_file, CATEGORY_INDEX_SUFFIX, [category])
+        with ledger_changes(ledger_file, header["coverage"]) as changes:
+            postings = {category: set(arrays[category])}
+            apply_category_changes(postings, changes, {category})
+        return sorted(postings[category])
+
+
+def category_transactions(ledger_file, category):
+    """
+    str, str -> list of dict
+
+    ledger_file is the name of the ledger file
+    category is the category to look up
+
+    return the transactions in category, like filtering get_trans but at a
+    cost that depends on the number of matches rather than the ledger size
+    """
+    backend = ledger_backend(ledger_file)
+    if backend:
+        return backend["category_transactions"](ledger_file, category)
+    with LEDGER_LOCK:
+        return archived_rows(
+            ledger_file,
+            lambda row: row[CATEGORY_COL] == category,
+            lambda footer: archive_block_matches(footer, {category}),
+        ) + fetch_rows(ledger_file, category_ids(ledger_file, category))
+
+
+def timestamp_to_epoch(timestamp):
+    """
+    str -> int
+
+    timestamp is a timestamp (e.g., "2016-04-03 12:43:12")
+
+    return timestamp as whole seconds since 1970-01-01 00:00:00
+    """
+    return (datetime.datetime.fromisoformat(timestamp) - EPOCH) // ONE_SECOND
+
+
+def epoch_to_timestamp(epoch):
+    """
+    int -> str
+
+    epoch is whole seconds since 1970-01-01 00:00:00
+
+    return epoch as a timestamp (e.g., "2016-04-03 12:43:12")
+    """
+    days, seconds = divmod(epoch, 24 * 60 * 60)
+    return (
+        f"{epoch_date(days)} {seconds // 3600:02}:{seconds // 60 % 60:02}:"
+        f"{seconds % 60:02}"
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def epoch_date(days):
+    """
+    int -> str
+
+    days is whole days since 1970-01-01
+
+    return the date days after 1970-01-01 (e.g., "2016-04-03"), cached as
+    the rows of a ledger share few dates
+    """
+    return str(EPOCH.date() + datetime.timedelta(days=days))
+
+
+def period_bounds(period):
+    """
+    str -> int, int
+
+    period is a year (YYYY), month (YYYY-MM) or day (YYYY-MM-DD)
+
+    return the [start, end) epoch seconds of period; raise ValueError if
+    period is not a valid year, month or day
+    """
+    for period_format, months, days in (
+        ("%Y-%m-%d", 0, 1),
+        ("%Y-%m", 1, 0),
+        ("%Y", 12, 0),
+    ):
+        try:
+            start = datetime.datetime.strptime(period, period_format)
+        except ValueError:
+            continue
+        month = start.month - 1 + months
+        end = start.replace(
+            year=start.year + month // 12, month=month % 12 + 1
+        ) + datetime.timedelta(days=days)
+        return (start - EPOCH) // ONE_SECOND, (end - EPOCH) // ONE_SECOND
+    raise ValueError(f"invalid period: {period}")
+
+
+def timestamp_changes(changes):
+    """
+    dict -> dict
+
+    changes is a dictionary yielded by ledger_changes
+
+    return dictionary of ID: epoch seconds for every row appended or
+    modified in changes, with the latest timestamp of each
+    """
+    changed = {}
+    for row in changes["rows"]:
+        changed[int(row[ID_COL])] = timestamp_to_epoch(row[TIMESTAMP_COL])
+    for entry in changes["amendments"]:
+        changed[int(entry[ID_COL])] = timestamp_to_epoch(entry[TIMESTAMP_COL])
+    return changed
+
+
+def refresh_timestamp_index(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    bring the timestamp index up to date, building it if needed, and save
+    it as epoch seconds sorted by (epoch, ID) with the matching IDs
+    """
+    header, arrays = read_index(ledger_file, TIMESTAMP_INDEX_SUFFIX)
+    coverage = header and header["coverage"]
+    with ledger_changes(ledger_file, coverage) as changes:
+        if changes["complete"]:
+            indexed = zip(arrays["epochs"], arrays["ids"])
+        else:
+            indexed = ()
+        changed = timestamp_changes(changes)
+        # rows appended out of order and modified rows are merged back in
+        kept = (
+            (epoch, row_id)
+            for epoch, row_id in indexed
+            if row_id not in changed
+        )
+        pairs = heapq.merge(
+            kept, sorted((epoch, row_id) for row_id, epoch in changed.items())
+        )
+        epochs, ids = array.array("q"), array.array("q")
+        for epoch, row_id in pairs:
+            epochs.append(epoch)
+            ids.append(row_id)
+        write_index(
+            ledger_file,
+            TIMESTAMP_INDEX_SUFFIX,
+            {"coverage": changes["coverage"]},
+            {"epochs": epochs, "ids": ids},
+        )
+
+
+def timestamp_ids(ledger_file, start, end):
+    """
+    str, int, int -> list of int
+
+    ledger_file is the name of the ledger file
+    start is the first epoch second of the range
+    end is the epoch second just after the range
+
+    return the sorted IDs of the transactions dated in [start, end), found
+    by binary search over the timestamp index
+    """
+    with LEDGER_LOCK:
+        header = current_index_header(ledger_file, TIMESTAMP_INDEX_SUFFIX)
+        with ledger_changes(ledger_file, header["coverage"]) as changes:
+            changed = timestamp_changes(changes)
+        with mapped_index(ledger_file, TIMESTAMP_INDEX_SUFFIX) as (_, views):
+            lo = bisect.bisect_left(views["epochs"], start)
+            hi = bisect.bisect_left(views["epochs"], end, lo)
+            ids = [
+                row_id
+                for row_id in views["ids"][lo:hi].tolist()
+                if row_id not in changed
+            ]
+        ids += [
+            row_id for row_id, epoch in changed.items() if start <= epoch < end
+        ]
+        return sorted(ids)
+
+
+def date_range_transactions(ledger_file, start, end):
+    """
+    str, int, int -> list of dict
+
+    ledger_file is the name of the ledger file
+    start is the first epoch second of the range
+    end is the epoch second just after the range
+
+    return the transactions dated in [start, end), in ID order
+    """
+    backend = ledger_backend(ledger_file)
+    if backend:
+        return backend["date_range_transactions"](ledger_file, start, end)
+    with LEDGER_LOCK:
+        return archived_rows(
+            ledger_file,
+            lambda row: start <= timestamp_to_epoch(row[TIMESTAMP_COL]) < end,
+            lambda footer: archive_block_matches(footer, None, start, end),
+        ) + fetch_rows(ledger_file, timestamp_ids(ledger_file, start, end))
+
+
+def prefix_sum_changes(changes):
+    """
+    dict -> list of (int, int)
+
+    changes is a dictionary yielded by ledger_changes
+
+    return the (epoch seconds, cents) of every row appended and of the new
+    version of every row modified in changes, along with the epoch seconds
+    and negated cents of the version each modification replaced
+    """
+    deltas = [
+        (
+            timestamp_to_epoch(row[TIMESTAMP_COL]),
+            amount_to_cents(row[AMOUNT_COL]),
+        )
+        for row in changes["rows"]
+    ]
+    old_timestamp, _, _, old_amount = OLD_COL_NAMES
+    for entry in changes["amendments"]:
+        deltas.append(
+            (
+                timestamp_to_epoch(entry[old_timestamp]),
+                -amount_to_cents(entry[old_amount]),
+            )
+        )
+        deltas.append(
+            (
+                timestamp_to_epoch(entry[TIMESTAMP_COL]),
+                amount_to_cents(entry[AMOUNT_COL]),
+            )
+        )
+    return deltas
+
+
+def refresh_prefix_sums(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    bring the prefix sums index up to date, building it if needed, and save
+    it as the distinct epoch seconds of the transactions, in order, with
+    the total cents of the transactions dated up to each one
+    """
+    header, arrays = read_index(ledger_file, PREFIX_SUM_SUFFIX)
+    coverage = header and header["coverage"]
+    with ledger_changes(ledger_file, coverage) as changes:
+        # cents dated at each epoch second, recovered from the prefix sums
+        net = {}
+        if changes["complete"]:
+            previous = 0
+            for epoch, total in zip(arrays["epochs"], arrays["sums"]):
+                net[epoch] = total - previous
+                previous = total
+        for epoch, cents in prefix_sum_changes(changes):
+            net[epoch] = net.get(epoch, 0) + cents
+        epochs = sorted(epoch for epoch, cents in net.items() if cents)
+        write_index(
+            ledger_file,
+            PREFIX_SUM_SUFFIX,
+            {"coverage": changes["coverage"]},
+            {
+                "epochs": epochs,
+                "sums": itertools.accumulate(net[epoch] for epoch in epochs),
+            },
+        )
+
+
+def cents_before(ledger_file, epoch):
+    """
+    str, int -> int
+
+    ledger_file is the name of the ledger file
+    epoch is an epoch second
+
+    return the total cents of the transactions dated before epoch; for a
+    CSV ledger, found by binary search over the prefix sums index plus the
+    changes since the index was saved and the archived transactions, and
+    for other backends by reading every transaction
+    """
+    backend = ledger_backend(ledger_file)
+    if backend:
+        return sum(
+            amount_to_cents(row[AMOUNT_COL])
+            for row in backend["get_trans"](ledger_file)
+            if timestamp_to_epoch(row[TIMESTAMP_COL]) < epoch
+        )
+    with LEDGER_LOCK:
+        header = current_index_header(ledger_file, PREFIX_SUM_SUFFIX)
+        with ledger_changes(ledger_file, header["coverage"]) as changes:
+            deltas = prefix_sum_changes(changes)
+        with mapped_index(ledger_file, PREFIX_SUM_SUFFIX) as (_, views):
+            i = bisect.bisect_left(views["epochs"], epoch)
+            cents = views["sums"][i - 1] if i else 0
+        cents += sum(delta for when, delta in deltas if when < epoch)
+
+        index = archive_index(ledger_file)
+        if index:
+            # only a block that straddles epoch has to be read
+            cents += sum(
+                footer["cents"]
+                for footer in index["blocks"]
+                if footer["end"] <= epoch
+            )
+            cents += sum(
+                amount_to_cents(row[AMOUNT_COL])
+                for row in stream_archive(
+                    ledger_file,
+                    lambda footer: footer["start"] < epoch < footer["end"],
+                )
+                if timestamp_to_epoch(row[TIMESTAMP_COL]) < epoch
+            )
+        return cents
+
+
+def balance_as_of(ledger_file, epoch):
+    """
+    str, int -> float
+
+    ledger_file is the name of the ledger file
+    epoch is an epoch second
+
+    return the balance just before epoch, i.e. of the transactions dated
+    before it
+    """
+    return cents_before(ledger_file, epoch) / 100
+
+
+def net_change(ledger_file, start, end):
+    """
+    str, int, int -> float
+
+    ledger_file is the name of the ledger file
+    start is the first epoch second of the range
+    end is the epoch second just after the range
+
+    return the total of the transactions dated in [start, end)
+    """
+    with LEDGER_LOCK:
+        cents = cents_before(ledger_file, end)
+        return (cents - cents_before(ledger_file, start)) / 100
+
+
+def trigrams(text):
+    """
+    str -> set of str
+
+    text is the text to split
+
+    return the set of three-character substrings of text, lowercased
+    """
+    text = text.lower()
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def description_matches(description, terms, match_all=True, ignore_case=False):
+    """
+    str, list of str, bool, bool -> bool
+
+    description is the description of a transaction
+    terms are the keywords or phrases to search for
+    match_all is True to require every term and False to require any term
+    ignore_case is True to match terms regardless of case
+
+    return True if description matches terms; otherwise, False
+    """
+    if ignore_case:
+        description = description.lower()
+        terms = [term.lower() for term in terms]
+    found = (term in description for term in terms)
+    return all(found) if match_all else any(found)
+
+
+def description_changes(changes):
+    """
+    dict -> dict
+
+    changes is a dictionary yielded by ledger_changes
+
+    return dictionary of ID: latest description for every row appended or
+    modified in changes
+    """
+    changed = {}
+    for row in changes["rows"]:
+        changed[int(row[ID_COL])] = row[DESCRIPTION_COL]
+    for entry in changes["amendments"]:
+        changed[int(entry[ID_COL])] = entry[DESCRIPTION_COL]
+    return changed
+
+
+def refresh_trigram_index(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    bring the trigram index of descriptions up to date, building it if
+    needed, and save it as trigram: sorted IDs of descriptions containing it
+    """
+    header, arrays = read_index(ledger_file, TRIGRAM_INDEX_SUFFIX)
+    with ledger_changes(ledger_file, header and header["coverage"]) as changes:
+        changed = description_changes(changes)
+        postings = {}
+        if changes["complete"]:
+            for trigram, ids in arrays.items():
+                postings[trigram] = array.array(
+                    "q", (row_id for row_id in ids if row_id not in changed)
+                )
+        for row_id, description in sorted(changed.items()):
+            for trigram in trigrams(description):
+                postings.setdefault(trigram, array.array("q")).append(row_id)
+        write_index(
+            ledger_file,
+            TRIGRAM_INDEX_SUFFIX,
+            {"coverage": changes["coverage"]},
+            {
+                trigram: sorted(ids)
+                for trigram, ids in postings.items()
+                if ids
+            },
+        )
+
+
+def description_ids(ledger_file, terms, match_all=True):
+    """
+    str, list of str, bool -> set of int or None
+
+    ledger_file is the name of the ledger file
+    terms are the keywords or phrases to search for
+    match_all is True to require every term and False to require any term
+
+    return IDs of the transactions whose descriptions may match terms,
+    regardless of case, or None if a term is too short to narrow the search
+    """
+    with LEDGER_LOCK:
+        term_trigrams = [trigrams(term) for term in terms]
+        if not terms or (
+            any(not t for t in term_trigrams)
+            and not (match_all and any(term_trigrams))
+        ):
+            return None
+
+        header = current_index_header(ledger_file, TRIGRAM_INDEX_SUFFIX)
+        wanted = set().union(*term_trigrams)
+        _, arrays = read_index(ledger_file, TRIGRAM_INDEX_SUFFIX, wanted)
+        with ledger_changes(ledger_file, header["coverage"]) as changes:
+            changed = description_changes(changes)
+
+        matches = None
+        for term, term_set in zip(terms, term_trigrams):
+            if not term_set:
+                continue
+            postings = sorted((arrays[t] for t in term_set), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+            candidates.difference_update(changed)
+            candidates.update(
+                row_id
+                for row_id, description in changed.items()
+                if term.lower() in description.lower()
+            )
+            if matches is None:
+                matches = candidates
+            elif match_all:
+                matches &= candidates
+            else:
+                matches |= candidates
+        return matches
+
+
+def description_transactions(
+    ledger_file, terms, match_all=True, ignore_case=False
+):
+    """
+    str, list of str, bool, bool -> list of dict
+
+    ledger_file is the name of the ledger file
+    terms are the keywords or phrases to search for
+    match_all is True to require every term and False to require any term
+    ignore_case is True to match terms regardless of case
+
+    return the transactions whose descriptions match terms, narrowed down
+    with the trigram index before checking each candidate
+    """
+    backend = ledger_backend(ledger_file)
+    if backend:
+        return backend["description_transactions"](
+            ledger_file, terms, match_all, ignore_case
+        )
+    with LEDGER_LOCK:
+        candidates = description_ids(ledger_file, terms, match_all)
+        if candidates is None:
+            rows = get_trans(ledger_file)
+        else:
+            rows = archived_rows(ledger_file) + fetch_rows(
+                ledger_file, candidates
+            )
+        return [
+            row
+            for row in rows
+            if description_matches(
+                row[DESCRIPTION_COL], terms, match_all, ignore_case
+            )
+        ]
+
+
+def rollup_keys(timestamp, category):
+    """
+    str, str -> tuple of (str, str)
+
+    timestamp is the timestamp of a transaction
+    category is the category of a transaction
+
+    return the (kind, key) of each group of the rollups the transaction
+    counts towards
+    """
+    return ("category", category), ("month", timestamp[:7])
+
+
+def add_to_rollups(rollups, timestamp, category, cents):
+    """
+    dict, str, str, int -> None
+
+    rollups is a dictionary of kind: dictionary of key: group
+    timestamp, category and cents are those of a transaction
+
+    count the transaction in its groups
+    """
+    for kind, key in rollup_keys(timestamp, category):
+        group = rollups[kind].get(key)
+        if group is None:
+            rollups[kind][key] = {
+                "count": 1,
+                "cents": cents,
+                "min": cents,
+                "max": cents,
+            }
+            continue
+        group["count"] += 1
+        group["cents"] += cents
+        if group["min"] is not None:
+            group["min"] = min(group["min"], cents)
+        if group["max"] is not None:
+            group["max"] = max(group["max"], cents)
+
+
+def remove_from_rollups(rollups, timestamp, category, cents):
+    """
+    dict, str, str, int -> None
+
+    rollups is a dictionary of kind: dictionary of key: group
+    timestamp, category and cents are those of a transaction
+
+    stop counting the transaction in its groups, forgetting a minimum or
+    maximum it may have been
+    """
+    for kind, key in rollup_keys(timestamp, category):
+        group = rollups[kind].get(key)
+        if group is None:
+            continue
+        group["count"] -= 1
+        group["cents"] -= cents
+        if group["count"] <= 0:
+            del rollups[kind][key]
+            continue
+        if group["min"] == cents:
+            group["min"] = None
+        if group["max"] == cents:
+            group["max"] = None
+
+
+def apply_rollup_changes(rollups, changes):
+    """
+    dict, dict -> None
+
+    rollups is a dictionary of kind: dictionary of key: group
+    changes is a dictionary yielded by ledger_changes
+
+    count new rows and move modified rows between groups
+    """
+    for row in changes["rows"]:
+        add_to_rollups(
+            rollups,
+            row[TIMESTAMP_COL],
+            row[CATEGORY_COL],
+            amount_to_cents(row[AMOUNT_COL]),
+        )
+    old_timestamp, old_category, _, old_amount = OLD_COL_NAMES
+    for entry in changes["amendments"]:
+        remove_from_rollups(
+            rollups,
+            entry[old_timestamp],
+            entry[old_category],
+            amount_to_cents(entry[old_amount]),
+        )
+        add_to_rollups(
+            rollups,
+            entry[TIMESTAMP_COL],
+            entry[CATEGORY_COL],
+            amount_to_cents(entry[AMOUNT_COL]),
+        )
+
+
+def build_rollups(ledg_list):
+    """
+    list of dict -> dict
+
+    ledg_list is a list of dictionaries representing transactions
+
+    return the rollups of ledg_list
+    """
+    rollups = {kind: {} for kind in ROLLUP_KINDS}
+    for transaction in ledg_list:
+        add_to_rollups(
+            rollups,
+            transaction[TIMESTAMP_COL],
+            transaction[CATEGORY_COL],
+            amount_to_cents(transaction[AMOUNT_COL]),
+        )
+    return rollups
+
+
+def merge_rollups(rollups, other):
+    """
+    dict, dict -> dict
+
+    rollups and other are rollups of different transactions
+
+    return the rollups of the transactions of both
+    """
+    merged = {
+        kind: {key: dict(group) for key, group in rollups[kind].items()}
+        for kind in ROLLUP_KINDS
+    }
+    for kind in ROLLUP_KINDS:
+        for key, group in other[kind].items():
+            mine = merged[kind].get(key)
+            if mine is None:
+                merged[kind][key] = dict(group)
+                continue
+            mine["count"] += group["count"]
+            mine["cents"] += group["cents"]
+            mine["min"] = min(mine["min"], group["min"])
+            mine["max"] = max(mine["max"], group["max"])
+    return merged
+
+
+def refresh_rollups(ledger_file):
+    """
+    str -> dict
+
+    ledger_file is the name of the ledger file
+
+    bring the rollups up to date, building them if needed, save them and
+    return them
+    """
+    header, _ = read_index(ledger_file, ROLLUP_SUFFIX, ())
+    coverage = header and header["coverage"]
+    with ledger_changes(ledger_file, coverage) as changes:
+        if changes["complete"]:
+            rollups = header["rollups"]
+        else:
+            rollups = {kind: {} for kind in ROLLUP_KINDS}
+        apply_rollup_changes(rollups, changes)
+        write_index(
+            ledger_file,
+            ROLLUP_SUFFIX,
+            {"coverage": changes["coverage"], "rollups": rollups},
+            {},
+        )
+    return rollups
+
+
+def ledger_rollups(ledger_file):
+    """
+    str -> dict
+
+    ledger_file is the name of the ledger file
+
+    return a dictionary of kind ("category" or "month"): dictionary of
+    key: group, where each group has the "count", total "cents", "min" and
+    "max" cents of its transactions; for CSV ledgers this reads the saved
+    rollups and the changes since they were saved, and only the rows of
+    groups whose minimum or maximum was modified away, plus the rollups
+    saved in the ledger's archive
+    """
+    if ledger_backend(ledger_file):
+        return build_rollups(get_trans(ledger_file))
+    with LEDGER_LOCK:
+        index = archive_index(ledger_file)
+        last_id = archived_last_id(ledger_file)
+        header = current_index_header(ledger_file, ROLLUP_SUFFIX)
+        rollups = header["rollups"]
+        with ledger_changes(ledger_file, header["coverage"]) as changes:
+            apply_rollup_changes(rollups, changes)
+            coverage = changes["coverage"]
+
+        stale = [
+            (kind, key)
+            for kind in ROLLUP_KINDS
+            for key, group in rollups[kind].items()
+            if group["min"] is None or group["max"] is None
+        ]
+        for kind, key in stale:
+            if kind == "category":
+                ledg_list = category_transactions(ledger_file, key)
+            else:
+                ledg_list = date_range_transactions(
+                    ledger_file, *period_bounds(key)
+                )
+            cents = [
+                amount_to_cents(row[AMOUNT_COL])
+                for row in ledg_list
+                if int(row[ID_COL]) > last_id
+            ]
+            rollups[kind][key].update(min=min(cents), max=max(cents))
+        if stale:
+            write_index(
+                ledger_file,
+                ROLLUP_SUFFIX,
+                {"coverage": coverage, "rollups": rollups},
+                {},
+            )
+        if index:
+            return merge_rollups(rollups, index["rollups"])
+        return rollups
+
+
+def verify_rollups(ledger_file):
+    """
+    str -> list of (str, str, dict or None, dict or None)
+
+    ledger_file is the name of the ledger file
+
+    rebuild the rollups from the ledger's transactions and save them in
+    place of the maintained ones
+
+    return the kind, key, maintained group and rebuilt group of each group
+    where the two differ (None where a group is missing)
+    """
+    with ledger_lock(ledger_file):
+        maintained = ledger_rollups(ledger_file)
+        ledg_list = get_trans(ledger_file)
+        rebuilt = build_rollups(ledg_list)
+        if not ledger_backend(ledger_file):
+            with ledger_changes(ledger_file, None) as changes:
+                coverage = changes["coverage"]
+            # the saved rollups leave out the archived transactions
+            last_id = archived_last_id(ledger_file)
+            write_index(
+                ledger_file,
+                ROLLUP_SUFFIX,
+                {
+                    "coverage": coverage,
+                    "rollups": build_rollups(
+                        row
+                        for row in ledg_list
+                        if int(row[ID_COL]) > last_id
+                    ),
+                },
+                {},
+            )
+    return [
+        (kind, key, maintained[kind].get(key), rebuilt[kind].get(key))
+        for kind in ROLLUP_KINDS
+        for key in sorted(maintained[kind].keys() | rebuilt[kind].keys())
+        if maintained[kind].get(key) != rebuilt[kind].get(key)
+    ]
+
+
+def print_balance_as_of(ledger_file, period, since=None):
+    """
+    str, str, str -> None
+
+    ledger_file is the name of the ledger file
+    period is the year (YYYY), month (YYYY-MM) or day (YYYY-MM-DD) to
+    print the closing balance of
+    since is the period whose start the net change to the end of period
+    is printed from (no net change is printed if None)
+
+    print the balance at the end of period and the net change since
+    """
+    _, end = period_bounds(period)
+    print(
+        f"\nYour balance at the end of {period} was : "
+        f"${balance_as_of(ledger_file, end):,.2f}"
+    )
+    if since is not None:
+        start, _ = period_bounds(since)
+        print(
+            f"Net change from the start of {since} : "
+            f"${net_change(ledger_file, start, end):,.2f}"
+        )
+
+
+def print_rollups(rollups, kind):
+    """
+    dict, str -> None
+
+    rollups is a dictionary returned by ledger_rollups
+    kind is the kind of group to print ("category" or "month")
+
+    print the count, total, minimum, maximum and mean amount of each group
+    """
+    lines = [
+        f"\n{kind.capitalize():<20}|{'Count':<10}|{'Total':<15}|"
+        f"{'Min':<15}|{'Max':<15}|{'Mean':<15}",
+        f"{'-'*20}|{'-'*10}|{'-'*15}|{'-'*15}|{'-'*15}|{'-'*15}",
+    ]
+    for key, group in sorted(rollups[kind].items()):
+        lines.append(
+            f"{key[:20]:<20}|{group['count']:<10}|"
+            f"${group['cents'] / 100:<14,.2f}|${group['min'] / 100:<14,.2f}|"
+            f"${group['max'] / 100:<14,.2f}|"
+            f"${group['cents'] / group['count'] / 100:<14,.2f}"
+        )
+    write_lines(lines)
+
+
+INDEX_REFRESHERS = {
+    CATEGORY_INDEX_SUFFIX: refresh_category_index,
+    TIMESTAMP_INDEX_SUFFIX: refresh_timestamp_index,
+    TRIGRAM_INDEX_SUFFIX: refresh_trigram_index,
+    ROLLUP_SUFFIX: refresh_rollups,
+    PREFIX_SUM_SUFFIX: refresh_prefix_sums,
+}
+
+
+def sqlite_connect(ledger_file):
+    """
+    str -> sqlite3.Connection
+
+    ledger_file is the name of an SQLite ledger file
+
+    return a connection to ledger_file; raise FileNotFoundError if it does
+    not exist rather than creating an empty database
+    """
+    if not file_exists(ledger_file):
+        raise FileNotFoundError(f"No such ledger file: {ledger_file!r}")
+    return sqlite3.connect(ledger_file)
+
+
+def sqlite_rows(ledger_file, where="", parameters=()):
+    """
+    str, str, tuple -> list of dict
+
+    ledger_file is the name of an SQLite ledger file
+    where is the rest of the query after the FROM clause
+    parameters are the values of the query's placeholders
+
+    return the matching transactions as get_trans returns them
+    """
+    with contextlib.closing(sqlite_connect(ledger_file)) as db:
+        db.create_function("py_lower", 1, str.lower, deterministic=True)
+        cursor = db.execute(
+            f"SELECT {SQLITE_COLUMNS} FROM transactions {where}", parameters
+        )
+        return [
+            {
+                ID_COL: str(row_id),
+                TIMESTAMP_COL: timestamp,
+                CATEGORY_COL: category,
+                DESCRIPTION_COL: description,
+                AMOUNT_COL: cents_to_amount(cents),
+            }
+            for row_id, timestamp, category, description, cents in cursor
+        ]
+
+
+def sqlite_execute(ledger_file, statement, parameters=(), many=False):
+    """
+    str, str, tuple, bool -> int
+
+    ledger_file is the name of an SQLite ledger file
+    statement is the statement to execute in its own transaction
+    parameters are the values of the placeholders (a list of them if many)
+    many is True to execute statement once for each item of parameters
+
+    return the number of rows changed
+    """
+    with contextlib.closing(sqlite_connect(ledger_file)) as db:
+        with db:
+            if many:
+                return db.executemany(statement, parameters).rowcount
+            return db.execute(statement, parameters).rowcount
+
+
+def sqlite_value(ledger_file, query, parameters=()):
+    """
+    str, str, tuple -> object
+
+    ledger_file is the name of an SQLite ledger file
+    query is a query returning one value
+    parameters are the values of the query's placeholders
+
+    return the value of query, or None if it returns no row
+    """
+    with contextlib.closing(sqlite_connect(ledger_file)) as db:
+        row = db.execute(query, parameters).fetchone()
+        return row and row[0]
+
+
+def sqlite_parameters(record):
+    """
+    dict -> tuple
+
+    record is a dictionary of "column_name": data
+
+    return the values to insert into the transactions table for record
+    """
+    return (
+        int(record[ID_COL]),
+        record[TIMESTAMP_COL],
+        record[CATEGORY_COL],
+        record[DESCRIPTION_COL],
+        amount_to_cents(record[AMOUNT_COL]),
+    )
+
+
+def sqlite_create_ledger_file(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the SQLite ledger file
+
+    create an empty SQLite ledger in write-ahead logging mode
+    CAUTION: will overwrite the ledger file if it exists
+    """
+    sqlite_remove_ledger_file(ledger_file)
+    with contextlib.closing(sqlite3.connect(ledger_file)) as db:
+        db.execute("PRAGMA journal_mode = WAL")
+        db.executescript(SQLITE_SCHEMA)
+
+
+def sqlite_remove_ledger_file(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the SQLite ledger file
+
+    remove the SQLite ledger along with its journal files
+    """
+    for suffix in ("", *SQLITE_SIDECAR_SUFFIXES):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(ledger_file + suffix)
+
+
+def sqlite_get_trans(ledger_file):
+    """
+    str -> list
+
+    ledger_file is the name of the SQLite ledger file
+
+    return every transaction in the ledger, in ID order
+    """
+    return sqlite_rows(ledger_file, "ORDER BY id")
+
+
+def sqlite_view_balance(ledger_file):
+    """
+    str -> float
+
+    ledger_file is the name of the SQLite ledger file
+
+    return the balance of the ledger
+    """
+    cents = sqlite_value(
+        ledger_file, "SELECT COALESCE(SUM(cents), 0) FROM transactions"
+    )
+    return cents / 100
+
+
+def sqlite_write_record(ledger_file, record):
+    """
+    str, dict -> None
+
+    ledger_file is the name of the SQLite ledger file
+    record is a dictionary of "column_name": data
+
+    add record to the ledger
+    """
+    sqlite_append_records(ledger_file, [record])
+
+
+def sqlite_append_records(ledger_file, records):
+    """
+    str, list of dict -> None
+
+    ledger_file is the name of the SQLite ledger file
+    records are dictionaries of "column_name": data
+
+    add records to the ledger in one transaction
+    """
+    sqlite_execute(
+        ledger_file,
+        f"INSERT INTO transactions ({SQLITE_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+        [sqlite_parameters(record) for record in records],
+        many=True,
+    )
+
+
+def sqlite_modify_transaction(
+    ledger_file, row_id, date, time, category, description, amount
+):
+    """
+    str, int, str, str, str, str, float-> None
+
+    ledger_file is the name of the SQLite ledger file
+    row_id is the ID of the transaction to modify
+    date is the date of the transaction
+    time is the time of the transaction
+    category is category of the transaction
+    description is a description of the transaction
+    amount is the amount of the transaction
+
+    update the transaction at row_id in place, keeping the sign of its
+    amount
+    """
+    cents = amount_to_cents(amount)
+    sqlite_execute(
+        ledger_file,
+        "UPDATE transactions SET timestamp = ?, category = ?, "
+        "description = ?, cents = CASE WHEN cents < 0 THEN -? ELSE ? END "
+        "WHERE id = ?",
+        (date + " " + time, category, description, cents, cents, row_id),
+    )
+
+
+def sqlite_last_row_id(ledger_file):
+    """
+    str -> int
+
+    ledger_file is the name of the SQLite ledger file
+
+    return id of the last row in the ledger or 0 if there is none
+    """
+    if not file_exists(ledger_file):
+        return 0
+    return sqlite_value(ledger_file, "SELECT MAX(id) FROM transactions") or 0
+
+
+def sqlite_is_valid_transaction_id(ledger_file, transaction_id):
+    """
+    str, int -> bool
+
+    ledger_file is the name of the SQLite ledger file
+    transaction_id is the id whose validity will be determined
+
+    return True if the ledger has a transaction with transaction_id
+    """
+    return bool(
+        sqlite_value(
+            ledger_file,
+            "SELECT 1 FROM transactions WHERE id = ?",
+            (transaction_id,),
+        )
+    )
+
+
+def sqlite_read_page(ledger_file, first_id, count):
+    """
+    str, int, int -> list of dict
+
+    ledger_file is the name of the SQLite ledger file
+    first_id is the ID of the first transaction on the page
+    count is the number of transactions on the page
+
+    return count transactions starting at first_id
+    """
+    return sqlite_rows(
+        ledger_file, "WHERE id >= ? ORDER BY id LIMIT ?", (first_id, count)
+    )
+
+
+def sqlite_category_transactions(ledger_file, category):
+    """
+    str, str -> list of dict
+
+    ledger_file is the name of the SQLite ledger file
+    category is the category to look up
+
+    return the transactions in category, in ID order
+    """
+    return sqlite_rows(
+        ledger_file, "WHERE category = ? ORDER BY id", (category,)
+    )
+
+
+def sqlite_date_range_transactions(ledger_file, start, end):
+    """
+    str, int, int -> list of dict
+
+    ledger_file is the name of the SQLite ledger file
+    start is the first epoch second of the range
+    end is the epoch second just after the range
+
+    return the transactions dated in [start, end), in ID order
+    """
+    bounds = [epoch_to_timestamp(epoch) for epoch in (start, end)]
+    return sqlite_rows(
+        ledger_file,
+        "WHERE timestamp >= ? AND timestamp < ? ORDER BY id",
+        bounds,
+    )
+
+
+def sqlite_description_transactions(
+    ledger_file, terms, match_all, ignore_case
+):
+    """
+    str, list of str, bool, bool -> list of dict
+
+    ledger_file is the name of the SQLite ledger file
+    terms are the keywords or phrases to search for
+    match_all is True to require every term and False to require any term
+    ignore_case is True to match terms regardless of case
+
+    return the transactions whose descriptions match terms, in ID order
+    """
+    if ignore_case:
+        column = "py_lower(description)"
+        terms = [term.lower() for term in terms]
+    else:
+        column = "description"
+    conditions = [f"instr({column}, ?) > 0" for _ in terms]
+    if conditions:
+        where = (" AND " if match_all else " OR ").join(conditions)
+    else:
+        where = "1" if match_all else "0"
+    return sqlite_rows(ledger_file, f"WHERE {where} ORDER BY id", terms)
+
+
+@contextlib.contextmanager
+def binary_ledger(ledger_file):
+    """
+    str -> context manager of (mmap.mmap, bytes-like, list of str)
+
+    ledger_file is the name of a binary ledger file
+
+    yield a read-only map of ledger_file, its string heap and its category
+    names; raise ValueError if ledger_file is not a binary ledger
+    """
+    heap_file = sidecar_filename(ledger_file, BINARY_HEAP_SUFFIX)
+    with open(ledger_file, "rb") as lf, open(heap_file, "rb") as hf:
+        records = mmap.mmap(lf.fileno(), 0, access=mmap.ACCESS_READ)
+        heap = b""
+        try:
+            if records[: len(BINARY_MAGIC)] != BINARY_MAGIC:
+                raise ValueError(f"Not a binary ledger: {ledger_file!r}")
+            if os.fstat(hf.fileno()).st_size:
+                heap = mmap.mmap(hf.fileno(), 0, access=mmap.ACCESS_READ)
+            categories = read_sidecar(ledger_file, BINARY_CATEGORIES_SUFFIX)
+            yield records, heap, categories or []
+        finally:
+            records.close()
+            if heap:
+                heap.close()
+
+
+def binary_count(records):
+    """
+    mmap.mmap -> int
+
+    records is a map of a binary ledger
+
+    return the number of complete records in the ledger
+    """
+    return len(records) // BINARY_RECORD.size - 1
+
+
+def binary_unpack(records, first=0, stop=None):
+    """
+    mmap.mmap, int, int -> iterator of tuple
+
+    records is a map of a binary ledger
+    first is the position of the first record to unpack
+    stop is the position just after the last one (the end if None)
+
+    yield the fields of the records from first up to stop
+    """
+    count = binary_count(records)
+    stop = count if stop is None else min(stop, count)
+    first = min(first, stop)
+    size = BINARY_RECORD.size
+    return BINARY_RECORD.iter_unpack(
+        records[size * (first + 1) : size * (stop + 1)]
+    )
+
+
+def binary_row(fields, heap, categories):
+    """
+    tuple, bytes-like, list of str -> dict
+
+    fields are the fields of a binary record
+    heap is the string heap of the ledger
+    categories are the category names of the ledger
+
+    return the record as a transaction like those get_trans returns
+    """
+    row_id, epoch, cents, offset, length, category = fields
+    return {
+        ID_COL: str(row_id),
+        TIMESTAMP_COL: epoch_to_timestamp(epoch),
+        CATEGORY_COL: categories[category],
+        DESCRIPTION_COL: heap[offset : offset + length].decode(),
+        AMOUNT_COL: cents_to_amount(cents),
+    }
+
+
+def binary_rows(ledger_file, keep=None, first_id=1, count=None):
+    """
+    str, function, int, int -> list of dict
+
+    ledger_file is the name of the binary ledger file
+    keep is called with the fields of each record and returns True to
+    include it (every record is included if None)
+    first_id is the ID of the first transaction to consider
+    count is the number of transactions to consider (all of them if None)
+
+    return the transactions kept, in ID order
+    """
+    with binary_ledger(ledger_file) as (records, heap, categories):
+        first = binary_position(records, first_id, exact=False)
+        stop = None if count is None else first + count
+        return [
+            binary_row(fields, heap, categories)
+            for fields in binary_unpack(records, first, stop)
+            if keep is None or keep(fields)
+        ]
+
+
+def binary_position(records, row_id, exact=True):
+    """
+    mmap.mmap, int, bool -> int
+
+    records is a map of a binary ledger
+    row_id is the ID to look up
+    exact is False to settle for the first record with a greater ID
+
+    return the position of the record with row_id, which is row_id - 1 when
+    IDs are consecutive, or None if there is no such record
+    """
+    count = binary_count(records)
+
+    def record_id(position):
+        offset = BINARY_RECORD.size * (position + 1)
+        return BINARY_RECORD.unpack_from(records, offset)[0]
+
+    position = row_id - 1
+    if not 0 <= position < count or record_id(position) != row_id:
+        position = bisect.bisect_left(range(count), row_id, key=record_id)
+    if position < count and record_id(position) == row_id:
+        return position
+    return None if exact else position
+
+
+def binary_array(records):
+    """
+    mmap.mmap -> numpy.ndarray
+
+    records is a map of a binary ledger
+
+    return a structured array viewing the records in place, without
+    copying them; records stays mapped while the array is in use
+    """
+    dtype = np.dtype(
+        {
+            "names": BINARY_FIELDS,
+            "formats": ["<i8", "<i8", "<i8", "<u8", "<u4", "<u4"],
+        }
+    )
+    return np.frombuffer(
+        records,
+        dtype=dtype,
+        count=binary_count(records),
+        offset=BINARY_RECORD.size,
+    )
+
+
+def binary_pack(ledger_file, records):
+    """
+    str, list of dict -> list of bytes
+
+    ledger_file is the name of the binary ledger file
+    records are dictionaries of "column_name": data
+
+    append the descriptions of records to the string heap, add any new
+    categories to the category names and return the binary records to
+    write; raise ValueError if a timestamp cannot be stored exactly
+    """
+    categories = read_sidecar(ledger_file, BINARY_CATEGORIES_SUFFIX) or []
+    codes = {category: code for code, category in enumerate(categories)}
+    heap_file = sidecar_filename(ledger_file, BINARY_HEAP_SUFFIX)
+    offset = os.path.getsize(heap_file)
+    packed, descriptions = [], []
+    for record in records:
+        timestamp = record[TIMESTAMP_COL]
+        epoch = timestamp_to_epoch(timestamp)
+        if epoch_to_timestamp(epoch) != timestamp:
+            raise ValueError(f"Cannot store timestamp exactly: {timestamp!r}")
+        description = record[DESCRIPTION_COL].encode()
+        packed.append(
+            BINARY_RECORD.pack(
+                int(record[ID_COL]),
+                epoch,
+                amount_to_cents(record[AMOUNT_COL]),
+                offset,
+                len(description),
+                codes.setdefault(record[CATEGORY_COL], len(codes)),
+            )
+        )
+        descriptions.append(description)
+        offset += len(description)
+
+    if len(codes) > len(categories):
+        write_sidecar(ledger_file, BINARY_CATEGORIES_SUFFIX, list(codes))
+    with open(heap_file, "ab") as hf:
+        hf.write(b"".join(descriptions))
+        hf.flush()
+        os.fsync(hf.fileno())
+    return packed
+
+
+def binary_create_ledger_file(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the binary ledger file
+
+    create an empty binary ledger
+    CAUTION: will overwrite the ledger file if it exists
+    """
+    with open(ledger_file, "wb") as lf:
+        lf.write(BINARY_MAGIC)
+    with open(sidecar_filename(ledger_file, BINARY_HEAP_SUFFIX), "wb"):
+        pass
+    write_sidecar(ledger_file, BINARY_CATEGORIES_SUFFIX, [])
+
+
+def binary_remove_ledger_file(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the binary ledger file
+
+    remove the binary ledger along with its string heap and category names
+    """
+    for suffix in ("", BINARY_HEAP_SUFFIX, BINARY_CATEGORIES_SUFFIX):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(sidecar_filename(ledger_file, suffix))
+
+
+def binary_view_balance(ledger_file):
+    """
+    str -> float
+
+    ledger_file is the name of the binary ledger file
+
+    return the balance of the ledger, summing the amount column in place
+    """
+    with binary_ledger(ledger_file) as (records, _, _):
+        if np is not None:
+            return int(binary_array(records)["cents"].sum()) / 100
+        size = BINARY_RECORD.size
+        words = size // 8
+        cents = BINARY_FIELDS.index("cents")
+        end = size * (binary_count(records) + 1)
+        with memoryview(records) as view:
+            # leave out a partial record left by an interrupted write
+            with view[size:end].cast("q") as column:
+                with column[cents::words] as amounts:
+                    return sum(amounts) / 100
+
+
+def binary_append_records(ledger_file, records):
+    """
+    str, list of dict -> None
+
+    ledger_file is the name of the binary ledger file
+    records are dictionaries of "column_name": data
+
+    add records to the end of the ledger with one write and one fsync;
+    raise ValueError if their IDs do not follow the last ID in the ledger
+    """
+    with LEDGER_LOCK:
+        last_id = binary_last_row_id(ledger_file)
+        for record in records:
+            if int(record[ID_COL]) <= last_id:
+                raise ValueError(
+                    f"Transaction ID {record[ID_COL]} is not after {last_id}"
+                )
+            last_id = int(record[ID_COL])
+        packed = binary_pack(ledger_file, records)
+        with open(ledger_file, "r+b") as lf:
+            size = os.fstat(lf.fileno()).st_size
+            # start over any partial record left by an interrupted write
+            lf.seek(size - size % BINARY_RECORD.size)
+            lf.write(b"".join(packed))
+            lf.truncate()
+            lf.flush()
+            os.fsync(lf.fileno())
+
+
+def binary_write_record(ledger_file, record):
+    """
+    str, dict -> None
+
+    ledger_file is the name of the binary ledger file
+    record is a dictionary of "column_name": data
+
+    add record to the end of the ledger
+    """
+    binary_append_records(ledger_file, [record])
+
+
+def binary_modify_transaction(
+    ledger_file, row_id, date, time, category, description, amount
+):
+    """
+    str, int, str, str, str, str, float-> None
+
+    ledger_file is the name of the binary ledger file
+    row_id is the ID of the transaction to modify
+    date is the date of the transaction
+    time is the time of the transaction
+    category is category of the transaction
+    description is a description of the transaction
+    amount is the amount of the transaction
+
+    overwrite the record at row_id in place, keeping the sign of its amount
+
+    the new description is appended to the string heap and synced before
+    the record pointing to it is written, so that a crash in between leaves
+    the old record and its description intact; the old description is left
+    unreferenced in the heap until the ledger is migrated to a new file
+    """
+    with LEDGER_LOCK:
+        with binary_ledger(ledger_file) as (records, _, _):
+            position = binary_position(records, row_id)
+            if position is None:
+                return
+            offset = BINARY_RECORD.size * (position + 1)
+            current = dict(
+                zip(BINARY_FIELDS, BINARY_RECORD.unpack_from(records, offset))
+            )
+        modified_row = {
+            ID_COL: row_id,
+            TIMESTAMP_COL: date + " " + time,
+            CATEGORY_COL: category,
+            DESCRIPTION_COL: description,
+            AMOUNT_COL: f"{-amount if current['cents'] < 0 else amount:.2f}",
+        }
+        (packed,) = binary_pack(ledger_file, [modified_row])
+        with open(ledger_file, "r+b") as lf:
+            lf.seek(offset)
+            lf.write(packed)
+            lf.flush()
+            os.fsync(lf.fileno())
+
+
+def binary_last_row_id(ledger_file):
+    """
+    str -> int
+
+    ledger_file is the name of the binary ledger file
+
+    return id of the last row in the ledger or 0 if there is none
+    """
+    if not file_exists(ledger_file):
+        return 0
+    with binary_ledger(ledger_file) as (records, _, _):
+        count = binary_count(records)
+        if not count:
+            return 0
+        offset = BINARY_RECORD.size * count
+        return BINARY_RECORD.unpack_from(records, offset)[0]
+
+
+def binary_is_valid_transaction_id(ledger_file, transaction_id):
+    """
+    str, int -> bool
+
+    ledger_file is the name of the binary ledger file
+    transaction_id is the id whose validity will be determined
+
+    return True if the ledger has a transaction with transaction_id
+    """
+    with binary_ledger(ledger_file) as (records, _, _):
+        return binary_position(records, transaction_id) is not None
+
+
+def binary_load_columns(ledger_file):
+    """
+    str -> dict
+
+    ledger_file is the name of the binary ledger file
+
+    return the ledger as load_columns does, with the ID, epoch and cents
+    columns viewing the mapped records in place
+    """
+    if np is None:
+        raise ImportError("load_columns requires numpy")
+    with open(ledger_file, "rb") as lf:
+        records = mmap.mmap(lf.fileno(), 0, access=mmap.ACCESS_READ)
+    table = binary_array(records)
+    with binary_ledger(ledger_file) as (_, heap, categories):
+        descriptions = [
+            heap[offset : offset + length].decode()
+            for offset, length in zip(
+                table["offset"].tolist(), table["length"].tolist()
+            )
+        ]
+    timestamps = np.datetime_as_string(table["epoch"].astype("datetime64[s]"))
+    return {
+        "names": list(COL_NAMES),
+        "ids": table["id"],
+        "epochs": table["epoch"],
+        "cents": table["cents"],
+        "debits": table["cents"] < 0,
+        "category_codes": table["category"].astype(np.int32),
+        "categories": categories,
+        "timestamps": np.char.replace(timestamps, "T", " ").tolist(),
+        "descriptions": descriptions,
+    }
+
+
+def binary_get_trans(ledger_file):
+    """
+    str -> list
+
+    ledger_file is the name of the binary ledger file
+
+    return every transaction in the ledger, in ID order
+    """
+    return binary_rows(ledger_file)
+
+
+def binary_read_page(ledger_file, first_id, count):
+    """
+    str, int, int -> list of dict
+
+    ledger_file is the name of the binary ledger file
+    first_id is the ID of the first transaction on the page
+    count is the number of transactions on the page
+
+    return count transactions starting at first_id
+    """
+    return binary_rows(ledger_file, first_id=first_id, count=count)
+
+
+def binary_category_transactions(ledger_file, category):
+    """
+    str, str -> list of dict
+
+    ledger_file is the name of the binary ledger file
+    category is the category to look up
+
+    return the transactions in category, comparing category numbers rather
+    than names
+    """
+    categories = read_sidecar(ledger_file, BINARY_CATEGORIES_SUFFIX) or []
+    if category not in categories:
+        return []
+    code = categories.index(category)
+    column = BINARY_FIELDS.index("category")
+    return binary_rows(ledger_file, lambda fields: fields[column] == code)
+
+
+def binary_date_range_transactions(ledger_file, start, end):
+    """
+    str, int, int -> list of dict
+
+    ledger_file is the name of the binary ledger file
+    start is the first epoch second of the range
+    end is the epoch second just after the range
+
+    return the transactions dated in [start, end), in ID order
+    """
+    column = BINARY_FIELDS.index("epoch")
+    return binary_rows(
+        ledger_file, lambda fields: start <= fields[column] < end
+    )
+
+
+def binary_description_transactions(
+    ledger_file, terms, match_all, ignore_case
+):
+    """
+    str, list of str, bool, bool -> list of dict
+
+    ledger_file is the name of the binary ledger file
+    terms are the keywords or phrases to search for
+    match_all is True to require every term and False to require any term
+    ignore_case is True to match terms regardless of case
+
+    return the transactions whose descriptions match terms, in ID order
+    """
+    return [
+        row
+        for row in binary_rows(ledger_file)
+        if description_matches(
+            row[DESCRIPTION_COL], terms, match_all, ignore_case
+        )
+    ]
+
+
+BINARY_BACKEND = {
+    "get_trans": binary_get_trans,
+    "view_balance": binary_view_balance,
+    "write_record": binary_write_record,
+    "append_records": binary_append_records,
+    "modify_transaction": binary_modify_transaction,
+    "last_row_id": binary_last_row_id,
+    "is_valid_transaction_id": binary_is_valid_transaction_id,
+    "read_page": binary_read_page,
+    "category_transactions": binary_category_transactions,
+    "date_range_transactions": binary_date_range_transactions,
+    "description_transactions": binary_description_transactions,
+    "create_ledger_file": binary_create_ledger_file,
+    "remove_ledger_file": binary_remove_ledger_file,
+    "load_columns": binary_load_columns,
+}
+
+
+def shard_filename(ledger_dir, period):
+    """
+    str, str -> str
+
+    ledger_dir is the name of the sharded ledger directory
+    period is the year (YYYY) or month (YYYY-MM) of the shard
+
+    return the name of the shard file for period
+    """
+    return os.path.join(ledger_dir, period + ".csv")
+
+
+def read_shard(ledger_dir, period):
+    """
+    str, str -> list of dict
+
+    ledger_dir is the name of the sharded ledger directory
+    period is the year (YYYY) or month (YYYY-MM) of the shard
+
+    return the transactions in the shard, in ID order
+    """
+    with open(shard_filename(ledger_dir, period)) as sf:
+        return [dict(row) for row in csv.DictReader(sf, skipinitialspace=True)]
+
+
+def summarize_shard(ledger_dir, period, rows):
+    """
+    str, str, list of dict -> dict
+
+    ledger_dir is the name of the sharded ledger directory
+    period is the year (YYYY) or month (YYYY-MM) of the shard
+    rows are the transactions in the shard
+
+    return the manifest entry of the shard: its ID range, time range
+    [start, end) in epoch seconds, row count, balance subtotal in cents
+    and the size and modification time its entry is valid for
+    """
+    ids = [int(row[ID_COL]) for row in rows]
+    epochs = [timestamp_to_epoch(row[TIMESTAMP_COL]) for row in rows]
+    stat = os.stat(shard_filename(ledger_dir, period))
+    return {
+        "first_id": min(ids),
+        "last_id": max(ids),
+        "start": min(epochs),
+        "end": max(epochs) + 1,
+        "rows": len(rows),
+        "cents": sum(amount_to_cents(row[AMOUNT_COL]) for row in rows),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def write_manifest(ledger_dir, manifest):
+    """
+    str, dict -> None
+
+    ledger_dir is the name of the sharded ledger directory
+    manifest is the manifest of the ledger
+
+    atomically replace the manifest of the ledger
+    """
+    replace_file(
+        os.path.join(ledger_dir, SHARD_MANIFEST_FILENAME),
+        json.dumps(manifest, indent=1, sort_keys=True),
+    )
+
+
+def shard_manifest(ledger_dir):
+    """
+    str -> dict
+
+    ledger_dir is the name of the sharded ledger directory
+
+    return the manifest of the ledger, a dictionary holding the shard
+    period and a dictionary of period: entry for each shard; entries of
+    shards changed since the manifest was written (e.g. by a write that
+    was interrupted) are recomputed, after finishing any move of a
+    transaction between shards that was interrupted
+    """
+    manifest_file = os.path.join(ledger_dir, SHARD_MANIFEST_FILENAME)
+    with open(manifest_file) as mf:
+        manifest = json.load(mf)
+    moving = manifest.pop("moving", None)
+    if moving:
+        finish_shard_move(ledger_dir, manifest, moving)
+
+    shards = {}
+    for filename in sorted(os.listdir(ledger_dir)):
+        period, extension = os.path.splitext(filename)
+        if extension != ".csv":
+            continue
+        entry = manifest["shards"].get(period)
+        stat = os.stat(os.path.join(ledger_dir, filename))
+        if entry is None or (entry["size"], entry["mtime_ns"]) != (
+            stat.st_size,
+            stat.st_mtime_ns,
+        ):
+            rows = read_shard(ledger_dir, period)
+            entry = rows and summarize_shard(ledger_dir, period, rows)
+        if entry:
+            shards[period] = entry
+    if moving or shards != manifest["shards"]:
+        manifest["shards"] = shards
+        write_manifest(ledger_dir, manifest)
+    return manifest
+
+
+def finish_shard_move(ledger_dir, manifest, moving):
+    """
+    str, dict, dict -> None
+
+    ledger_dir is the name of the sharded ledger directory
+    manifest is the manifest of the ledger
+    moving is the move recorded in the manifest: the "id" of the
+    transaction and the periods it was moving "from" and "to"
+
+    remove the transaction from the shard it was moving from if the shard
+    it was moving to already holds it, so that no ID is left in two shards;
+    otherwise the move never happened and the transaction stays where it
+    was
+    """
+    row_id = str(moving["id"])
+    try:
+        moved = read_shard(ledger_dir, moving["to"])
+        rows = read_shard(ledger_dir, moving["from"])
+    except FileNotFoundError:
+        return
+    if all(row[ID_COL] != row_id for row in moved):
+        return
+    kept = [row for row in rows if row[ID_COL] != row_id]
+    if len(kept) != len(rows):
+        rewrite_shard(ledger_dir, manifest, moving["from"], kept)
+
+
+def shard_period(manifest, timestamp):
+    """
+    dict, str -> str
+
+    manifest is the manifest of the sharded ledger
+    timestamp is the timestamp of a transaction
+
+    return the period of the shard holding transactions at timestamp;
+    raise ValueError if timestamp is not valid
+    """
+    timestamp_to_epoch(timestamp)
+    return timestamp[: SHARD_PERIOD_LENGTHS[manifest["period"]]]
+
+
+def sharded_rows(ledger_dir, keep=None, keep_shard=None):
+    """
+    str, function, function -> list of dict
+
+    ledger_dir is the name of the sharded ledger directory
+    keep is called with each transaction and returns True to include it
+    (every transaction is included if None)
+    keep_shard is called with the manifest entry of each shard and returns
+    False to skip the shard without opening it (no shard is skipped if
+    None)
+
+    return the transactions kept, in ID order
+    """
+    with LEDGER_LOCK:
+        shards = shard_manifest(ledger_dir)["shards"]
+        rows = [
+            [
+                row
+                for row in read_shard(ledger_dir, period)
+                if keep is None or keep(row)
+            ]
+            for period, entry in shards.items()
+            if keep_shard is None or keep_shard(entry)
+        ]
+    return list(heapq.merge(*rows, key=lambda row: int(row[ID_COL])))
+
+
+def sharded_find(ledger_dir, manifest, row_id):
+    """
+    str, dict, int -> str, list of dict, int
+
+    ledger_dir is the name of the sharded ledger directory
+    manifest is the manifest of the ledger
+    row_id is the ID to look up
+
+    return the period of the shard holding row_id, the transactions in
+    that shard and the position of row_id among them, or None if there is
+    no such transaction; only shards whose ID range covers row_id are read
+    """
+    for period, entry in manifest["shards"].items():
+        if entry["first_id"] <= row_id <= entry["last_id"]:
+            rows = read_shard(ledger_dir, period)
+            for position, row in enumerate(rows):
+                if int(row[ID_COL]) == row_id:
+                    return period, rows, position
+    return None
+
+
+def rewrite_shard(ledger_dir, manifest, period, rows):
+    """
+    str, dict, str, list of dict -> None
+
+    ledger_dir is the name of the sharded ledger directory
+    manifest is the manifest of the ledger, updated for the new shard
+    period is the year (YYYY) or month (YYYY-MM) of the shard
+    rows are the transactions of the shard, in ID order
+
+    atomically replace the shard for period with rows, removing the shard
+    if rows is empty
+    """
+    shard_file = shard_filename(ledger_dir, period)
+    if not rows:
+        os.remove(shard_file)
+        del manifest["shards"][period]
+        return
+    with atomic_write(shard_file) as sf:
+        writer = csv.DictWriter(sf, COL_NAMES)
+        writer.writeheader()
+        writer.writerows(rows)
+    manifest["shards"][period] = summarize_shard(ledger_dir, period, rows)
+
+
+def sharded_create_ledger_file(ledger_dir):
+    """
+    str -> None
+
+    ledger_dir is the name of the sharded ledger directory
+
+    create an empty sharded ledger with shards of SHARD_PERIOD
+    CAUTION: will overwrite the ledger directory if it exists
+    """
+    sharded_remove_ledger_file(ledger_dir)
+    os.makedirs(ledger_dir)
+    write_manifest(ledger_dir, {"period": SHARD_PERIOD, "shards": {}})
+
+
+def sharded_file_exists(ledger_dir):
+    """
+    str -> bool
+
+    ledger_dir is the name of the sharded ledger directory
+
+    return True if the sharded ledger directory exists; otherwise, False
+    """
+    return os.path.isdir(ledger_dir)
+
+
+def sharded_remove_ledger_file(ledger_dir):
+    """
+    str -> None
+
+    ledger_dir is the name of the sharded ledger directory
+
+    remove the sharded ledger directory with its shards and manifest
+    """
+    with contextlib.suppress(FileNotFoundError):
+        shutil.rmtree(ledger_dir)
+
+
+def sharded_get_trans(ledger_dir):
+    """
+    str -> list
+
+    ledger_dir is the name of the sharded ledger directory
+
+    return every transaction in the ledger, in ID order
+    """
+    return sharded_rows(ledger_dir)
+
+
+def sharded_view_balance(ledger_dir):
+    """
+    str -> float
+
+    ledger_dir is the name of the sharded ledger directory
+
+    return the balance of the ledger, the sum of the shard subtotals
+    """
+    with LEDGER_LOCK:
+        shards = shard_manifest(ledger_dir)["shards"]
+    return sum(entry["cents"] for entry in shards.values()) / 100
+
+
+def sharded_append_records(ledger_dir, records):
+    """
+    str, list of dict -> None
+
+    ledger_dir is the name of the sharded ledger directory
+    records are dictionaries of "column_name": data
+
+    append records to the shards for their timestamps, with one write and
+    one fsync per shard, and update the manifest once
+    """
+    with LEDGER_LOCK:
+        manifest = shard_manifest(ledger_dir)
+        by_period = {}
+        for record in records:
+            period = shard_period(manifest, record[TIMESTAMP_COL])
+            by_period.setdefault(period, []).append(record)
+
+        for period, period_records in by_period.items():
+            shard_file = shard_filename(ledger_dir, period)
+            is_new_shard = not file_exists(shard_file)
+            with open(shard_file, "a") as sf:
+                writer = csv.DictWriter(sf, COL_NAMES)
+                if is_new_shard:
+                    writer.writeheader()
+                writer.writerows(period_records)
+                sf.flush()
+                os.fsync(sf.fileno())
+            entry = summarize_shard(ledger_dir, period, period_records)
+            previous = manifest["shards"].get(period)
+            if previous:
+                for key, combine in (
+                    ("first_id", min),
+                    ("last_id", max),
+                    ("start", min),
+                    ("end", max),
+                ):
+                    entry[key] = combine(entry[key], previous[key])
+                entry["rows"] += previous["rows"]
+                entry["cents"] += previous["cents"]
+            manifest["shards"][period] = entry
+        write_manifest(ledger_dir, manifest)
+
+
+def sharded_write_record(ledger_dir, record):
+    """
+    str, dict -> None
+
+    ledger_dir is the name of the sharded ledger directory
+    record is a dictionary of "column_name": data
+
+    append record to the shard for its timestamp
+    """
+    sharded_append_records(ledger_dir, [record])
+
+
+def sharded_modify_transaction(
+    ledger_dir, row_id, date, time, category, description, amount
+):
+    """
+    str, int, str, str, str, str, float-> None
+
+    ledger_dir is the name of the sharded ledger directory
+    row_id is the ID of the transaction to modify
+    date is the date of the transaction
+    time is the time of the transaction
+    category is category of the transaction
+    description is a description of the transaction
+    amount is the amount of the transaction
+
+    rewrite the shard holding row_id, keeping the sign of its amount, and
+    move the transaction to another shard if its period changes; no other
+    shard is touched
+
+    a move is recorded in the manifest before either shard is rewritten
+    and cleared once both are, so that shard_manifest can finish a move
+    that was interrupted
+    """
+    with LEDGER_LOCK:
+        manifest = shard_manifest(ledger_dir)
+        found = sharded_find(ledger_dir, manifest, row_id)
+        if found is None:
+            return
+        period, rows, position = found
+
+        modified_row = {
+            ID_COL: str(row_id),
+            TIMESTAMP_COL: date + " " + time,
+            CATEGORY_COL: category,
+            DESCRIPTION_COL: description,
+        }
+        if rows[position][AMOUNT_COL][0] == "-":
+            modified_row[AMOUNT_COL] = f"{-1 * amount:.2f}"
+        else:
+            modified_row[AMOUNT_COL] = f"{amount:.2f}"
+
+        new_period = shard_period(manifest, modified_row[TIMESTAMP_COL])
+        if new_period == period:
+            rows[position] = modified_row
+        else:
+            manifest["moving"] = {
+                "id": row_id,
+                "from": period,
+                "to": new_period,
+            }
+            write_manifest(ledger_dir, manifest)
+            del manifest["moving"]
+            del rows[position]
+            new_rows = []
+            if new_period in manifest["shards"]:
+                new_rows = read_shard(ledger_dir, new_period)
+            ids = [int(row[ID_COL]) for row in new_rows]
+            new_rows.insert(bisect.bisect(ids, row_id), modified_row)
+            rewrite_shard(ledger_dir, manifest, new_period, new_rows)
+        rewrite_shard(ledger_dir, manifest, period, rows)
+        write_manifest(ledger_dir, manifest)
+
+
+def sharded_last_row_id(ledger_dir):
+    """
+    str -> int
+
+    ledger_dir is the name of the sharded ledger directory
+
+    return id of the last row in the ledger or 0 if there is none
+    """
+    if not file_exists(ledger_dir):
+        return 0
+    with LEDGER_LOCK:
+        shards = shard_manifest(ledger_dir)["shards"]
+    return max((entry["last_id"] for entry in shards.values()), default=0)
+
+
+def sharded_is_valid_transaction_id(ledger_dir, transaction_id):
+    """
+    str, int -> bool
+
+    ledger_dir is the name of the sharded ledger directory
+    transaction_id is the id whose validity will be determined
+
+    return True if the ledger has a transaction with transaction_id
+    """
+    with LEDGER_LOCK:
+        manifest = shard_manifest(ledger_dir)
+        return sharded_find(ledger_dir, manifest, transaction_id) is not None
+
+
+def sharded_read_page(ledger_dir, first_id, count):
+    """
+    str, int, int -> list of dict
+
+    ledger_dir is the name of the sharded ledger directory
+    first_id is the ID of the first transaction on the page
+    count is the number of transactions on the page
+
+    return count transactions starting at first_id, skipping shards whose
+    IDs all come before first_id
+    """
+    rows = sharded_rows(
+        ledger_dir,
+        lambda row: int(row[ID_COL]) >= first_id,
+        lambda entry: entry["last_id"] >= first_id,
+    )
+    return rows[:count]
+
+
+def sharded_category_transactions(ledger_dir, category):
+    """
+    str, str -> list of dict
+
+    ledger_dir is the name of the sharded ledger directory
+    category is the category to look up
+
+    return the transactions in category, in ID order
+    """
+    return sharded_rows(ledger_dir, lambda row: row[CATEGORY_COL] == category)
+
+
+def sharded_date_range_transactions(ledger_dir, start, end):
+    """
+    str, int, int -> list of dict
+
+    ledger_dir is the name of the sharded ledger directory
+    start is the first epoch second of the range
+    end is the epoch second just after the range
+
+    return the transactions dated in [start, end), in ID order, opening
+    only the shards whose time range overlaps it
+    """
+    return sharded_rows(
+        ledger_dir,
+        lambda row: start <= timestamp_to_epoch(row[TIMESTAMP_COL]) < end,
+        lambda entry: entry["start"] < end and start < entry["end"],
+    )
+
+
+def sharded_description_transactions(
+    ledger_dir, terms, match_all, ignore_case
+):
+    """
+    str, list of str, bool, bool -> list of dict
+
+    ledger_dir is the name of the sharded ledger directory
+    terms are the keywords or phrases to search for
+    match_all is True to require every term and False to require any term
+    ignore_case is True to match terms regardless of case
+
+    return the transactions whose descriptions match terms, in ID order
+    """
+    return sharded_rows(
+        ledger_dir,
+        lambda row: description_matches(
+            row[DESCRIPTION_COL], terms, match_all, ignore_case
+        ),
+    )
+
+
+SHARDED_BACKEND = {
+    "get_trans": sharded_get_trans,
+    "view_balance": sharded_view_balance,
+    "write_record": sharded_write_record,
+    "append_records": sharded_append_records,
+    "modify_transaction": sharded_modify_transaction,
+    "last_row_id": sharded_last_row_id,
+    "is_valid_transaction_id": sharded_is_valid_transaction_id,
+    "read_page": sharded_read_page,
+    "category_transactions": sharded_category_transactions,
+    "date_range_transactions": sharded_date_range_transactions,
+    "description_transactions": sharded_description_transactions,
+    "create_ledger_file": sharded_create_ledger_file,
+    "remove_ledger_file": sharded_remove_ledger_file,
+    "file_exists": sharded_file_exists,
+}
+
+
+SQLITE_BACKEND = {
+    "get_trans": sqlite_get_trans,
+    "view_balance": sqlite_view_balance,
+    "write_record": sqlite_write_record,
+    "append_records": sqlite_append_records,
+    "modify_transaction": sqlite_modify_transaction,
+    "last_row_id": sqlite_last_row_id,
+    "is_valid_transaction_id": sqlite_is_valid_transaction_id,
+    "read_page": sqlite_read_page,
+    "category_transactions": sqlite_category_transactions,
+    "date_range_transactions": sqlite_date_range_transactions,
+    "description_transactions": sqlite_description_transactions,
+    "create_ledger_file": sqlite_create_ledger_file,
+    "remove_ledger_file": sqlite_remove_ledger_file,
+}
+
+# storage backend of ledger files by extension; any other ledger file is
+# CSV, handled by the functions above
+LEDGER_BACKENDS = {
+    ".bin": BINARY_BACKEND,
+    ".shards": SHARDED_BACKEND,
+    ".db": SQLITE_BACKEND,
+    ".sqlite": SQLITE_BACKEND,
+    ".sqlite3": SQLITE_BACKEND,
+}
+
+
+def ledger_backend(ledger_file):
+    """
+    str -> dict
+
+    ledger_file is the name of the ledger file
+
+    return the storage backend functions for ledger_file by name, or None
+    for a CSV ledger
+    """
+    return LEDGER_BACKENDS.get(os.path.splitext(ledger_file)[1].lower())
+
+
+def finish_archive(ledger_file):
+    """
+    str -> str
+
+    ledger_file is the name of a CSV ledger file
+
+    move the ledger's pending archive into place if the ledger has been
+    rewritten without the rows it archived, i.e. if archive_ledger was
+    interrupted between rewriting the ledger and renaming the archive; a
+    pending archive whose rows are still in the ledger is left alone
+
+    return the name of the archive file to read, which is the pending
+    archive itself if it cannot be renamed (e.g. in a read-only directory)
+    """
+    archive_file = sidecar_filename(ledger_file, ARCHIVE_SUFFIX)
+    pending_file = sidecar_filename(ledger_file, ARCHIVE_PENDING_SUFFIX)
+    try:
+        index, af = read_archive(pending_file)
+    except FileNotFoundError:
+        return archive_file
+    af.close()
+    with open(ledger_file, newline="") as lf:
+        reader = csv.reader(lf, skipinitialspace=True)
+        names = next(reader, None) or COL_NAMES
+        first = next((row for row in reader if row), None)
+    if first and int(first[names.index(ID_COL)]) <= (
+        index["blocks"][-1]["last_id"]
+    ):
+        return archive_file
+    try:
+        os.replace(pending_file, archive_file)
+    except FileNotFoundError:
+        # another reader moved it first
+        pass
+    except OSError:
+        return pending_file
+    return archive_file
+
+
+def open_archive(ledger_file):
+    """
+    str -> dict, file or None, None
+
+    ledger_file is the name of a CSV ledger file
+
+    return the index of the ledger's archive, a dictionary holding the
+    footer of each block, in ID order, and the rollups of the archived
+    transactions, and the archive opened in binary mode, whose blocks can
+    be read even after the archive is replaced; or None, None if the
+    ledger has no archive
+    """
+    try:
+        return read_archive(finish_archive(ledger_file))
+    except FileNotFoundError:
+        return None, None
+
+
+def read_archive(archive_file):
+    """
+    str -> dict, file
+
+    archive_file is the name of an archive file
+
+    return the index of the archive and the archive opened in binary mode;
+    raise FileNotFoundError if there is no such file and ValueError if it
+    is not a complete archive
+    """
+    af = open(archive_file, "rb")
+    try:
+        trailer_size = ARCHIVE_TRAILER.size + len(ARCHIVE_MAGIC)
+        af.seek(0, os.SEEK_END)
+        if af.tell() < len(ARCHIVE_MAGIC) + trailer_size:
+            raise ValueError(f"Not a ledger archive: {archive_file!r}")
+        af.seek(-trailer_size, os.SEEK_END)
+        (length,) = ARCHIVE_TRAILER.unpack(af.read(ARCHIVE_TRAILER.size))
+        if af.read() != ARCHIVE_MAGIC:
+            raise ValueError(f"Not a ledger archive: {archive_file!r}")
+        af.seek(-(trailer_size + length), os.SEEK_END)
+        return json.loads(af.read(length)), af
+    except BaseException:
+        af.close()
+        raise
+
+
+def archive_index(ledger_file):
+    """
+    str -> dict or None
+
+    ledger_file is the name of a CSV ledger file
+
+    return the index of the ledger's archive, as open_archive returns it,
+    or None if the ledger has no archive
+    """
+    index, af = open_archive(ledger_file)
+    if af is not None:
+        af.close()
+    return index
+
+
+def archived_last_id(ledger_file):
+    """
+    str -> int
+
+    ledger_file is the name of a CSV ledger file
+
+    return the ID of the last archived transaction or 0 if none are
+    """
+    index = archive_index(ledger_file)
+    return index["blocks"][-1]["last_id"] if index and index["blocks"] else 0
+
+
+def archived_cents(ledger_file):
+    """
+    str -> int
+
+    ledger_file is the name of a CSV ledger file
+
+    return the total of the archived transactions in cents, read from the
+    footers of the archive's blocks
+    """
+    index = archive_index(ledger_file)
+    return sum(footer["cents"] for footer in index["blocks"]) if index else 0
+
+
+def write_archive_block(af, rows, codec):
+    """
+    file, list of dict, str -> dict
+
+    af is the archive being written, opened in binary mode
+    rows are the transactions of the block, in ID order
+    codec is the name of the compression, one of ARCHIVE_CODECS
+
+    compress rows into a block at the end of af
+
+    return the footer of the block: its offset and length in af, codec, ID
+    range, time range [start, end) in epoch seconds, row count, balance
+    subtotal in cents and the categories of its transactions
+    """
+    text = io.StringIO(newline="")
+    csv.writer(text).writerows(
+        [row[name] for name in COL_NAMES] for row in rows
+    )
+    data = ARCHIVE_CODECS[codec][0](text.getvalue().encode("utf-8"))
+    offset = af.tell()
+    af.write(data)
+    epochs = [timestamp_to_epoch(row[TIMESTAMP_COL]) for row in rows]
+    return {
+        "offset": offset,
+        "length": len(data),
+        "codec": codec,
+        "first_id": int(rows[0][ID_COL]),
+        "last_id": int(rows[-1][ID_COL]),
+        "start": min(epochs),
+        "end": max(epochs) + 1,
+        "rows": len(rows),
+        "cents": sum(amount_to_cents(row[AMOUNT_COL]) for row in rows),
+        "categories": sorted({row[CATEGORY_COL] for row in rows}),
+    }
+
+
+def read_archive_block(af, footer):
+    """
+    file, dict -> list of dict
+
+    af is the archive, opened in binary mode
+    footer is the footer of the block to read
+
+    return the transactions of the block, in ID order
+    """
+    af.seek(footer["offset"])
+    data = ARCHIVE_CODECS[footer["codec"]][1](af.read(footer["length"]))
+    text = io.StringIO(data.decode("utf-8"), newline="")
+    return [dict(zip(COL_NAMES, fields)) for fields in csv.reader(text)]
+
+
+def stream_archive(ledger_file, keep_block=None):
+    """
+    str, function -> iterator of dict
+
+    ledger_file is the name of a CSV ledger file
+    keep_block is called with the footer of each block and returns False
+    to skip the block without decompressing it (no block is skipped if
+    None)
+
+    yield the archived transactions of the blocks kept, in ID order,
+    decompressing one block at a time
+    """
+    index, af = open_archive(ledger_file)
+    if af is None:
+        return
+    with af:
+        yield from archive_blocks(index, af, keep_block)
+
+
+def archive_blocks(index, af, keep_block=None):
+    """
+    dict, file, function -> iterator of dict
+
+    index and af are the index and file of an archive, as open_archive
+    returns them
+    keep_block is passed on from stream_archive
+
+    yield the archived transactions of the blocks kept, in ID order
+    """
+    for footer in index["blocks"]:
+        if keep_block is None or keep_block(footer):
+            yield from read_archive_block(af, footer)
+
+
+def archived_rows(ledger_file, keep=None, keep_block=None):
+    """
+    str, function, function -> list of dict
+
+    ledger_file is the name of a CSV ledger file
+    keep is called with each archived transaction and returns True to
+    include it (every transaction is included if None)
+    keep_block is passed on to stream_archive
+
+    return the archived transactions kept, in ID order
+    """
+    return [
+        row
+        for row in stream_archive(ledger_file, keep_block)
+        if keep is None or keep(row)
+    ]
+
+
+def archive_block_matches(footer, categories=None, start=None, end=None):
+    """
+    dict, set of str, int, int -> bool
+
+    footer is the footer of an archive block
+    categories are the categories wanted (any if None)
+    start is the first epoch second wanted (no limit if None)
+    end is the epoch second just after those wanted (no limit if None)
+
+    return False if no transaction of the block can be wanted
+    """
+    return (
+        (not categories or not categories.isdisjoint(footer["categories"]))
+        and (start is None or footer["end"] > start)
+        and (end is None or footer["start"] < end)
+    )
+
+
+def archive_ledger(ledger_file, before, codec=None):
+    """
+    str, str, str -> int
+
+    ledger_file is the name of a CSV ledger file
+    before is the date or period (YYYY, YYYY-MM or YYYY-MM-DD) at which
+    the history to keep in the ledger starts
+    codec is the compression of the new blocks, one of ARCHIVE_CODECS
+    (ARCHIVE_CODEC if None)
+
+    fold the change log into the ledger, then move the transactions from
+    the start of the ledger up to the first one dated on or after before
+    into new blocks at the end of the ledger's archive; archived
+    transactions are still read by get_trans, searches and view_balance,
+    but can no longer be modified
+
+    the new archive is written next to the old one as a pending archive,
+    then the ledger is rewritten and then the pending archive is renamed;
+    if this is interrupted, readers either still see the old archive and
+    the whole ledger, or finish the rename themselves (see finish_archive)
+
+    return the number of transactions archived
+    """
+    if ledger_backend(ledger_file):
+        raise ValueError("only CSV ledgers can be archived")
+    codec = codec or ARCHIVE_CODEC
+    if codec not in ARCHIVE_CODECS:
+        raise ValueError(f"unknown archive codec {codec!r}")
+    cutoff, _ = period_bounds(before)
+    archive_file = sidecar_filename(ledger_file, ARCHIVE_SUFFIX)
+    pending_file = sidecar_filename(ledger_file, ARCHIVE_PENDING_SUFFIX)
+
+    with ledger_lock(ledger_file):
+        compact_ledger(ledger_file)
+        index = archive_index(ledger_file) or {
+            "blocks": [],
+            "rollups": {kind: {} for kind in ROLLUP_KINDS},
+        }
+        last_id = archived_last_id(ledger_file)
+        count = 0
+        with atomic_write(pending_file, "wb") as af:
+            if index["blocks"]:
+                # the blocks already archived are copied as they are
+                end = index["blocks"][-1]["offset"]
+                end += index["blocks"][-1]["length"]
+                with open(archive_file, "rb") as old:
+                    while af.tell() < end:
+                        af.write(old.read(min(end - af.tell(), 1 << 20)))
+            else:
+                af.write(ARCHIVE_MAGIC)
+
+            with open(ledger_file) as lf:
+                block = []
+                for row in csv.DictReader(lf, skipinitialspace=True):
+                    if int(row[ID_COL]) <= last_id:
+                        continue
+                    if timestamp_to_epoch(row[TIMESTAMP_COL]) >= cutoff:
+                        break
+                    block.append(row)
+                    add_to_rollups(
+                        index["rollups"],
+                        row[TIMESTAMP_COL],
+                        row[CATEGORY_COL],
+                        amount_to_cents(row[AMOUNT_COL]),
+                    )
+                    if len(block) == ARCHIVE_BLOCK_ROWS:
+                        index["blocks"].append(
+                            write_archive_block(af, block, codec)
+                        )
+                        count += len(block)
+                        block = []
+                if block:
+                    index["blocks"].append(
+                        write_archive_block(af, block, codec)
+                    )
+                    count += len(block)
+
+            data = json.dumps(index).encode("utf-8")
+            af.write(data)
+            af.write(ARCHIVE_TRAILER.pack(len(data)))
+            af.write(ARCHIVE_MAGIC)
+
+        if not count:
+            os.remove(pending_file)
+            return 0
+        last_id = index["blocks"][-1]["last_id"]
+        with open(ledger_file) as lf, atomic_write(ledger_file) as tf:
+            writer = csv.writer(tf)
+            writer.writerow(COL_NAMES)
+            writer.writerows(
+                [row[name] for name in COL_NAMES]
+                for row in csv.DictReader(lf, skipinitialspace=True)
+                if int(row[ID_COL]) > last_id
+            )
+        finish_archive(ledger_file)
+        # the checkpoint and indexes refer to rows that have moved
+        for suffix in (BALANCE_SUFFIX, *INDEX_REFRESHERS):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(sidecar_filename(ledger_file, suffix))
+        return count
+
+
+def migrate_ledger(source_file, target_file):
+    """
+    str, str -> int
+
+    source_file is the name of the ledger file to copy
+    target_file is the name of the ledger file to create, of any backend
+
+    copy every transaction of source_file, with its modifications applied,
+    into a new ledger target_file, e.g. to convert a CSV ledger to a
+    binary one or back; raise FileExistsError rather than overwrite an
+    existing target_file, and ValueError, leaving no target_file, if
+    target_file cannot hold the transactions exactly
+
+    return the number of transactions copied
+    """
+    if file_exists(target_file):
+        raise FileExistsError(f"Ledger file already exists: {target_file!r}")
+    records = get_trans(source_file)
+    create_ledger_file(target_file)
+    try:
+        if records:
+            append_records(target_file, records)
+    except BaseException:
+        remove_ledger_file(target_file)
+        raise
+    return len(records)
+
+
+def find_ledgers(sources):
+    """
+    list of str -> list of str
+
+    sources are ledger files, directories of ledger files and glob
+    patterns (e.g., "accounts/*.csv")
+
+    return the ledger files of sources, in order and without duplicates;
+    in directories and glob matches, only files ending in .csv or in the
+    extension of a backend count as ledgers, so that sidecars are skipped;
+    raise FileNotFoundError if a source names no ledger
+    """
+    extensions = (".csv", *LEDGER_BACKENDS)
+    ledger_files = {}
+    for source in sources:
+        if os.path.isdir(source) and not ledger_backend(source):
+            matches = sorted(
+                os.path.join(source, name) for name in os.listdir(source)
+            )
+        elif glob.has_magic(source):
+            matches = sorted(glob.glob(source))
+        elif file_exists(source):
+            ledger_files[source] = None
+            continue
+        else:
+            matches = []
+        matches = [
+            match
+            for match in matches
+            if os.path.splitext(match)[1].lower() in extensions
+        ]
+        if not matches:
+            raise FileNotFoundError(f"No ledger files in {source!r}")
+        ledger_files.update(dict.fromkeys(matches))
+    return list(ledger_files)
+
+
+def transaction_stats(transactions):
+    """
+    iterable of Transaction -> dict
+
+    transactions are the transactions to summarize
+
+    return the number of transactions, the number and total cents of the
+    credits and of the debits, and the balance in cents
+    """
+    stats = {
+        "count": 0,
+        "credits": 0,
+        "credit_cents": 0,
+        "debits": 0,
+        "debit_cents": 0,
+        "cents": 0,
+    }
+    for transaction in transactions:
+        if transaction.cents < 0:
+            stats["debits"] += 1
+            stats["debit_cents"] += transaction.cents
+        else:
+            stats["credits"] += 1
+            stats["credit_cents"] += transaction.cents
+    stats["count"] = stats["credits"] + stats["debits"]
+    stats["cents"] = stats["credit_cents"] + stats["debit_cents"]
+    return stats
+
+
+def account_stats(ledger_file):
+    """
+    str -> dict
+
+    ledger_file is the name of the ledger file of an account
+
+    return the transaction_stats of the account; run in a worker of
+    consolidate_ledgers
+    """
+    return transaction_stats(get_transactions(ledger_file))
+
+
+def account_history(ledger_file, run_dir):
+    """
+    str, str -> str, dict
+
+    ledger_file is the name of the ledger file of an account
+    run_dir is the directory to write the account's history to
+
+    write the transactions of the account in timestamp order (ties in ID
+    order) to a CSV file in run_dir, so that the consolidated history is
+    merged from disk rather than from every account held in memory; run in
+    a worker of consolidate_ledgers
+
+    return the name of the file and the transaction_stats of the account
+    """
+    transactions = get_transactions(ledger_file)
+    transactions.sort(key=lambda t: (t.epoch, t.id))
+    with tempfile.NamedTemporaryFile(
+        "w", dir=run_dir, suffix=".csv", newline="", delete=False
+    ) as rf:
+        csv.writer(rf).writerows(transactions)
+    return rf.name, transaction_stats(transactions)
+
+
+def read_history_run(run_file):
+    """
+    str -> iterator of Transaction
+
+    run_file is a file written by account_history
+
+    yield the transactions of the file, in the order they were written
+    """
+    with open(run_file, newline="") as rf:
+        for row_id, epoch, category, description, cents in csv.reader(rf):
+            yield Transaction(
+                int(row_id), int(epoch), category, description, int(cents)
+            )
+
+
+def format_account_transaction(account, transaction):
+    """
+    str, Transaction -> str
+
+    account is the name of the transaction's account
+    transaction is the transaction
+
+    return the lines of the transaction in the consolidated history, i.e.
+    format_transaction's with the account in front
+    """
+    separator, row = format_transaction(transaction).split("\n", 1)
+    return (
+        f"{'-'*ACCOUNT_WIDTH}|{separator}\n"
+        f"{account[:ACCOUNT_WIDTH]:<{ACCOUNT_WIDTH}}|{row}"
+    )
+
+
+def format_account_stats(account, stats):
+    """
+    str, dict -> str
+
+    account is the name of an account, or of all of them
+    stats are returned by transaction_stats
+
+    return the line of the account in the consolidated statistics
+    """
+    return (
+        f"{account[:ACCOUNT_WIDTH]:<{ACCOUNT_WIDTH}}|{stats['count']:<10}|"
+        f"{stats['credits']:<10}|${stats['credit_cents'] / 100:<14,.2f}|"
+        f"{stats['debits']:<10}|${stats['debit_cents'] / 100:<14,.2f}|"
+        f"${stats['cents'] / 100:<14,.2f}"
+    )
+
+
+def account_results(ledger_files, futures, failed):
+    """
+    list of str, list of concurrent.futures.Future, list -> iterator
+
+    ledger_files are the ledger files of the accounts
+    futures are loading the ledger files, in the same order
+    failed is the list to add the ledger files that could not be loaded to
+
+    yield the name of each account and the result of its future, in
+    order, as soon as the future is done; the ledger files that could not
+    be loaded are reported on stderr and added to failed instead
+    """
+    for ledger_file, future in zip(ledger_files, futures):
+        try:
+            result = future.result()
+        except LOAD_ERRORS as error:
+            print(f"Cannot load {ledger_file}: {error!r}", file=sys.stderr)
+            failed.append(ledger_file)
+            continue
+        account = os.path.basename(os.path.normpath(ledger_file))
+        yield os.path.splitext(account)[0], result
+
+
+def consolidate_ledgers(
+    ledger_files, history=False, processes=False, workers=None
+):
+    """
+    list of str, bool, bool, int -> dict, list of str
+
+    ledger_files are the ledger files of the accounts, of any backend
+    history is True to print the transactions of every account, merged in
+    timestamp order, before the statistics
+    processes is True to load the ledgers in worker processes, which parse
+    in parallel, rather than threads, which only overlap their reads
+    workers is the number of ledgers loaded at once (CONSOLIDATE_WORKERS
+    if None)
+
+    print the statistics of each account as soon as it and the accounts
+    before it are loaded, then those of all the accounts; only the
+    statistics are kept in memory; with history, each account's history is
+    sorted into a temporary file, and the files are merged and formatted
+    one transaction at a time
+
+    return the statistics of all the accounts loaded and the ledger files
+    that could not be loaded
+    """
+    if processes:
+        executor_type = process_pool
+    else:
+        executor_type = concurrent.futures.ThreadPoolExecutor
+    combined = transaction_stats(())
+    accounts = 0
+    failed = []
+    with contextlib.ExitStack() as stack:
+        if history:
+            # entered first so that it outlives the workers writing to it
+            run_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        executor = stack.enter_context(
+            executor_type(workers or CONSOLIDATE_WORKERS)
+        )
+        if history:
+            futures = [
+                executor.submit(account_history, f, run_dir)
+                for f in ledger_files
+            ]
+        else:
+            futures = [executor.submit(account_stats, f) for f in ledger_files]
+        results = account_results(ledger_files, futures, failed)
+        if history:
+            runs = list(results)
+            print(
+                f"\n{'Account':<{ACCOUNT_WIDTH}}|{ID_COL:<4}|"
+                f"{TIMESTAMP_COL:<20}|{CATEGORY_COL:<20}|"
+                f"{DESCRIPTION_COL:<50}|{AMOUNT_COL:<15}"
+            )
+            merged = heapq.merge(
+                *(
+                    zip(itertools.repeat(account), read_history_run(run))
+                    for account, (run, _) in runs
+                ),
+                key=lambda item: (item[1].epoch, item[1].id),
+            )
+            write_lines(
+                format_account_transaction(*item) for item in merged
+            )
+            results = ((account, stats) for account, (_, stats) in runs)
+
+        print(
+            f"\n{'Account':<{ACCOUNT_WIDTH}}|{'Count':<10}|{'Credits':<10}|"
+            f"{'Credit Total':<15}|{'Debits':<10}|{'Debit Total':<15}|"
+            f"{'Balance':<15}\n"
+            f"{'-'*ACCOUNT_WIDTH}|{'-'*10}|{'-'*10}|{'-'*15}|{'-'*10}|"
+            f"{'-'*15}|{'-'*15}"
+        )
+        for account, stats in results:
+            print(format_account_stats(account, stats), flush=True)
+            accounts += 1
+            for key, value in stats.items():
+                combined[key] += value
+    print(
+        f"{'-'*ACCOUNT_WIDTH}|{'-'*10}|{'-'*10}|{'-'*15}|{'-'*10}|"
+        f"{'-'*15}|{'-'*15}\n"
+        + format_account_stats(f"{accounts} accounts", combined)
+    )
+    return combined, failed
+
+
+def last_line(lf):
+    """
+    file -> int, bytes
+
+    lf is a file opened in binary mode
+
+    return the offset and contents of the last non-blank line of lf, found
+    by reading backwards from the end of the file
+    """
+    end = lf.seek(0, os.SEEK_END)
+    pos = end
+    block = b""
+    while pos > 0:
+        step = min(TAIL_BLOCK_SIZE, pos)
+        pos -= step
+        lf.seek(pos)
+        block = lf.read(step) + block
+        stripped = block.rstrip(b"\r\n")
+        newline = stripped.rfind(b"\n")
+        if newline != -1:
+            return pos + newline + 1, stripped[newline + 1 :]
+    return 0, block.rstrip(b"\r\n")
+
+
+def last_row_id(ledger_file):
+    """
+    str -> int
+
+    ledger_file is the name of the ledger file
+
+    return id of the last row in ledger file, or of its archive if the
+    ledger has no rows, or 0 if no last row
+    """
+    backend = ledger_backend(ledger_file)
+    if backend:
+        return backend["last_row_id"](ledger_file)
+    if not file_exists(ledger_file):
+        return 0
+    if CACHE_LEDGERS:
+        with LEDGER_LOCK:
+            rows = cached_ledger(ledger_file)["rows"]
+            if rows:
+                return int(rows[-1][ID_COL])
+            return archived_last_id(ledger_file)
+
+    with open(ledger_file, "rb") as lf:
+        start, line = last_line(lf)
+        if start == 0:
+            # empty or header-only ledger, with any earlier rows archived
+            return archived_last_id(ledger_file)
+        lf.seek(0)
+        names = next(csv.reader([lf.readline().decode("utf-8")]), [])
+        fields = whole_row(line, names)
+        if fields:
+            return int(fields[0])
+
+        # the last line ends a quoted field that spans lines (even one that
+        # looks like a row of its own), so parse the whole file to find
+        # where the last row starts
+        rows = [row for row in scan_rows(lf, 0)]
+        if len(rows) > 1:
+            return int(rows[-1][0])
+        return archived_last_id(ledger_file)
+
+
+def next_row_id(ledger_file):
+    """
+    str -> int
+
+    ledger_file is the name of the ledger file
+
+    return the id to give the next row appended to ledger file
+    """
+    return last_row_id(ledger_file) + 1
+
+
+def is_valid_amount(amount):
+    """
+    str -> bool
+
+    amount is inputted value from user for debit/credit
+
+    return True if amount is valid; otherwise, False
+    """
+    amount_tokens = amount.split(".")
+    if len(amount_tokens) == 1:
+        return amount_tokens[0].isdigit()
+    elif len(amount_tokens) == 2:
+        if amount_tokens[0].isdigit():
+            if amount_tokens[1].isdigit and len(amount_tokens[1]) == 2:
+                return True
+
+    return False
+
+
+def get_valid_amount(prompt):
+    """
+    str -> float
+
+    prompt is prompt to present to user
+
+    return the amount user inputs cast to a float
+    """
+    while True:
+        input_amount = input(prompt)
+        if is_valid_amount(input_amount):
+            return float(input_amount)
+        print("\nPlease enter a valid dollar value (e.g., $50.50)\n")
+
+
+def print_by_date(some_date, ledg_list):
+    """
+    str-> str
+
+    some_date is string inputted date
+    ledg_list is a list of dictionaries or Transactions
+
+    returns string transactions from dictionary where date matches parameters
+    presented
+    """
+    matches = [
+        transaction
+        for transaction in ledger_rows(ledg_list)
+        if transaction[TIMESTAMP_COL].startswith(some_date)
+    ]
+    print_matches(some_date, matches, "--------------------")
+
+
+def print_by_date_range(start_date, end_date, ledg_list):
+    """
+    str, str, list of dict or Transaction -> None
+
+    start_date is the first date (YYYY-MM-DD) of the range
+    end_date is the last date (YYYY-MM-DD) of the range
+    ledg_list is a list of dictionaries or Transactions
+
+    print transactions dated from start_date through end_date
+    """
+    matches = [
+        transaction
+        for transaction in ledger_rows(ledg_list)
+        if start_date <= transaction[TIMESTAMP_COL][:10] <= end_date
+    ]
+    print_matches(
+        f"{start_date} to {end_date}", matches, "--------------------"
+    )
+
+
+def print_by_cat(some_cat, ledg_list):
+    """
+    str-> str
+
+    some_cat is string inputted category
+    ledg_list is a list of dictionaries or Transactions
+
+    returns string transactions from dictionary where category matches
+    parameters presented
+    """
+    matches = [
+        transaction
+        for transaction in ledger_rows(ledg_list)
+        if transaction[CATEGORY_COL] == some_cat
+    ]
+    print_matches(some_cat, matches, "--------------------")
+
+
+def print_by_desc(some_desc, ledg_list):
+    """
+    str-> str
+
+    some_cat is string inputted category
+    ledg_list is a list of dictionaries or Transactions
+
+    returns string transactions from dictionary where category matches
+    parameters presented
+    """
+    matches = [
+        transaction
+        for transaction in ledger_rows(ledg_list)
+        if some_desc in transaction[DESCRIPTION_COL]
+    ]
+    print_matches(some_desc, matches, "--------------------\n")
+
+
+def print_by_keywords(terms, ledg_list, match_all=True, ignore_case=False):
+    """
+    list of str, list of dict or Transaction, bool, bool -> None
+
+    terms are the keywords or phrases to search for
+    ledg_list is a list of dictionaries or Transactions
+    match_all is True to require every term and False to require any term
+    ignore_case is True to match terms regardless of case
+
+    print transactions whose descriptions match terms
+    """
+    matches = [
+        transaction
+        for transaction in ledger_rows(ledg_list)
+        if description_matches(
+            transaction[DESCRIPTION_COL], terms, match_all, ignore_case
+        )
+    ]
+    joiner = " and " if match_all else " or "
+    print_matches(joiner.join(terms), matches, "--------------------\n")
+
+
+def print_matches(term, matches, separator):
+    """
+    str, list of dict, str -> None
+
+    term is the date, category or keyword that was searched for
+    matches is a list of dictionaries of the matching transactions
+    separator is printed after each matching transaction
+
+    print each matching transaction followed by summary statistics
+    """
+    val_list = []
+    for transaction in matches:
+        for key in transaction:
+            if key == AMOUNT_COL:
+                val_list.append(float(transaction[key]))
+                print("{}: ${:,.2f}".format(key, float(transaction[key])))
+            else:
+                print("{}: {}".format(key, transaction[key]))
+        print(separator)
+
+    if len(val_list) > 0:
+        average = sum(val_list) / len(val_list)
+        print_search_summary(term, max(val_list), min(val_list), average)
+    else:
+        print("\nNo results.")
+
+
+def print_search_summary(term, maximum, minimum, average):
+    """
+    str, float, float, float -> None
+
+    term is the date, category or keyword that was searched for
+    maximum, minimum and average are statistics of the matching amounts
+
+    print summary statistics of a search
+    """
+    print("Maximum transaction in {}: ${:,.2f}".format(term, maximum))
+    print("Minimum transaction in {}: ${:,.2f}".format(term, minimum))
+    print("Average transaction in {}: ${:,.2f}".format(term, average))
+    print("------------------")
+
+
+def make_query(
+    categories=None,
+    start=None,
+    end=None,
+    terms=None,
+    match_all=True,
+    ignore_case=False,
+    min_amount=None,
+    max_amount=None,
+    sort=None,
+    reverse=False,
+    limit=None,
+):
+    """
+    list of str, int, int, list of str, bool, bool, float, float, str, bool,
+    int -> dict
+
+    categories are the categories to match, any of them (all if None)
+    start is the first epoch second to match (no lower bound if None)
+    end is the epoch second just after those to match (no upper bound if
+    None)
+    terms are keywords or phrases the description must contain
+    match_all is True to require every term and False to require any term
+    ignore_case is True to match terms regardless of case
+    min_amount and max_amount are the lowest and highest signed amounts to
+    match, inclusive (no bound if None)
+    sort is the column of QUERY_SORT_KEYS to order matches by (ID order if
+    None)
+    reverse is True to order matches from the largest to the smallest
+    limit is the number of matches to return (all if None)
+
+    return a query for query_transactions, with amounts in cents
+    """
+    return {
+        "categories": set(categories) if categories else None,
+        "start": start,
+        "end": end,
+        "terms": list(terms or ()),
+        "match_all": match_all,
+        "ignore_case": ignore_case,
+        "min_cents": None if min_amount is None else round(min_amount * 100),
+        "max_cents": None if max_amount is None else round(max_amount * 100),
+        "sort": sort,
+        "reverse": reverse,
+        "limit": limit,
+    }
+
+
+def compile_query(query):
+    """
+    dict -> function
+
+    query is returned by make_query
+
+    return a function of a row that is True if the row matches every filter
+    of query, checking the cheapest filters first
+    """
+    checks = []
+    categories = query["categories"]
+    if categories is not None:
+        checks.append(lambda row: row[CATEGORY_COL] in categories)
+    start, end = query["start"], query["end"]
+    if start is not None or end is not None:
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+        checks.append(
+            lambda row: start <= timestamp_to_epoch(row[TIMESTAMP_COL]) < end
+        )
+    min_cents, max_cents = query["min_cents"], query["max_cents"]
+    if min_cents is not None or max_cents is not None:
+        min_cents = -math.inf if min_cents is None else min_cents
+        max_cents = math.inf if max_cents is None else max_cents
+        checks.append(
+            lambda row: min_cents
+            <= amount_to_cents(row[AMOUNT_COL])
+            <= max_cents
+        )
+    terms = query["terms"]
+    if terms:
+        match_all, ignore_case = query["match_all"], query["ignore_case"]
+        checks.append(
+            lambda row: description_matches(
+                row[DESCRIPTION_COL], terms, match_all, ignore_case
+            )
+        )
+
+    def matches(row):
+        for check in checks:
+            if not check(row):
+                return False
+        return True
+
+    return matches
+
+
+def query_rows(ledger_file, query):
+    """
+    str, dict -> iterable of dict
+
+    ledger_file is the name of the ledger file
+    query is returned by make_query
+
+    return the rows that may match query, in ID order: those found in the
+    category, timestamp and trigram indexes of a CSV ledger, or through the
+    search of a backend, when query has filters they can answer; otherwise,
+    every row, read one at a time from a CSV ledger
+    """
+    start, end = query["start"], query["end"]
+    backend = ledger_backend(ledger_file)
+    if backend:
+        if start is not None and end is not None:
+            return backend["date_range_transactions"](ledger_file, start, end)
+        if query["categories"] and len(query["categories"]) == 1:
+            (category,) = query["categories"]
+            return backend["category_transactions"](ledger_file, category)
+        if query["terms"]:
+            return backend["description_transactions"](
+                ledger_file,
+                query["terms"],
+                query["match_all"],
+                query["ignore_case"],
+            )
+        return backend["get_trans"](ledger_file)
+
+    ids = None
+    if query["categories"]:
+        ids = set().union(
+            *(category_ids(ledger_file, c) for c in query["categories"])
+        )
+    if start is not None or end is not None:
+        found = timestamp_ids(
+            ledger_file,
+            -math.inf if start is None else start,
+            math.inf if end is None else end,
+        )
+        ids = set(found) if ids is None else ids.intersection(found)
+    if query["terms"]:
+        found = description_ids(
+            ledger_file, query["terms"], query["match_all"]
+        )
+        if found is not None:
+            ids = found if ids is None else ids & found
+    if ids is not None:
+        archived = stream_archive(
+            ledger_file,
+            lambda footer: archive_block_matches(
+                footer, query["categories"], start, end
+            ),
+        )
+        return itertools.chain(archived, fetch_rows(ledger_file, ids))
+    if CACHE_LEDGERS:
+        return get_trans(ledger_file)
+    return ledger_row_stream(ledger_file)
+
+
+def ledger_row_stream(ledger_file):
+    """
+    str -> iterator of dict
+
+    ledger_file is the name of a CSV ledger file
+
+    yield the rows get_trans returns, one at a time
+
+    the ledger lock is only held while the ledger, its change log and its
+    archive are opened, not while the rows are yielded, so that a caller
+    consuming them slowly does not hold up other threads
+    """
+    with contextlib.ExitStack() as stack:
+        with LEDGER_LOCK:
+            # the open files still hold the versions a compaction or an
+            # archive may replace once the lock is released
+            lf = stack.enter_context(open(ledger_file))
+            amendments = read_amendments(ledger_file)
+            index, af = open_archive(ledger_file)
+            if af is not None:
+                stack.enter_context(af)
+        if af is not None:
+            yield from archive_blocks(index, af)
+        for row in csv.DictReader(lf, skipinitialspace=True):
+            amended = amendments.get(row[ID_COL])
+            if amended:
+                row.update(amended)
+            yield row
+
+
+def query_transactions(ledger_file, query, stats):
+    """
+    str, dict, dict -> iterator of dict
+
+    ledger_file is the name of the ledger file
+    query is returned by make_query
+    stats is a dictionary to fill with the count, total, min and max cents
+    of the matches
+
+    yield the matches of query in the order and up to the limit it asks
+    for, making one pass over the rows that may match; stats covers every
+    match, including those past the limit, and is filled once the iterator
+    is exhausted
+    """
+    stats.update(count=0, total=0, min=None, max=None)
+    matches = compile_query(query)
+
+    def matching_rows():
+        for row in query_rows(ledger_file, query):
+            if matches(row):
+                cents = amount_to_cents(row[AMOUNT_COL])
+                stats["count"] += 1
+                stats["total"] += cents
+                if stats["min"] is None or cents < stats["min"]:
+                    stats["min"] = cents
+                if stats["max"] is None or cents > stats["max"]:
+                    stats["max"] = cents
+                yield row
+
+    rows, limit = matching_rows(), query["limit"]
+    if query["sort"] is None:
+        if query["reverse"]:
+            # only the last matches are needed
+            kept = collections.deque(rows, maxlen=limit)
+            yield from reversed(kept)
+            return
+        yield from itertools.islice(rows, limit)
+        # go through the rest of the matches for stats
+        collections.deque(rows, maxlen=0)
+        return
+
+    key = query_sort_key(query["sort"])
+    if limit is None:
+        yield from sorted(rows, key=key, reverse=query["reverse"])
+    elif query["reverse"]:
+        yield from heapq.nlargest(limit, rows, key=key)
+    else:
+        yield from heapq.nsmallest(limit, rows, key=key)
+
+
+def query_sort_key(sort):
+    """
+    str -> function
+
+    sort is a column of QUERY_SORT_KEYS
+
+    return a function of a row giving the value to sort it by
+    """
+    if sort == "id":
+        return lambda row: int(row[ID_COL])
+    if sort == "timestamp":
+        return lambda row: timestamp_to_epoch(row[TIMESTAMP_COL])
+    if sort == "category":
+        return lambda row: row[CATEGORY_COL]
+    if sort == "amount":
+        return lambda row: amount_to_cents(row[AMOUNT_COL])
+    raise ValueError(f"invalid sort column: {sort}")
+
+
+def describe_query(query):
+    """
+    dict -> str
+
+    query is returned by make_query
+
+    return a description of the filters of query (e.g., "category rent or
+    utilities, 2023-01-01 to 2023-06-30")
+    """
+    filters = []
+    if query["categories"]:
+        filters.append("category " + " or ".join(sorted(query["categories"])))
+    if query["start"] is not None or query["end"] is not None:
+        first, last = "...", "..."
+        if query["start"] is not None:
+            first = epoch_to_timestamp(query["start"])[:10]
+        if query["end"] is not None:
+            last = epoch_to_timestamp(query["end"] - 1)[:10]
+        filters.append(f"{first} to {last}")
+    if query["terms"]:
+        joiner = " and " if query["match_all"] else " or "
+        filters.append("description " + joiner.join(query["terms"]))
+    for key, word in (("min_cents", ">="), ("max_cents", "<=")):
+        if query[key] is not None:
+            filters.append(f"amount {word} {cents_to_amount(query[key])}")
+    return ", ".join(filters) or "all transactions"
+
+
+def print_query(ledger_file, query):
+    """
+    str, dict -> None
+
+    ledger_file is the name of the ledger file
+    query is returned by make_query
+
+    print the matches of query as print_ledger does, followed by summary
+    statistics of every match
+    """
+    stats = {}
+    print_ledger_header()
+    write_lines(
+        format_transaction(row)
+        for row in query_transactions(ledger_file, query, stats)
+    )
+    if not stats["count"]:
+        print("\nNo results.")
+        return
+    shown = stats["count"]
+    if query["limit"] is not None:
+        shown = min(shown, query["limit"])
+    print(
+        f"\n{stats['count']} matches ({shown} shown), total "
+        f"${stats['total'] / 100:,.2f}"
+    )
+    print_search_summary(
+        describe_query(query),
+        stats["max"] / 100,
+        stats["min"] / 100,
+        stats["total"] / stats["count"] / 100,
+    )
+
+
+def load_columns(ledger_file):
+    """
+    str -> dict
+
+    ledger_file is the name of the ledger file
+
+    return a columnar ledger: a dictionary of numpy arrays of int64 IDs,
+    int64 epoch seconds, int64 cents and a debit flag per row, along with
+    dictionary-encoded categories and the raw timestamps and descriptions
+    needed to print rows exactly as get_trans does
+
+    only the reductions over the loaded columns are vectorized: a CSV
+    ledger is still parsed row by row, which costs about as much as
+    get_trans, so the statistics and date searches are tens of times
+    faster once the columns are loaded but a command that loads a CSV
+    ledger to run them once is not; a binary ledger's columns are views of
+    its records, with no parsing
+    """
+    if np is None:
+        raise ImportError("load_columns requires numpy")
+
+    backend = ledger_backend(ledger_file)
+    if backend and "load_columns" in backend:
+        return backend["load_columns"](ledger_file)
+    if backend:
+        names = list(COL_NAMES)
+        rows = [
+            [row[name] for name in names] for row in get_trans(ledger_file)
+        ]
+        amendments = {}
+    else:
+        with LEDGER_LOCK, open(ledger_file) as lf:
+            amendments = read_amendments(ledger_file)
+            reader = csv.reader(lf, skipinitialspace=True)
+            names = next(reader, [])
+            rows = [
+                [row[name] for name in names]
+                for row in stream_archive(ledger_file)
+            ]
+            rows += [row for row in reader if row]
+
+    id_index = names.index(ID_COL)
+    if amendments:
+        for i, row in enumerate(rows):
+            amended = amendments.get(row[id_index])
+            if amended:
+                rows[i] = [amended[name] for name in names]
+
+    # one C-level pass per column; converting through numpy string arrays
+    # instead costs more than parsing the CSV
+    columns = {
+        name: list(map(operator.itemgetter(i), rows))
+        for i, name in enumerate(names)
+    }
+    ids = columns.get(ID_COL, [])
+    timestamps = columns.get(TIMESTAMP_COL, [])
+    amounts = np.array(
+        list(map(float, columns.get(AMOUNT_COL, []))), dtype=np.float64
+    )
+
+    category_codes = {}
+    codes = [
+        category_codes.setdefault(category, len(category_codes))
+        for category in columns.get(CATEGORY_COL, [])
+    ]
+    return {
+        "names": names,
+        "ids": np.fromiter(map(int, ids), np.int64, len(ids)),
+        "epochs": np.array(timestamps, dtype="datetime64[s]").astype(
+            np.int64
+        ),
+        "cents": np.rint(amounts * 100).astype(np.int64),
+        # float("-0.00") keeps its sign
+        "debits": np.signbit(amounts),
+        "category_codes": np.array(codes, dtype=np.int32),
+        "categories": list(category_codes),
+        "timestamps": timestamps,
+        "descriptions": columns.get(DESCRIPTION_COL, []),
+    }
+
+
+def print_ledger_columns(columns):
+    """
+    dict -> None
+
+    columns is a columnar ledger returned by load_columns
+
+    print the same table as print_ledger, formatted straight from the
+    columns without making an object per row or a timestamp per epoch
+    """
+    print_ledger_header()
+    if not columns["ids"].size:
+        print("None.")
+        return
+    categories = columns["categories"]
+    write_lines(
+        map(
+            format_row,
+            columns["ids"].tolist(),
+            columns["timestamps"],
+            [categories[code] for code in columns["category_codes"].tolist()],
+            columns["descriptions"],
+            (columns["cents"] / 100).tolist(),
+        )
+    )
+
+
+def print_history(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    print every transaction of the ledger and their statistics; with
+    numpy, the ledger is loaded once into columns, which the transactions
+    are printed from and the statistics computed on, about twice as fast
+    as through Transactions since the rows are formatted without an object
+    per row (the parse of a CSV ledger is no faster)
+    """
+    if np is None:
+        ledger_list = get_transactions(ledger_file)
+        print_ledger(ledger_list)
+        print_ledger_stats(ledger_list)
+    else:
+        columns = load_columns(ledger_file)
+        print_ledger_columns(columns)
+        print_ledger_stats_columns(columns)
+
+
+def print_stats(ledger_file):
+    """
+    str -> None
+
+    ledger_file is the name of the ledger file
+
+    print the statistics of the ledger, computed with numpy on the columns
+    of a ledger whose backend loads them without parsing (e.g. a binary
+    ledger), or otherwise in one pass over its rows, which is almost as
+    fast as loading the columns of a CSV ledger and keeps no row in memory
+    """
+    backend = ledger_backend(ledger_file)
+    if np is not None and backend and "load_columns" in backend:
+        print_ledger_stats_columns(load_columns(ledger_file))
+    else:
+        print_ledger_stats(query_rows(ledger_file, make_query()))
+
+
+def print_ledger_stats_columns(columns):
+    """
+    dict -> None
+
+    columns is a columnar ledger returned by load_columns
+
+    print the same statistics as print_ledger_stats, computed with
+    vectorized masks and reductions
+    """
+    cents, debits = columns["cents"], columns["debits"]
+    credits = cents[~debits]
+    if credits.size:
+        print_amount_stats("Credit", *cents_stats(credits))
+    debit_cents = -cents[debits]
+    if debit_cents.size:
+        print_amount_stats("Debit", *cents_stats(debit_cents))
+
+
+def cents_stats(cents):
+    """
+    numpy array -> float, float, float
+
+    cents is a non-empty array of amounts in cents
+
+    return maximum, minimum and average of cents in dollars
+    """
+    return (
+        int(cents.max()) / 100,
+        int(cents.min()) / 100,
+        int(cents.sum()) / (100 * cents.size),
+    )
+
+
+def print_column_matches(term, columns, mask, separator):
+    """
+    str, dict, numpy array, str -> None
+
+    term is the date, category or keyword that was searched for
+    columns is a columnar ledger returned by load_columns
+    mask is a boolean array selecting the matching rows
+    separator is printed after each matching row
+
+    print the matching rows and their summary like the print_by_* functions,
+    formatting each column of the matches at once and writing the lines in
+    batches rather than printing a line at a time
+    """
+    categories = columns["categories"]
+    timestamps, descriptions = columns["timestamps"], columns["descriptions"]
+    matches = np.flatnonzero(mask)
+    positions = matches.tolist()
+    cents = columns["cents"][matches]
+    # keep the sign of "-0.00" like float() does
+    amounts = np.copysign(
+        cents / 100, np.where(columns["debits"][matches], -1.0, 1.0)
+    )
+    values = {
+        ID_COL: columns["ids"][matches].tolist(),
+        TIMESTAMP_COL: [timestamps[i] for i in positions],
+        CATEGORY_COL: [
+            categories[code]
+            for code in columns["category_codes"][matches].tolist()
+        ],
+        DESCRIPTION_COL: [descriptions[i] for i in positions],
+    }
+    lines = {
+        key: [f"{key}: {value}" for value in column]
+        for key, column in values.items()
+    }
+    lines[AMOUNT_COL] = [
+        f"{AMOUNT_COL}: ${amount:,.2f}" for amount in amounts.tolist()
+    ]
+    write_lines(
+        itertools.chain.from_iterable(
+            zip(
+                *(lines[key] for key in columns["names"]),
+                itertools.repeat(separator),
+            )
+        )
+    )
+
+    if matches.size:
+        print_search_summary(term, *cents_stats(cents))
+    else:
+        print("\nNo results.")
+
+
+def print_by_date_columns(some_date, columns):
+    """
+    str, dict -> None
+
+    some_date is string inputted date
+    columns is a columnar ledger returned by load_columns
+
+    print the same results as print_by_date
+    """
+    if is_valid_date(some_date):
+        start = np.datetime64(some_date, "s").astype(np.int64)
+        epochs = columns["epochs"]
+        mask = (epochs >= start) & (epochs < start + 24 * 60 * 60)
+    else:
+        mask = np.array(
+            [t.startswith(some_date) for t in columns["timestamps"]],
+            dtype=bool,
+        )
+    print_column_matches(some_date, columns, mask, "--------------------")
+
+
+def print_by_cat_columns(some_cat, columns):
+    """
+    str, dict -> None
+
+    some_cat is string inputted category
+    columns is a columnar ledger returned by load_columns
+
+    print the same results as print_by_cat
+    """
+    if some_cat in columns["categories"]:
+        code = columns["categories"].index(some_cat)
+        mask = columns["category_codes"] == code
+    else:
+        mask = np.zeros(len(columns["ids"]), dtype=bool)
+    print_column_matches(some_cat, columns, mask, "--------------------")
+
+
+def print_by_desc_columns(some_desc, columns):
+    """
+    str, dict -> None
+
+    some_desc is string inputted keyword
+    columns is a columnar ledger returned by load_columns
+
+    print the same results as print_by_desc
+    """
+    mask = np.array(
+        [some_desc in d for d in columns["descriptions"]], dtype=bool
+    )
+    print_column_matches(some_desc, columns, mask, "--------------------\n")
+
+
+def file_exists(ledger_filename):
+    """
+    str -> bool
+
+    ledger_filename is the name of the ledger file
+
+    return True if ledger file exists; otherwise, False
+    """
+    backend = ledger_backend(ledger_filename)
+    if backend and "file_exists" in backend:
+        return backend["file_exists"](ledger_filename)
+    return os.path.isfile(ledger_filename)
+
+
+def create_ledger_file(ledger_filename):
+    """
+    str -> None
+
+    ledger_filename is the name of the ledger file
+
+    create ledger file
+    CAUTION: will overwrite the ledger file if it exists
+    """
+    backend = ledger_backend(ledger_filename)
+    if backend:
+        return backend["create_ledger_file"](ledger_filename)
+    with open(ledger_filename, "w") as lf:
+        writer = csv.DictWriter(lf, COL_NAMES)
+        writer.writeheader()
+
+
+def remove_ledger_file(ledger_filename):
+    """
+    str -> None
+
+    ledger_filename is the name of the ledger file
+
+    remove the ledger file along with its change log, checkpoint, indexes
+    and archive
+    """
+    backend = ledger_backend(ledger_filename)
+    if backend:
+        backend["remove_ledger_file"](ledger_filename)
+        suffixes = (LOCK_SUFFIX,)
+    else:
+        suffixes = ("", BALANCE_SUFFIX, LOG_SUFFIX, COMPACTED_SUFFIX)
+        suffixes += tuple(INDEX_REFRESHERS)
+        suffixes += (ARCHIVE_SUFFIX, ARCHIVE_PENDING_SUFFIX, LOCK_SUFFIX)
+    for suffix in suffixes:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(sidecar_filename(ledger_filename, suffix))
+
+
+def is_valid_action_choice(action_choice):
+    """
+    str -> bool
+
+    action_choice is the user's inputted action choice
+
+    return True if user's action choice is valid; otherwise, False
+    """
+    return action_choice.isdigit() and action_choice in OPTIONS
+
+
+def get_action_choice(prompt):
+    """
+    str -> str
+
+    prompt is the prompt to present to the user
+
+    return user's action choice
+    """
+    while True:
+        action_choice = input(prompt)
+        if is_valid_action_choice(action_choice):
+            return action_choice
+        print(
+            f"\nInvalid choice: {action_choice}\n"
+            f"Please enter {min(OPTIONS)}-{max(OPTIONS)}\n"
+        )
+
+
+def is_valid_transaction_id(ledger_filename, transaction_id):
+    """
+    str, int - > bool
+
+    transaction_id is the id whose validity will be determined
+    ledger_filename is the file whose transaction ids will be calculated
+
+    return True if
+    """
+    backend = ledger_backend(ledger_filename)
+    if backend:
+        return backend["is_valid_transaction_id"](
+            ledger_filename, transaction_id
+        )
+    if CACHE_LEDGERS:
+        with LEDGER_LOCK:
+            positions = cached_ledger(ledger_filename)["positions"]
+            return str(transaction_id) in positions or (
+                1 <= transaction_id <= archived_last_id(ledger_filename)
+            )
+    with open(ledger_filename) as lf:
+        reader = csv.reader(lf)
+        rows = len([row for row in reader]) - 1
+        return 1 <= transaction_id <= archived_last_id(ledger_filename) + rows
+
+
+def get_transaction_id(prompt, ledger_filename):
+    """
+    str -> str
+
+    prompt is prompt to present to user
+    ledger_filename is the ledger's filename
+
+    return the transaction id inputted by user
+    """
+    while True:
+        transaction_id = input("\n" + prompt)
+        if transaction_id.isdigit() and is_valid_transaction_id(
+            ledger_filename, int(transaction_id)
+        ):
+            return transaction_id
+        print("\nInvalid transaction ID.")
+
+
+def is_valid_date(date):
+    """
+    str -> bool
+
+    date is the date to validate
+
+    return True if date is valid (YYYY-MM-DD); otherwise, False
+    """
+    try:
+        datetime.datetime.strptime(date, "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False
+
+
+def get_date_input(prompt):
+    """
+    str -> str
+
+    prompt is prompt to present to user
+
+    return valid date inputted by user
+    """
+    while True:
+        date = input(prompt)
+        if is_valid_date(date):
+            return date
+        print("\nInvalid date.")
+
+
+def is_valid_period(period):
+    """
+    str -> bool
+
+    period is the period to validate
+
+    return True if period is a valid year (YYYY), month (YYYY-MM) or day
+    (YYYY-MM-DD); otherwise, False
+    """
+    if len(period) not in (4, 7, 10):
+        return False
+    try:
+        period_bounds(period)
+        return True
+    except ValueError:
+        return False
+
+
+def get_period_input(prompt):
+    """
+    str -> str
+
+    prompt is prompt to present to user
+
+    return valid year, month or day inputted by user
+    """
+    while True:
+        period = input(prompt)
+        if is_valid_period(period):
+            return period
+        print("\nInvalid date.")
+
+
+def get_optional_input(prompt, is_valid):
+    """
+    str, function -> str
+
+    prompt is prompt to present to user
+    is_valid is a function of the input that is True if it is valid
+
+    return valid input from user, or "" if they left it blank
+    """
+    while True:
+        value = input(prompt).strip()
+        if not value or is_valid(value):
+            return value
+        print("\nInvalid input.")
+
+
+def get_query_input():
+    """
+    None -> dict
+
+    return the query made of the filters, order and limit inputted by user
+    """
+    categories = input("Categories, separated by commas: ").split(",")
+    period_prompt = "(YYYY, YYYY-MM or YYYY-MM-DD): "
+    from_period = get_optional_input("From " + period_prompt, is_valid_period)
+    to_period = get_optional_input("To " + period_prompt, is_valid_period)
+    terms = input("Description words: ").split()
+    match_all = not terms or not input(
+        "Match (a)ll or a(n)y of the words? "
+    ).lower().startswith("n")
+
+    def is_valid_signed_amount(amount):
+        return is_valid_amount(amount.removeprefix("-"))
+
+    min_amount = get_optional_input(
+        "Lowest amount (e.g., -500): ", is_valid_signed_amount
+    )
+    max_amount = get_optional_input("Highest amount: ", is_valid_signed_amount)
+    sort = get_optional_input(
+        f"Sort by {', '.join(QUERY_SORT_KEYS)}: ",
+        lambda value: value in QUERY_SORT_KEYS,
+    )
+    reverse = False
+    if sort:
+        reverse = input("Largest first (y/n)? ").lower().startswith("y")
+    limit = get_optional_input("Show at most how many? ", str.isdigit)
+    return make_query(
+        categories=[c.strip() for c in categories if c.strip()],
+        start=period_bounds(from_period)[0] if from_period else None,
+        end=period_bounds(to_period)[1] if to_period else None,
+        terms=terms,
+        match_all=match_all,
+        min_amount=float(min_amount) if min_amount else None,
+        max_amount=float(max_amount) if max_amount else None,
+        sort=sort or None,
+        reverse=reverse,
+        limit=int(limit) if limit else None,
+    )
+
+
+def is_valid_time(time):
+    """
+    str -> bool
+
+    time is the time to validate
+
+    return True if time is in valid 24-hour clock format; otherwise, False
+    """
+    try:
+        datetime.datetime.strptime(time, "%H:%M:%S")
+        return True
+    except ValueError:
+        return False
+
+
+def get_time_input(prompt):
+    """
+    str -> str
+
+    prompt is prompt to present to user
+
+    return valid time inputted by user
+    """
+    while True:
+        time = input(prompt)
+        if is_valid_time(time):
+            return time
+        print("\nInvalid time.\n")
+
+
+def read_import_rows(import_file, import_format=None):
+    """
+    str, str -> iterator of (int, dict or None, str)
+
+    import_file is the name of the file to import ("-" for standard input)
+    import_format is "csv" or "jsonl" (taken from the file extension if None)
+
+    yield the line number, row and error of each row of import_file; the row
+    is None if the line could not be parsed
+    """
+    if import_format is None:
+        import_format = "jsonl" if import_file.endswith(".jsonl") else "csv"
+    if import_file == "-":
+        context = contextlib.nullcontext(sys.stdin)
+    else:
+        context = open(import_file, newline="")
+    with context as imp:
+        if import_format == "csv":
+            reader = csv.DictReader(imp)
+            for row in reader:
+                yield reader.line_num, row, ""
+            return
+        for line_num, line in enumerate(imp, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as error:
+                yield line_num, None, f"invalid JSON ({error})"
+                continue
+            if isinstance(row, dict):
+                yield line_num, row, ""
+            else:
+                yield line_num, None, "not a JSON object"
+
+
+def import_record(row, row_id):
+    """
+    dict, int -> dict
+
+    row is a row read from an import file
+    row_id is the id to give the record
+
+    return the ledger record for row; raise ValueError if row is invalid
+    """
+    row = {name: "" if value is None else value for name, value in row.items()}
+    if TIMESTAMP_COL in row:
+        date, _, time = str(row[TIMESTAMP_COL]).partition(" ")
+    else:
+        date, time = str(row.get(DATE_COL, "")), str(row.get(TIME_COL, ""))
+    amount = row.get(AMOUNT_COL, "")
+    if isinstance(amount, (int, float)) and round(amount, 2) == amount:
+        amount = f"{amount:.2f}"
+    amount = str(amount).strip()
+
+    if not is_valid_date(date):
+        raise ValueError(f"invalid date {date!r}")
+    if not is_valid_time(time):
+        raise ValueError(f"invalid time {time!r}")
+    if not is_valid_amount(amount.removeprefix("-")):
+        raise ValueError(f"invalid amount {amount!r}")
+
+    return {
+        ID_COL: row_id,
+        TIMESTAMP_COL: date + " " + time,
+        CATEGORY_COL: str(row.get(CATEGORY_COL, "")),
+        DESCRIPTION_COL: str(row.get(DESCRIPTION_COL, "")),
+        AMOUNT_COL: f"{float(amount):.2f}",
+    }
+
+
+def import_transactions(ledger_file, import_file, import_format=None):
+    """
+    str, str, str -> list of dict, list of (int, str)
+
+    ledger_file is the name of the ledger file
+    import_file is the name of the file to import ("-" for standard input)
+    import_format is "csv" or "jsonl" (taken from the file extension if None)
+
+    append every valid row of import_file to ledger_file with one write,
+    giving the rows a contiguous block of IDs
+
+    return the records written and the line number and reason for each
+    rejected row
+    """
+    with ledger_lock(ledger_file):
+        if not file_exists(ledger_file):
+            create_ledger_file(ledger_file)
+        row_id = next_row_id(ledger_file)
+        records, rejected = [], []
+        for line_num, row, error in read_import_rows(
+            import_file, import_format
+        ):
+            try:
+                if row is None:
+                    raise ValueError(error)
+                records.append(import_record(row, row_id))
+            except ValueError as error:
+                rejected.append((line_num, str(error)))
+                continue
+            row_id += 1
+        if records:
+            append_records(ledger_file, records)
+    return records, rejected
+
+
+def append_records(ledger_file, records):
+    """
+    str, list of dict -> None
+
+    ledger_file is the name of the ledger file
+    records are dictionaries of "column_name": data
+
+    write records to end of ledger file with one write and one fsync,
+    renumbering them past any rows appended since they were created
+    """
+    with ledger_lock(ledger_file):
+        allocate_ids(ledger_file, records)
+        backend = ledger_backend(ledger_file)
+        if backend:
+            return backend["append_records"](ledger_file, records)
+
+        before = os.stat(ledger_file)
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, COL_NAMES).writerows(records)
+        with open(ledger_file, "a") as lf:
+            lf.write(buffer.getvalue())
+            lf.flush()
+            os.fsync(lf.fileno())
+        cache_appended(ledger_file, before, buffer.getvalue(), records)
+        update_balance_checkpoint(
+            ledger_file,
+            before,
+            len(records),
+            sum(amount_to_cents(record[AMOUNT_COL]) for record in records),
+        )
+        maintain_indexes(ledger_file)
+
+
+def queue_record(ledger_file, record):
+    """
+    str, dict -> concurrent.futures.Future
+
+    ledger_file is the name of the ledger file
+    record is a dictionary of "column_name": data
+
+    queue record to be appended by the ledger's group commit writer, which
+    gives it the next free ID
+
+    return a future of the ID record was appended with
+    """
+    done = concurrent.futures.Future()
+    with GROUP_COMMIT_LOCK:
+        pending = GROUP_COMMITTERS.get(ledger_file)
+        if pending is None:
+            pending = GROUP_COMMITTERS[ledger_file] = queue.SimpleQueue()
+            threading.Thread(
+                target=group_commit_writer,
+                args=(ledger_file, pending),
+                daemon=True,
+            ).start()
+        pending.put((record, done))
+    return done
+
+
+def commit_record(ledger_file, record):
+    """
+    str, dict -> int
+
+    ledger_file is the name of the ledger file
+    record is a dictionary of "column_name": data
+
+    append record through the ledger's group commit writer, sharing one
+    write and fsync with the records other threads append meanwhile
+
+    return the ID record was appended with, once it is on disk
+    """
+    return queue_record(ledger_file, record).result()
+
+
+def group_commit_writer(ledger_file, pending):
+    """
+    str, queue.SimpleQueue -> None
+
+    ledger_file is the name of the ledger file
+    pending is the queue of (record, future) pairs to append
+
+    forever wait for a queued record, collect the records queued within
+    GROUP_COMMIT_SECONDS of it and append them all with append_records
+    under the ledger lock, numbering them from the next free ID
+
+    the writer stops waiting early once it has as many records as the last
+    group had, so producers that each wait for their record to be appended
+    are not held up for the whole window
+    """
+    expected = 1
+    while True:
+        group = [pending.get()]
+        deadline = time.monotonic() + GROUP_COMMIT_SECONDS
+        while len(group) < GROUP_COMMIT_MAX_RECORDS:
+            if len(group) < expected:
+                timeout = max(deadline - time.monotonic(), 0)
+            else:
+                timeout = 0
+            try:
+                group.append(pending.get(timeout=timeout))
+            except queue.Empty:
+                break
+        expected = len(group)
+        records = [record for record, _ in group]
+        try:
+            with ledger_lock(ledger_file):
+                if not file_exists(ledger_file):
+                    create_ledger_file(ledger_file)
+                row_id = next_row_id(ledger_file)
+                for i, record in enumerate(records):
+                    record[ID_COL] = row_id + i
+                append_records(ledger_file, records)
+        # report any failure to the producers rather than stop the writer
+        except Exception as error:
+            for _, done in group:
+                done.set_exception(error)
+        else:
+            for record, done in group:
+                done.set_result(record[ID_COL])
+
+
+def forget_parent_writers():
+    """
+    None -> None
+
+    forget the group commit writers and ledger locks of the parent in a
+    forked child, which inherits neither the writer threads nor the locks;
+    the ledger lock may have been held by a thread that does not exist in
+    the child, so it is replaced as well
+    """
+    global GROUP_COMMIT_LOCK, LEDGER_LOCK
+    GROUP_COMMIT_LOCK = threading.Lock()
+    LEDGER_LOCK = threading.RLock()
+    GROUP_COMMITTERS.clear()
+    for fd, _ in LOCKED_LEDGERS.values():
+        os.close(fd)
+    LOCKED_LEDGERS.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=forget_parent_writers)
+
+
+def load_server_state(ledger_file):
+    """
+    str -> dict
+
+    ledger_file is the name of the ledger file
+
+    return the state of a ledger server: the ledger's rows in ID order
+    along with their IDs, their total in cents, their positions ordered by
+    timestamp and their positions by category
+    """
+    rows = get_trans(ledger_file)
+    rows.sort(key=lambda row: int(row[ID_COL]))
+    epochs = [timestamp_to_epoch(row[TIMESTAMP_COL]) for row in rows]
+    by_epoch = sorted(range(len(rows)), key=epochs.__getitem__)
+    categories = {}
+    for i, row in enumerate(rows):
+        categories.setdefault(row[CATEGORY_COL], array.array("q")).append(i)
+    return {
+        "ledger_file": ledger_file,
+        "rows": rows,
+        "ids": array.array("q", (int(row[ID_COL]) for row in rows)),
+        "cents": sum(amount_to_cents(row[AMOUNT_COL]) for row in rows),
+        "epochs": array.array("q", (epochs[i] for i in by_epoch)),
+        "by_epoch": array.array("q", by_epoch),
+        "categories": categories,
+        "writes": None,
+        "writer": None,
+    }
+
+
+def server_position(state, row_id):
+    """
+    dict, int -> int
+
+    state is the state of a ledger server
+    row_id is the ID of a transaction
+
+    return the position of the transaction in state's rows; raise
+    ValueError if there is no such transaction
+    """
+    i = bisect.bisect_left(state["ids"], row_id)
+    if i == len(state["ids"]) or state["ids"][i] != row_id:
+        raise ValueError(f"no transaction with ID {row_id}")
+    return i
+
+
+def server_store_row(state, row):
+    """
+    dict, dict -> None
+
+    state is the state of a ledger server
+    row is a new transaction, or a new version of one, just written
+
+    add row to state, or replace the row with the same ID, keeping the
+    balance and the timestamp and category positions up to date
+    """
+    row_id = int(row[ID_COL])
+    ids, rows = state["ids"], state["rows"]
+    if ids and ids[-1] >= row_id:
+        i = server_position(state, row_id)
+        old = rows[i]
+        state["cents"] -= amount_to_cents(old[AMOUNT_COL])
+        epoch = timestamp_to_epoch(old[TIMESTAMP_COL])
+        epochs = state["epochs"]
+        k = state["by_epoch"].index(
+            i,
+            bisect.bisect_left(epochs, epoch),
+            bisect.bisect_right(epochs, epoch),
+        )
+        del epochs[k], state["by_epoch"][k]
+        positions = state["categories"][old[CATEGORY_COL]]
+        del positions[bisect.bisect_left(positions, i)]
+        rows[i] = row
+    else:
+        i = len(rows)
+        ids.append(row_id)
+        rows.append(row)
+
+    state["cents"] += amount_to_cents(row[AMOUNT_COL])
+    epoch = timestamp_to_epoch(row[TIMESTAMP_COL])
+    k = bisect.bisect_right(state["epochs"], epoch)
+    state["epochs"].insert(k, epoch)
+    state["by_epoch"].insert(k, i)
+    positions = state["categories"].setdefault(
+        row[CATEGORY_COL], array.array("q")
+    )
+    positions.insert(bisect.bisect_left(positions, i), i)
+
+
+def request_fields(payload, current=None):
+    """
+    dict, dict -> str, str, str, str, float
+
+    payload is the JSON body of a request to record or modify a transaction
+    current is the transaction to modify (None to record a new one)
+
+    return the date, time, category, description and amount of the
+    transaction, taking those missing from payload from current, or the
+    current date and time; raise ValueError if any of them is invalid
+    """
+    if current is None:
+        now = datetime.datetime.now()
+        date, time = now.strftime("%Y-%m-%d"), now.strftime("%H:%M:%S")
+        category, description, amount = "", "", None
+    else:
+        date, _, time = current[TIMESTAMP_COL].partition(" ")
+        category = current[CATEGORY_COL]
+        description = current[DESCRIPTION_COL]
+        amount = f"{abs(float(current[AMOUNT_COL])):.2f}"
+
+    date = str(payload.get("date", date))
+    time = str(payload.get("time", time))
+    amount = payload.get("amount", amount)
+    if isinstance(amount, (int, float)) and round(amount, 2) == amount:
+        amount = f"{amount:.2f}"
+    if not is_valid_date(date):
+        raise ValueError(f"invalid date {date!r}")
+    if not is_valid_time(time):
+        raise ValueError(f"invalid time {time!r}")
+    if not isinstance(amount, str) or not is_valid_amount(amount):
+        raise ValueError(f"invalid amount {amount!r}")
+    return (
+        date,
+        time,
+        str(payload.get("category", category)),
+        str(payload.get("description", description)),
+        float(amount),
+    )
+
+
+async def server_write(state, write):
+    """
+    dict, function -> dict
+
+    state is the state of a ledger server
+    write writes a transaction to the ledger and returns its row
+
+    queue write for the ledger writer and return the row it wrote
+    """
+    done = asyncio.get_running_loop().create_future()
+    await state["writes"].put((write, done))
+    return await done
+
+
+async def ledger_writer(state):
+    """
+    dict -> None
+
+    state is the state of a ledger server
+
+    run the queued writes one at a time, each in a worker thread so that
+    reads are served in the meantime, and apply the row each one wrote to
+    the rows in memory
+    """
+    writes = state["writes"]
+    while True:
+        write, done = await writes.get()
+        try:
+            row = await asyncio.to_thread(write)
+            server_store_row(state, row)
+        # report any failure to the request rather than stop the writer
+        except Exception as error:
+            done.set_exception(error)
+        else:
+            done.set_result(row)
+        finally:
+            writes.task_done()
+
+
+async def serve_balance(state, query, payload):
+    """
+    dict, dict, dict -> int, dict
+
+    state is the state of a ledger server
+    query is the query string of the request
+    payload is the JSON body of the request
+
+    return the status and body of a response with the current balance
+    """
+    return 200, {"balance": state["cents"] / 100, "rows": len(state["rows"])}
+
+
+async def serve_history(state, query, payload):
+    """
+    dict, dict, dict -> int, dict
+
+    state is the state of a ledger server
+    query is the query string of the request (first ID and count)
+    payload is the JSON body of the request
+
+    return the status and body of a response with a page of transactions
+    """
+    first_id = int(query.get("first", 1))
+    count = max(int(query.get("count", PAGE_ROWS)), 0)
+    start = bisect.bisect_left(state["ids"], first_id)
+    return 200, {
+        "transactions": state["rows"][start : start + count],
+        "last_id": state["ids"][-1] if state["ids"] else 0,
+    }
+
+
+async def serve_search(state, query, payload):
+    """
+    dict, dict, dict -> int, dict
+
+    state is the state of a ledger server
+    query is the query string of the request: a date (year, month or
+    day), a start and end date, a category, a description or keywords
+    (with any and ignore_case flags)
+    payload is the JSON body of the request
+
+    return the status and body of a response with the matching
+    transactions in ID order
+    """
+    rows = state["rows"]
+    if "date" in query or "start" in query or "end" in query:
+        if "date" in query:
+            start, end = period_bounds(query["date"])
+        else:
+            start = period_bounds(query.get("start", ""))[0]
+            end = period_bounds(query.get("end", ""))[1]
+        epochs = state["epochs"]
+        first = bisect.bisect_left(epochs, start)
+        last = bisect.bisect_left(epochs, end)
+        matches = [rows[i] for i in sorted(state["by_epoch"][first:last])]
+    elif "category" in query:
+        positions = state["categories"].get(query["category"], ())
+        matches = [rows[i] for i in positions]
+    elif "description" in query:
+        matches = [
+            row for row in rows if query["description"] in row[DESCRIPTION_COL]
+        ]
+    elif "keywords" in query:
+        terms = query["keywords"].split()
+        match_all = query.get("any", "").lower() not in TRUE_VALUES
+        ignore_case = query.get("ignore_case", "").lower() in TRUE_VALUES
+        matches = [
+            row
+            for row in rows
+            if description_matches(
+                row[DESCRIPTION_COL], terms, match_all, ignore_case
+            )
+        ]
+    else:
+        raise ValueError(
+            "search by date, start and end, category, description or keywords"
+        )
+    return 200, {"transactions": matches}
+
+
+async def serve_record(state, payload, create_record):
+    """
+    dict, dict, function -> int, dict
+
+    state is the state of a ledger server
+    payload is the JSON body of the request
+    create_record is create_deposit_record or create_withdraw_record
+
+    record the transaction in payload through the ledger writer and return
+    the status and body of a response with its row
+    """
+    fields = request_fields(payload)
+
+    def write():
+        record = create_record(*fields)
+        with ledger_lock(state["ledger_file"]):
+            # create_record numbers the record for LEDGER_FILENAME
+            record[ID_COL] = next_row_id(state["ledger_file"])
+            write_record(state["ledger_file"], record)
+        return {name: str(record[name]) for name in COL_NAMES}
+
+    return 201, {"transaction": await server_write(state, write)}
+
+
+async def serve_deposit(state, query, payload):
+    """
+    dict, dict, dict -> int, dict
+
+    state is the state of a ledger server
+    query is the query string of the request
+    payload is the JSON body of the request (amount and optionally date,
+    time, category and description)
+
+    record a credit and return the status and body of the response
+    """
+    return await serve_record(state, payload, create_deposit_record)
+
+
+async def serve_withdraw(state, query, payload):
+    """
+    dict, dict, dict -> int, dict
+
+    state is the state of a ledger server
+    query is the query string of the request
+    payload is the JSON body of the request (amount and optionally date,
+    time, category and description)
+
+    record a debit and return the status and body of the response
+    """
+    return await serve_record(state, payload, create_withdraw_record)
+
+
+async def serve_modify(state, query, payload):
+    """
+    dict, dict, dict -> int, dict
+
+    state is the state of a ledger server
+    query is the query string of the request
+    payload is the JSON body of the request (id and any of date, time,
+    category, description and amount to change)
+
+    modify a transaction like modify_transaction and return the status and
+    body of the response
+    """
+    row_id = payload.get("id")
+    if not isinstance(row_id, int):
+        raise ValueError(f"invalid transaction ID {row_id!r}")
+
+    def write():
+        # read the current row here so that earlier queued writes count
+        current = state["rows"][server_position(state, row_id)]
+        date, time, category, description, amount = request_fields(
+            payload, current
+        )
+        modify_transaction(
+            state["ledger_file"],
+            row_id,
+            date,
+            time,
+            category,
+            description,
+            amount,
+        )
+        return dict(
+            current,
+            **{
+                TIMESTAMP_COL: date + " " + time,
+                CATEGORY_COL: category,
+                DESCRIPTION_COL: description,
+                AMOUNT_COL: f"{-1 * amount:.2f}"
+                if current[AMOUNT_COL][0] == "-"
+                else f"{amount:.2f}",
+            },
+        )
+
+    return 200, {"transaction": await server_write(state, write)}
+
+
+SERVER_ROUTES = {
+    ("GET", "/balance"): serve_balance,
+    ("GET", "/history"): serve_history,
+    ("GET", "/search"): serve_search,
+    ("POST", "/deposit"): serve_deposit,
+    ("POST", "/withdraw"): serve_withdraw,
+    ("POST", "/modify"): serve_modify,
+}
+
+
+async def read_request(reader):
+    """
+    asyncio.StreamReader -> dict or None
+
+    reader reads from a client's connection
+
+    return the method, path, query, JSON body and keep-alive flag of the
+    client's next HTTP request, or None if the client is done; raise
+    ValueError if the request is malformed
+    """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    parts = line.decode("latin-1").split()
+    if len(parts) != 3:
+        raise ValueError("malformed request line")
+    method, target, version = parts
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = headers.get("content-length", "0")
+    if not length.isdigit():
+        raise ValueError("invalid Content-Length")
+    if int(length) > SERVER_MAX_BODY:
+        raise ValueError(f"request body over {SERVER_MAX_BODY} bytes")
+    body = await reader.readexactly(int(length))
+    payload = json.loads(body) if body else {}
+    if not isinstance(payload, dict):
+        raise ValueError("request body is not a JSON object")
+    url = urllib.parse.urlsplit(target)
+    connection = headers.get("connection", "").lower()
+    return {
+        "method": method,
+        "path": url.path,
+        "query": dict(urllib.parse.parse_qsl(url.query)),
+        "payload": payload,
+        "keep_alive": connection == "keep-alive"
+        if version == "HTTP/1.0"
+        else connection != "close",
+    }
+
+
+def http_response(status, body, keep_alive):
+    """
+    int, dict, bool -> bytes
+
+    status is the HTTP status code
+    body is the JSON body of the response
+    keep_alive is True to keep the connection open for further requests
+
+    return the HTTP response
+    """
+    content = json.dumps(body).encode()
+    head = (
+        f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(content)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + content
+
+
+async def serve_connection(state, reader, writer):
+    """
+    dict, asyncio.StreamReader, asyncio.StreamWriter -> None
+
+    state is the state of a ledger server
+    reader and writer are a client's connection
+
+    answer the client's requests until it closes the connection
+    """
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except ValueError as error:
+                writer.write(http_response(400, {"error": str(error)}, False))
+                break
+            if request is None:
+                break
+            route = SERVER_ROUTES.get((request["method"], request["path"]))
+            try:
+                if route is None:
+                    status, body = 404, {
+                        "error": f"no endpoint {request['method']} "
+                        f"{request['path']}"
+                    }
+                else:
+                    status, body = await route(
+                        state, request["query"], request["payload"]
+                    )
+            # a malformed request fails with one of these
+            except (ValueError, LookupError, TypeError) as error:
+                status, body = 400, {"error": repr(error)}
+            # anything else is the server's fault, but must not drop the
+            # connection without a response
+            except Exception as error:
+                status, body = 500, {"error": repr(error)}
+            writer.write(http_response(status, body, request["keep_alive"]))
+            await writer.drain()
+            if not request["keep_alive"]:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(ledger_file, host=None, port=None):
+    """
+    str, str, int -> asyncio.Server, dict
+
+    ledger_file is the name of the ledger file
+    host is the address to listen on (SERVER_HOST if None)
+    port is the port to listen on (SERVER_PORT if None, any free port if 0)
+
+    load the ledger and start serving it over HTTP, reads from memory and
+    writes through a single ledger writer task
+
+    return the server and its state
+    """
+    state = load_server_state(ledger_file)
+    state["writes"] = asyncio.Queue()
+    state["writer"] = asyncio.create_task(ledger_writer(state))
+    server = await asyncio.start_server(
+        lambda reader, writer: serve_connection(state, reader, writer),
+        SERVER_HOST if host is None else host,
+        SERVER_PORT if port is None else port,
+    )
+    return server, state
+
+
+async def stop_server(server, state):
+    """
+    asyncio.Server, dict -> None
+
+    server and state are returned by start_server
+
+    stop accepting connections, finish the queued writes and stop the
+    ledger writer
+    """
+    server.close()
+    await server.wait_closed()
+    await state["writes"].join()
+    state["writer"].cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await state["writer"]
+
+
+def serve_ledger(ledger_file, host=None, port=None):
+    """
+    str, str, int -> None
+
+    ledger_file is the name of the ledger file
+    host is the address to listen on (SERVER_HOST if None)
+    port is the port to listen on (SERVER_PORT if None, any free port if 0)
+
+    serve the ledger over HTTP until interrupted; the server assumes it is
+    the only writer of the ledger while it runs
+    """
+
+    async def serve():
+        server, state = await start_server(ledger_file, host, port)
+        address = server.sockets[0].getsockname()
+        print(
+            f"Serving {ledger_file} ({len(state['rows'])} transactions) "
+            f"on http://{address[0]}:{address[1]}",
+            flush=True,
+        )
+        try:
+            await server.serve_forever()
+        finally:
+            await stop_server(server, state)
+
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(serve())
+
+
+def io_counters():
+    """
+    None -> tuple of (int, int) or None
+
+    return the bytes this process has read and written through system
+    calls so far, or None where the system does not count them
+    """
+    try:
+        # io.open rather than open, which counting_open may shadow
+        with io.open("/proc/self/io") as pf:
+            fields = dict(line.split(":", 1) for line in pf)
+    except OSError:
+        return None
+    return int(fields["rchar"]), int(fields["wchar"])
+
+
+def switch_phase(action, phase):
+    """
+    dict, str -> str
+
+    action is the profile of the action being profiled
+    phase is the phase the action is entering
+
+    add the time since the last switch to the phase being left
+
+    return the phase being left
+    """
+    now = time.perf_counter()
+    left = action["phase"]
+    action["seconds"][left] += now - action["since"]
+    action["phase"], action["since"] = phase, now
+    return left
+
+
+def parsed_rows(result):
+    """
+    object -> int
+
+    result is returned by a function of the parse phase
+
+    return the number of rows in result
+    """
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict) and "ids" in result:
+        return len(result["ids"])
+    return 0
+
+
+def profiled(func, phase):
+    """
+    function, str -> function
+
+    func is the function to profile
+    phase is the phase its time is attributed to
+
+    return a function that calls func and, while an action is profiled on
+    the current thread, counts the call, attributes its time to phase (less
+    the time of profiled functions it calls) and counts the rows returned
+    by the outermost function of the parse phase
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        action = PROFILE
+        if action is None or action["thread"] != threading.get_ident():
+            return func(*args, **kwargs)
+        calls = action["calls"]
+        calls[func.__name__] = calls.get(func.__name__, 0) + 1
+        outer = switch_phase(action, phase)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            switch_phase(action, outer)
+        if phase == "parse" and outer != "parse":
+            action["rows_parsed"] += parsed_rows(result)
+        return result
+
+    return wrapper
+
+
+def counting_open(*args, **kwargs):
+    """
+    ... -> file
+
+    open a file as the built-in open does, counting it in the profile of
+    the action being profiled on the current thread
+    """
+    action = PROFILE
+    if action is not None and action["thread"] == threading.get_ident():
+        action["file_opens"] += 1
+    return io.open(*args, **kwargs)
+
+
+def profiled_command(run_command):
+    """
+    function -> function
+
+    run_command is the function running a command other than batch
+
+    return a function that runs a command as one profiled action
+    """
+
+    @functools.wraps(run_command)
+    def wrapper(args, ledger_file):
+        start_action(args.command)
+        try:
+            return run_command(args, ledger_file)
+        finally:
+            finish_action()
+
+    return wrapper
+
+
+def profiled_menu(get_action_choice):
+    """
+    function -> function
+
+    get_action_choice is the function prompting for a menu choice
+
+    return a function that finishes the profile of the previous menu
+    action before prompting and starts profiling the chosen one
+    """
+
+    @functools.wraps(get_action_choice)
+    def wrapper(prompt):
+        finish_action()
+        choice = get_action_choice(prompt)
+        if choice in MENU_ACTIONS:
+            start_action(MENU_ACTIONS[choice])
+        return choice
+
+    return wrapper
+
+
+def enable_profiling(profile_format, session=None, session_action=None):
+    """
+    str, str, str -> None
+
+    profile_format is "table" or "json"
+    session is "cprofile" or "tracemalloc" to also run that profiler over
+    one action, or None
+    session_action is the name of the action to run the session over (the
+    first one if None)
+
+    wrap the functions of PROFILE_PHASES and the entries of PROFILE_TABLES,
+    open and the entry points of commands and menu actions so that each
+    action is profiled
+    """
+    PROFILE_SETTINGS.update(
+        format=profile_format, session=session, session_action=session_action
+    )
+    if PROFILED_FUNCTIONS:
+        return
+    module = globals()
+    phases, wrappers = {}, {}
+    for phase, names in PROFILE_PHASES.items():
+        for name in names:
+            func = module.get(name) or getattr(builtins, name)
+            PROFILED_FUNCTIONS[name] = module.get(name)
+            module[name] = wrappers[func] = profiled(func, phase)
+            phases[name] = phase
+    for table_name in PROFILE_TABLES:
+        table = module[table_name]
+        PROFILED_TABLES[table_name] = dict(table)
+        for key, func in table.items():
+            if func in wrappers:
+                table[key] = wrappers[func]
+            elif key in phases:
+                table[key] = profiled(func, phases[key])
+    for name, wrap in (
+        ("run_command", profiled_command),
+        ("get_action_choice", profiled_menu),
+    ):
+        PROFILED_FUNCTIONS[name] = module[name]
+        module[name] = wrap(module[name])
+    PROFILED_FUNCTIONS["open"] = None
+    module["open"] = counting_open
+
+
+def disable_profiling():
+    """
+    None -> None
+
+    finish the action being profiled and unwrap the functions and table
+    entries wrapped by enable_profiling
+    """
+    finish_action()
+    module = globals()
+    for name, func in PROFILED_FUNCTIONS.items():
+        if func is None:
+            # a built-in shadowed by a wrapper
+            del module[name]
+        else:
+            module[name] = func
+    for table_name, table in PROFILED_TABLES.items():
+        module[table_name].update(table)
+    PROFILED_FUNCTIONS.clear()
+    PROFILED_TABLES.clear()
+    PROFILE_SETTINGS.update(format=None, session=None, session_action=None)
+
+
+def start_action(name):
+    """
+    str -> None
+
+    name is the name of the action (e.g., "history")
+
+    start profiling an action on the current thread, under the session
+    profiler if the session is still to run and was asked for this action
+    """
+    global PROFILE
+    finish_action()
+    session = PROFILE_SETTINGS["session"]
+    if session and PROFILE_SETTINGS["session_action"] in (None, name):
+        PROFILE_SETTINGS["session"] = None
+        if session == "cprofile":
+            session = cProfile.Profile()
+            session.enable()
+        else:
+            tracemalloc.start()
+    else:
+        session = None
+    PROFILE = {
+        "action": name,
+        "thread": threading.get_ident(),
+        "session": session,
+        "io": io_counters(),
+        "start": time.perf_counter(),
+        # time outside the profiled functions is computing
+        "phase": "compute",
+        "since": time.perf_counter(),
+        "seconds": dict.fromkeys(PROFILE_PHASES, 0.0),
+        "rows_parsed": 0,
+        "file_opens": 0,
+        "calls": {},
+    }
+
+
+def finish_action():
+    """
+    None -> None
+
+    finish profiling the action being profiled, if any, and print its
+    profile (and the report of its session) on stderr
+    """
+    global PROFILE
+    action, PROFILE = PROFILE, None
+    if action is None:
+        return
+    switch_phase(action, "compute")
+    sys.stdout.flush()
+    ended = io_counters()
+    session = action["session"]
+    if isinstance(session, cProfile.Profile):
+        session.disable()
+    elif session:
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    profile = {
+        "action": action["action"],
+        "seconds": round(time.perf_counter() - action["start"], 6),
+        **{
+            f"{phase}_seconds": round(seconds, 6)
+            for phase, seconds in action["seconds"].items()
+        },
+        "rows_parsed": action["rows_parsed"],
+        "file_opens": action["file_opens"],
+        # /proc/self/io counts the whole process, not just this action
+        "process_bytes_read": None,
+        "process_bytes_written": None,
+        "calls": action["calls"],
+    }
+    if action["io"] and ended:
+        profile["process_bytes_read"] = ended[0] - action["io"][0]
+        profile["process_bytes_written"] = ended[1] - action["io"][1]
+    if PROFILE_SETTINGS["format"] == "json":
+        print(json.dumps(profile), file=sys.stderr)
+    else:
+        print_profile(profile)
+
+    if isinstance(session, cProfile.Profile):
+        stats = pstats.Stats(session, stream=sys.stderr)
+        stats.sort_stats("cumulative").print_stats(PROFILE_SESSION_LINES)
+    elif session:
+        print(f"peak traced memory: {peak:,} bytes", file=sys.stderr)
+        for stat in snapshot.statistics("lineno")[:PROFILE_SESSION_LINES]:
+            print(stat, file=sys.stderr)
+
+
+def print_profile(profile):
+    """
+    dict -> None
+
+    profile is the profile of an action made by finish_action
+
+    print profile on stderr as a table
+    """
+    lines = [f"\nprofile of {profile['action']}: {profile['seconds']:.6f}s\n"]
+    for phase in PROFILE_PHASES:
+        lines.append(f"  {phase:<16}{profile[phase + '_seconds']:>14.6f}s\n")
+    for key in (
+        "rows_parsed",
+        "file_opens",
+        "process_bytes_read",
+        "process_bytes_written",
+    ):
+        value = "n/a" if profile[key] is None else f"{profile[key]:,}"
+        lines.append(f"  {key.replace('_', ' '):<22}{value:>9}\n")
+    for name, count in sorted(profile["calls"].items()):
+        lines.append(f"  {name + '()':<30}{count:>5} calls\n")
+    sys.stderr.write("".join(lines))
+
+
+def checkbook_loop():
+    """
+    implements CLI for checkbook application
+    """
+    menu = (
+        f"\nWhat would you like to do?\n\n"
+        f"{OPTION_VIEW_BALANCE}) View current balance\n"
+        f"{OPTION_WITHDRAW}) Record a debit (withdraw)\n"
+        f"{OPTION_DEPOSIT}) Record a credit (deposit)\n"
+        f"{OPTION_VIEW_HISTORY}) View and search transaction history\n"
+        f"{OPTION_MODIFY_TRANSACTION}) Modify a transaction\n"
+        f"{OPTION_BALANCE_AS_OF}) View balance as of a past date\n"
+        f"{OPTION_EXIT}) Exit\n"
+    )
+    date_prompt = "\nEnter date (YYYY-MM-DD): "
+    start_date_prompt = "\nEnter start date (YYYY-MM-DD): "
+    end_date_prompt = "Enter end date (YYYY-MM-DD): "
+    month_prompt = "\nEnter month (YYYY-MM): "
+    year_prompt = "\nEnter year (YYYY): "
+    time_prompt = "Enter time (HH:MM:SS in 24-hour clock format): "
+    category_prompt = "Enter a category: "
+    description_prompt = "Enter a description: "
+    amount_prompt = "Enter amount: $"
+
+    while True:
+        print(menu)
+        action_choice = get_action_choice("Your choice? ")
+
+        # process menu choice #################################################
+        if action_choice == OPTION_VIEW_BALANCE:
+            balance = view_balance(LEDGER_FILENAME)
+            print(f"\nYour current balance is : ${balance:,.2f}")
+            print()
+
+        elif action_choice == OPTION_WITHDRAW:
+            date = get_date_input(date_prompt)
+            time = get_time_input(time_prompt)
+            category = input(category_prompt)
+            description = input(description_prompt)
+
+            debit_value = get_valid_amount(amount_prompt)
+
+            withdraw_record = create_withdraw_record(
+                date, time, category, description, debit_value
+            )
+            write_record(LEDGER_FILENAME, withdraw_record)
+
+        elif action_choice == OPTION_DEPOSIT:
+            date = get_date_input(date_prompt)
+            time = get_time_input(time_prompt)
+            category = input(category_prompt)
+            description = input(description_prompt)
+
+            credit_value = get_valid_amount(amount_prompt)
+
+            deposit_record = create_deposit_record(
+                date, time, category, description, credit_value
+            )
+            write_record(LEDGER_FILENAME, deposit_record)
+
+        elif action_choice == OPTION_VIEW_HISTORY:
+            if last_row_id(LEDGER_FILENAME) > PAGE_ROWS:
+                page_ledger(LEDGER_FILENAME)
+            else:
+                print_history(LEDGER_FILENAME)
+            history_choice = input("\nSearch transactions (y/n)? ")
+            if history_choice.lower().startswith("y"):
+                search_choice = input(
+                    "\n1) Select By Date\n2) Select By Category\n3) Select By "
+                    "Description\n4) Select By Keywords\n5) Select By Several "
+                    "Filters\n6) Exit to main menu\n\nYour Choice? "
+                )
+                while search_choice not in ("1", "2", "3", "4", "5", "6"):
+                    search_choice = input(
+                        f"\nInvalid choice: {search_choice}\n\n"
+                        "Please enter 1-6: "
+                    )
+                if int(search_choice) == 1:
+                    print("\n1: Search by date")
+                    date_mode = input(
+                        "\nSearch a (d)ay, (m)onth, (y)ear or (r)ange? "
+                    ).lower()
+                    if date_mode.startswith("r"):
+                        start_date = get_date_input(start_date_prompt)
+                        end_date = get_date_input(end_date_prompt)
+                        start, _ = period_bounds(start_date)
+                        _, end = period_bounds(end_date)
+                        print_by_date_range(
+                            start_date,
+                            end_date,
+                            date_range_transactions(
+                                LEDGER_FILENAME, start, end
+                            ),
+                        )
+                    else:
+                        if date_mode.startswith("m"):
+                            period = get_period_input(month_prompt)
+                        elif date_mode.startswith("y"):
+                            period = get_period_input(year_prompt)
+                        else:
+                            period = get_date_input(date_prompt)
+                        print_by_date(
+                            period,
+                            date_range_transactions(
+                                LEDGER_FILENAME, *period_bounds(period)
+                            ),
+                        )
+                elif int(search_choice) == 2:
+                    print("\n2: Search by category\n")
+                    category = input(category_prompt)
+                    print_by_cat(
+                        category,
+                        category_transactions(LEDGER_FILENAME, category),
+                    )
+                elif int(search_choice) == 3:
+                    print("\n3: Search by description keyword\n")
+                    descript = input(
+                        "Search descriptions with word or phrase: "
+                    )
+                    print_by_desc(
+                        descript,
+                        description_transactions(LEDGER_FILENAME, [descript]),
+                    )
+                elif int(search_choice) == 4:
+                    print("\n4: Search by several keywords\n")
+                    terms = input("Search descriptions with words: ").split()
+                    match_all = not input(
+                        "Match (a)ll or a(n)y of the words? "
+                    ).lower().startswith("n")
+                    ignore_case = input("Ignore case (y/n)? ").lower()
+                    ignore_case = ignore_case.startswith("y")
+                    print_by_keywords(
+                        terms,
+                        description_transactions(
+                            LEDGER_FILENAME, terms, match_all, ignore_case
+                        ),
+                        match_all,
+                        ignore_case,
+                    )
+                elif int(search_choice) == 5:
+                    print(
+                        "\n5: Search by several filters (leave blank to "
+                        "skip)\n"
+                    )
+                    print_query(LEDGER_FILENAME, get_query_input())
+                elif int(search_choice) == 6:
+                    print("\nReturning to main menu")
+
+        elif action_choice == OPTION_MODIFY_TRANSACTION:
+            tid_prompt = "Enter id of transaction to modify: "
+            transaction_id = int(
+                get_transaction_id(tid_prompt, LEDGER_FILENAME)
+            )
+
+            date = get_date_input(date_prompt)
+            time = get_time_input(time_prompt)
+            category = input(category_prompt)
+            description = input(description_prompt)
+            amount = get_valid_amount(amount_prompt)
+
+            try:
+                modify_transaction(
+                    LEDGER_FILENAME,
+                    transaction_id,
+                    date,
+                    time,
+                    category,
+                    description,
+                    amount,
+                )
+            except ValueError as error:
+                print(f"\nCannot modify: {error}")
+
+        elif action_choice == OPTION_BALANCE_AS_OF:
+            period = get_period_input(
+                "\nEnter the date, month or year to close (YYYY-MM-DD, "
+                "YYYY-MM or YYYY): "
+            )
+            since = get_optional_input(
+                "Net change since the start of (YYYY-MM-DD, YYYY-MM or "
+                "YYYY; blank for none): ",
+                is_valid_period,
+            )
+            print_balance_as_of(LEDGER_FILENAME, period, since or None)
+
+        elif action_choice == OPTION_EXIT:
+            return
+
+
+def set_winsize(rows, cols):
+    sys.stdout.write(f"\x1b[8;{rows};{cols}t")
+
+
+def date_argument(value):
+    """
+    str -> str
+
+    value is a command line argument
+
+    return value if it is a valid date (YYYY-MM-DD); otherwise, raise
+    argparse.ArgumentTypeError
+    """
+    if not is_valid_date(value):
+        raise argparse.ArgumentTypeError(f"invalid date {value!r}")
+    return value
+
+
+def period_argument(value):
+    """
+    str -> str
+
+    value is a command line argument
+
+    return value if it is a valid year, month or day; otherwise, raise
+    argparse.ArgumentTypeError
+    """
+    if not is_valid_period(value):
+        raise argparse.ArgumentTypeError(f"invalid date {value!r}")
+    return value
+
+
+def time_argument(value):
+    """
+    str -> str
+
+    value is a command line argument
+
+    return value if it is a valid time (HH:MM:SS); otherwise, raise
+    argparse.ArgumentTypeError
+    """
+    if not is_valid_time(value):
+        raise argparse.ArgumentTypeError(f"invalid time {value!r}")
+    return value
+
+
+def amount_argument(value):
+    """
+    str -> float
+
+    value is a command line argument
+
+    return value cast to a float if it is a valid dollar value; otherwise,
+    raise argparse.ArgumentTypeError
+    """
+    if not is_valid_amount(value):
+        raise argparse.ArgumentTypeError(f"invalid amount {value!r}")
+    return float(value)
+
+
+def command_parser():
+    """
+    None -> argparse.ArgumentParser
+
+    return the parser of the checkbook's command line
+    """
+    parser = argparse.ArgumentParser(description="Terminal checkbook.")
+    parser.add_argument(
+        "--backend",
+        choices=tuple(LEDGER_FILENAMES),
+        default=os.environ.get(BACKEND_ENV_VAR, "csv"),
+        help=f"storage backend (default: ${BACKEND_ENV_VAR} or csv)",
+    )
+    parser.add_argument(
+        "--ledger",
+        help="ledger file to use (default: the backend's ledger file); "
+        "files ending in .db, .sqlite or .sqlite3 use SQLite, files "
+        "ending in .bin the binary format and directories ending in "
+        ".shards are sharded by month or year",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_const",
+        const="table",
+        default=os.environ.get(PROFILE_ENV_VAR),
+        help="report the time each action spent parsing, computing and "
+        "rendering, the rows it parsed and the files and bytes it read and "
+        f"wrote on stderr (default: ${PROFILE_ENV_VAR}, set to table, json "
+        "or 1)",
+    )
+    parser.add_argument(
+        "--profile-json",
+        dest="profile",
+        action="store_const",
+        const="json",
+        help="report the profile of each action as a JSON line",
+    )
+    parser.add_argument(
+        "--profile-session",
+        choices=("cprofile", "tracemalloc"),
+        help="also run cProfile or tracemalloc over one action",
+    )
+    parser.add_argument(
+        "--profile-action",
+        help="name of the action (e.g., history) to run the profile session "
+        "over (default: the first action)",
+    )
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("balance", help="print the current balance")
+    for command, kind in (("deposit", "credit"), ("withdraw", "debit")):
+        record_parser = commands.add_parser(
+            command, help=f"record a {kind} ({command})"
+        )
+        record_parser.add_argument(
+            "amount", type=amount_argument, help="amount (e.g., 50.50)"
+        )
+        record_parser.add_argument(
+            "--date", type=date_argument, help="YYYY-MM-DD (default: today)"
+        )
+        record_parser.add_argument(
+            "--time", type=time_argument, help="HH:MM:SS (default: now)"
+        )
+        record_parser.add_argument("--category", default="")
+        record_parser.add_argument("--description", default="")
+    summary_parser = commands.add_parser(
+        "summary",
+        help="print the count, total, minimum, maximum and mean amount of "
+        "each category and month",
+    )
+    summary_parser.add_argument(
+        "--by",
+        choices=ROLLUP_KINDS,
+        action="append",
+        help="group to summarize by (default: both)",
+    )
+    commands.add_parser(
+        "verify",
+        help="rebuild the summary from the transactions and report any "
+        "groups that differ",
+    )
+    history_parser = commands.add_parser(
+        "history", help="print the transaction history and its statistics"
+    )
+    history_parser.add_argument(
+        "--first",
+        type=int,
+        help="print only the transactions from this ID on",
+    )
+    history_parser.add_argument(
+        "--count",
+        type=int,
+        help="print only this many transactions",
+    )
+    query_options = history_parser.add_argument_group(
+        "query",
+        "print only the transactions matching every filter given, in one "
+        "pass, followed by statistics of the matches",
+    )
+    query_options.add_argument(
+        "--category",
+        action="append",
+        dest="categories",
+        help="match this category (repeat to match any of several)",
+    )
+    query_options.add_argument(
+        "--from",
+        dest="from_period",
+        type=period_argument,
+        metavar="PERIOD",
+        help="match from this year, month or day (YYYY[-MM[-DD]]) on",
+    )
+    query_options.add_argument(
+        "--to",
+        dest="to_period",
+        type=period_argument,
+        metavar="PERIOD",
+        help="match up to the end of this year, month or day",
+    )
+    query_options.add_argument(
+        "--description",
+        action="append",
+        dest="terms",
+        metavar="WORD",
+        help="match descriptions containing this word or phrase (repeat "
+        "to require several)",
+    )
+    query_options.add_argument(
+        "--any",
+        action="store_true",
+        help="match any of the descriptions instead of all of them",
+    )
+    query_options.add_argument(
+        "--ignore-case",
+        action="store_true",
+        help="ignore case of descriptions",
+    )
+    query_options.add_argument(
+        "--min-amount",
+        type=float,
+        help="match signed amounts of at least this (e.g., -500)",
+    )
+    query_options.add_argument(
+        "--max-amount",
+        type=float,
+        help="match signed amounts of at most this",
+    )
+    query_options.add_argument(
+        "--sort", choices=QUERY_SORT_KEYS, help="order matches by this"
+    )
+    query_options.add_argument(
+        "--reverse",
+        action="store_true",
+        help="order matches from the largest to the smallest",
+    )
+    query_options.add_argument(
+        "--limit", type=int, help="print only this many matches"
+    )
+    search_parser = commands.add_parser("search", help="search transactions")
+    search_by = search_parser.add_mutually_exclusive_group(required=True)
+    search_by.add_argument(
+        "--date", type=period_argument, help="YYYY, YYYY-MM or YYYY-MM-DD"
+    )
+    search_by.add_argument(
+        "--range",
+        nargs=2,
+        type=date_argument,
+        metavar=("START", "END"),
+        help="first and last date (YYYY-MM-DD)",
+    )
+    search_by.add_argument("--category")
+    search_by.add_argument("--description", help="word or phrase")
+    search_by.add_argument("--keywords", nargs="+", metavar="WORD")
+    search_parser.add_argument(
+        "--any",
+        action="store_true",
+        help="match any of the keywords instead of all of them",
+    )
+    search_parser.add_argument(
+        "--ignore-case", action="store_true", help="ignore case of keywords"
+    )
+    modify_parser = commands.add_parser(
+        "modify",
+        help="modify a transaction, keeping the fields that are not given",
+    )
+    modify_parser.add_argument("id", type=int, help="ID of the transaction")
+    modify_parser.add_argument("--date", type=date_argument)
+    modify_parser.add_argument("--time", type=time_argument)
+    modify_parser.add_argument("--category")
+    modify_parser.add_argument("--description")
+    modify_parser.add_argument("--amount", type=amount_argument)
+    serve_parser = commands.add_parser(
+        "serve", help="serve the ledger over HTTP with a JSON API"
+    )
+    serve_parser.add_argument(
+        "--host",
+        default=SERVER_HOST,
+        help="address to listen on (default: %(default)s)",
+    )
+    serve_parser.add_argument(
+        "--port",
+        type=int,
+        default=SERVER_PORT,
+        help="port to listen on, 0 for any free port (default: %(default)s)",
+    )
+    batch_parser = commands.add_parser(
+        "batch",
+        help="run one command per line of a file in a single process, "
+        "keeping the ledger loaded between commands",
+    )
+    batch_parser.add_argument(
+        "file",
+        nargs="?",
+        default="-",
+        help='file of commands (default: "-" for standard input)',
+    )
+    import_parser = commands.add_parser(
+        "import", help="append transactions from a CSV or JSONL file"
+    )
+    import_parser.add_argument(
+        "file", help='file to import ("-" for standard input)'
+    )
+    import_parser.add_argument(
+        "--format",
+        choices=("csv", "jsonl"),
+        help="format of the file (default: from its extension, else csv)",
+    )
+    migrate_parser = commands.add_parser(
+        "migrate", help="copy a ledger into a new ledger file"
+    )
+    migrate_parser.add_argument(
+        "source",
+        nargs="?",
+        default=LEDGER_FILENAMES["csv"],
+        help="ledger file to copy (default: %(default)s)",
+    )
+    migrate_parser.add_argument(
+        "target",
+        nargs="?",
+        default=LEDGER_FILENAMES["sqlite"],
+        help="ledger file to create (default: %(default)s)",
+    )
+    migrate_parser.add_argument(
+        "--shard-period",
+        choices=tuple(SHARD_PERIOD_LENGTHS),
+        default=SHARD_PERIOD,
+        help="period of each shard of a sharded target (default: %(default)s)",
+    )
+    archive_parser = commands.add_parser(
+        "archive",
+        help="move the transactions dated before a period out of a CSV "
+        "ledger into its compressed archive",
+    )
+    archive_parser.add_argument(
+        "before",
+        type=period_argument,
+        help="YYYY, YYYY-MM or YYYY-MM-DD at which the history to keep "
+        "starts",
+    )
+    archive_parser.add_argument(
+        "--codec",
+        choices=tuple(ARCHIVE_CODECS),
+        default=ARCHIVE_CODEC,
+        help="compression of the new blocks (default: %(default)s)",
+    )
+    as_of_parser = commands.add_parser(
+        "as-of",
+        help="print the balance at the end of a past day, month or year",
+    )
+    as_of_parser.add_argument(
+        "period", type=period_argument, help="YYYY, YYYY-MM or YYYY-MM-DD"
+    )
+    as_of_parser.add_argument(
+        "--since",
+        type=period_argument,
+        help="also print the net change from the start of this YYYY, "
+        "YYYY-MM or YYYY-MM-DD to the end of period",
+    )
+    consolidate_parser = commands.add_parser(
+        "consolidate",
+        help="print the statistics of many ledgers, one per account, and "
+        "of all of them together",
+    )
+    consolidate_parser.add_argument(
+        "sources",
+        nargs="+",
+        help="ledger files, directories of ledger files or quoted glob "
+        'patterns (e.g., "accounts/*.csv")',
+    )
+    consolidate_parser.add_argument(
+        "--history",
+        action="store_true",
+        help="first print the transactions of every account, merged in "
+        "timestamp order",
+    )
+    consolidate_parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="load the ledgers in worker processes rather than threads",
+    )
+    consolidate_parser.add_argument(
+        "--workers",
+        type=int,
+        help="number of ledgers loaded at once (default: the pool's)",
+    )
+    return parser
+
+
+def run_command(args, ledger_file):
+    """
+    argparse.Namespace, str -> int
+
+    args are the parsed arguments of a command other than batch
+    ledger_file is the name of the ledger file
+
+    run the command and return its exit status
+    """
+    global LEDGER_FILENAME, SHARD_PERIOD
+    if args.command == "migrate":
+        default_shard_period, SHARD_PERIOD = SHARD_PERIOD, args.shard_period
+        try:
+            count = migrate_ledger(args.source, args.target)
+        except (FileExistsError, FileNotFoundError, ValueError) as error:
+            print(error, file=sys.stderr)
+            return 1
+        finally:
+            SHARD_PERIOD = default_shard_period
+        print(f"Copied {count} transactions to {args.target}.")
+        return 0
+
+    if args.command == "consolidate":
+        try:
+            ledger_files = find_ledgers(args.sources)
+        except FileNotFoundError as error:
+            print(error, file=sys.stderr)
+            return 1
+        _, failed = consolidate_ledgers(
+            ledger_files, args.history, args.processes, args.workers
+        )
+        return 1 if failed else 0
+
+    if args.command == "archive":
+        try:
+            count = archive_ledger(ledger_file, args.before, args.codec)
+        except (FileNotFoundError, ValueError) as error:
+            print(error, file=sys.stderr)
+            return 1
+        index = archive_index(ledger_file)
+        print(
+            f"Archived {count} transactions; the archive holds "
+            f"{len(index['blocks']) if index else 0} blocks."
+        )
+        return 0
+
+    if args.command == "import":
+        records, rejected = import_transactions(
+            ledger_file, args.file, args.format
+        )
+        for line_num, reason in rejected:
+            print(f"Rejected line {line_num}: {reason}", file=sys.stderr)
+        if records:
+            print(
+                f"Imported {len(records)} transactions "
+                f"(IDs {records[0][ID_COL]}-{records[-1][ID_COL]})."
+            )
+        else:
+            print("Imported 0 transactions.")
+        print(f"Rejected {len(rejected)} rows.")
+        return 1 if rejected else 0
+
+    LEDGER_FILENAME = ledger_file
+    if not file_exists(ledger_file):
+        create_ledger_file(ledger_file)
+
+    if args.command == "balance":
+        print(f"Your current balance is : ${view_balance(ledger_file):,.2f}")
+
+    elif args.command in ("deposit", "withdraw"):
+        now = datetime.datetime.now()
+        create_record = (
+            create_deposit_record
+            if args.command == "deposit"
+            else create_withdraw_record
+        )
+        record = create_record(
+            args.date or now.strftime("%Y-%m-%d"),
+            args.time or now.strftime("%H:%M:%S"),
+            args.category,
+            args.description,
+            args.amount,
+        )
+        write_record(ledger_file, record)
+        print(f"Recorded transaction {record[ID_COL]}.")
+
+    elif args.command == "as-of":
+        print_balance_as_of(ledger_file, args.period, args.since)
+
+    elif args.command == "summary":
+        rollups = ledger_rollups(ledger_file)
+        for kind in args.by or ROLLUP_KINDS:
+            print_rollups(rollups, kind)
+
+    elif args.command == "verify":
+        differences = verify_rollups(ledger_file)
+        for kind, key, maintained, rebuilt in differences:
+            print(
+                f"{kind} {key!r}: summary had {maintained}, "
+                f"transactions give {rebuilt}"
+            )
+        if differences:
+            print(f"Rebuilt the summary; {len(differences)} groups differed.")
+            return 1
+        print("The summary matches the transactions.")
+
+    elif args.command == "history":
+        query = history_query(args)
+        if query is not None:
+            if args.first is not None or args.count is not None:
+                print(
+                    "--first and --count cannot be combined with queries",
+                    file=sys.stderr,
+                )
+                return 1
+            print_query(ledger_file, query)
+        elif args.first is None and args.count is None:
+            print_history(ledger_file)
+        else:
+            first_id = args.first or 1
+            count = args.count
+            if count is None:
+                count = max(last_row_id(ledger_file) - first_id + 1, 0)
+            print_ledger(read_page(ledger_file, first_id, count))
+
+    elif args.command == "search":
+        if args.date:
+            print_by_date(
+                args.date,
+                date_range_transactions(
+                    ledger_file, *period_bounds(args.date)
+                ),
+            )
+        elif args.range:
+            start, _ = period_bounds(args.range[0])
+            _, end = period_bounds(args.range[1])
+            print_by_date_range(
+                *args.range, date_range_transactions(ledger_file, start, end)
+            )
+        elif args.category is not None:
+            print_by_cat(
+                args.category,
+                category_transactions(ledger_file, args.category),
+            )
+        elif args.description is not None:
+            print_by_desc(
+                args.description,
+                description_transactions(ledger_file, [args.description]),
+            )
+        else:
+            print_by_keywords(
+                args.keywords,
+                description_transactions(
+                    ledger_file, args.keywords, not args.any, args.ignore_case
+                ),
+                not args.any,
+                args.ignore_case,
+            )
+
+    elif args.command == "modify":
+        if not is_valid_transaction_id(ledger_file, args.id):
+            print(f"Invalid transaction ID: {args.id}", file=sys.stderr)
+            return 1
+        current = read_page(ledger_file, args.id, 1)[0]
+        date, _, time = current[TIMESTAMP_COL].partition(" ")
+        amount = args.amount
+        if amount is None:
+            amount = abs(float(current[AMOUNT_COL]))
+        try:
+            modify_transaction(
+                ledger_file,
+                args.id,
+                args.date or date,
+                args.time or time,
+                current[CATEGORY_COL]
+                if args.category is None
+                else args.category,
+                current[DESCRIPTION_COL]
+                if args.description is None
+                else args.description,
+                amount,
+            )
+        except ValueError as error:
+            print(f"Cannot modify: {error}", file=sys.stderr)
+            return 1
+        print(f"Modified transaction {args.id}.")
+
+    elif args.command == "serve":
+        serve_ledger(ledger_file, args.host, args.port)
+
+    return 0
+
+
+def history_query(args):
+    """
+    argparse.Namespace -> dict or None
+
+    args are the parsed arguments of the history command
+
+    return the query made of the query options in args, or None if none
+    were given
+    """
+    if not any(
+        value not in (None, False)
+        for value in (
+            args.categories,
+            args.from_period,
+            args.to_period,
+            args.terms,
+            args.min_amount,
+            args.max_amount,
+            args.sort,
+            args.reverse,
+            args.limit,
+        )
+    ):
+        return None
+    return make_query(
+        categories=args.categories,
+        start=period_bounds(args.from_period)[0] if args.from_period else None,
+        end=period_bounds(args.to_period)[1] if args.to_period else None,
+        terms=args.terms,
+        match_all=not args.any,
+        ignore_case=args.ignore_case,
+        min_amount=args.min_amount,
+        max_amount=args.max_amount,
+        sort=args.sort,
+        reverse=args.reverse,
+        limit=args.limit,
+    )
+
+
+def run_batch(parser, args):
+    """
+    argparse.ArgumentParser, argparse.Namespace -> int
+
+    parser is the parser returned by command_parser
+    args are the parsed arguments of the batch command
+
+    run each line of the batch file as a command in this process, keeping
+    the ledgers loaded between commands; blank lines and lines starting
+    with "#" are skipped and lines that fail are reported on stderr
+
+    return 1 if any command failed; otherwise, 0
+    """
+    global CACHE_LEDGERS
+    if args.file == "-":
+        context = contextlib.nullcontext(sys.stdin)
+    else:
+        context = open(args.file)
+    default_cache, CACHE_LEDGERS = CACHE_LEDGERS, True
+    ran, failed = 0, 0
+    try:
+        with context as bf:
+            for line_num, line in enumerate(bf, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                ran += 1
+                try:
+                    # the batch's --backend and --ledger are the defaults
+                    line_args = parser.parse_args(
+                        shlex.split(line),
+                        argparse.Namespace(
+                            backend=args.backend, ledger=args.ledger
+                        ),
+                    )
+                    if line_args.command in (None, "batch"):
+                        raise ValueError("expected a command other than batch")
+                    status = run_command(
+                        line_args,
+                        line_args.ledger
+                        or LEDGER_FILENAMES[line_args.backend],
+                    )
+                except SystemExit as error:
+                    # argparse has already reported the error
+                    status = error.code
+                except (OSError, ValueError) as error:
+                    print(f"Line {line_num}: {error}", file=sys.stderr)
+                    status = 1
+                if status:
+                    print(f"Line {line_num} failed.", file=sys.stderr)
+                    failed += 1
+    finally:
+        CACHE_LEDGERS = default_cache
+        if not CACHE_LEDGERS:
+            LEDGER_CACHE.clear()
+    print(f"Ran {ran} commands, {failed} failed.", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    """
+    list of str -> int
+
+    argv are the command line arguments (sys.argv[1:] if None)
+
+    run the interactive checkbook, or the command given in argv
+
+    return the exit status
+    """
+    global LEDGER_FILENAME, CACHE_LEDGERS
+    parser = command_parser()
+    args = parser.parse_args(argv)
+    if args.backend not in LEDGER_FILENAMES:
+        parser.error(f"unknown ${BACKEND_ENV_VAR}: {args.backend!r}")
+    ledger_file = args.ledger or LEDGER_FILENAMES[args.backend]
+    profile_format = args.profile
+    if profile_format in TRUE_VALUES or (
+        args.profile_session and not profile_format
+    ):
+        profile_format = "table"
+    if profile_format and profile_format not in PROFILE_FORMATS:
+        parser.error(f"unknown profile format: {profile_format!r}")
+    if profile_format:
+        enable_profiling(
+            profile_format, args.profile_session, args.profile_action
+        )
+
+    try:
+        if args.command == "batch":
+            return run_batch(parser, args)
+        if args.command:
+            return run_command(args, ledger_file)
+
+        LEDGER_FILENAME = ledger_file
+        CACHE_LEDGERS = True
+        if not file_exists(LEDGER_FILENAME):
+            create_ledger_file(LEDGER_FILENAME)
+
+        set_winsize(24, 125)
+        print("\n~~~ Welcome to your terminal checkbook! ~~~")
+        checkbook_loop()
+        return 0
+    finally:
+        if profile_format:
+            disable_profiling()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
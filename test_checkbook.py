@@ -1,7 +1,28 @@
+import asyncio
 import checkbook
+import concurrent.futures
 import csv
 import datetime
+import glob
+import itertools
+import json
+import multiprocessing
 import os
+import pytest
+import shutil
+
+
+FIXTURES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(autouse=True)
+def ledger_dir(tmp_path, monkeypatch):
+    # each test runs in its own directory on copies of the fixture ledgers,
+    # so that the sidecars written next to them (by reads, too) stay out of
+    # the repository
+    for fixture in glob.glob(os.path.join(FIXTURES_DIR, "dummy_ledger_*.csv")):
+        shutil.copy(fixture, tmp_path)
+    monkeypatch.chdir(tmp_path)
 
 
 def test_create_deposit_record():
@@ -90,13 +111,46 @@ def test_write_record():
         assert float(amounts[0]) == -20.50
         assert float(amounts[1]) == -1.98
 
-    os.remove(dummy_filename)
+    checkbook.remove_ledger_file(dummy_filename)
 
 
 def test_last_row_id():
     assert checkbook.last_row_id("dummy_ledger_file4.csv") == 0
     assert checkbook.last_row_id("dummy_ledger_file5.csv") == 2
 
+    # trailing blank lines, a single row and a missing file
+    assert checkbook.last_row_id("dummy_ledger_file1.csv") == 3
+    assert checkbook.last_row_id("dummy_ledger_file2.csv") == 1
+    assert checkbook.last_row_id("nonexistentfile.csv") == 0
+
+
+def test_last_row_id_multiline_description():
+    dummy_filename = "last_row_id_dummy.csv"
+    checkbook.create_ledger_file(dummy_filename)
+    assert checkbook.last_row_id(dummy_filename) == 0
+    assert checkbook.next_row_id(dummy_filename) == 1
+
+    with open(dummy_filename, "a") as df:
+        df.write("1,2016-04-03 12:43:12,income,paycheck,10.00\n")
+        df.write('2,2016-04-04 12:43:12,grocery,"gum\nand mints",-1.00\n')
+    assert checkbook.last_row_id(dummy_filename) == 2
+    assert checkbook.next_row_id(dummy_filename) == 3
+
+    # continuation lines that start with digits are not taken for rows
+    with open(dummy_filename, "a") as df:
+        df.write('3,2016-04-05 12:43:12,note,"a\n4,b,c,d,e\nf",-1.00\n')
+        df.write('60,2016-04-06 12:43:12,bulk,"bulk order\n3,000 units",')
+        df.write("-5.00\n")
+    assert checkbook.last_row_id(dummy_filename) == 60
+    assert checkbook.next_row_id(dummy_filename) == 61
+    with open(dummy_filename, "rb") as lf:
+        row = checkbook.find_row(lf, 60)
+        assert row["Description"] == "bulk order\n3,000 units"
+        # the row after 3 is 60, whose first line is not a whole row
+        assert checkbook.seek_row(lf, 4)[1] == os.path.getsize(dummy_filename)
+
+    os.remove(dummy_filename)
+
 
 def test_is_valid_amount():
     assert not checkbook.is_valid_amount("abcd")
@@ -112,6 +166,14 @@ def test_is_valid_amount():
 def test_file_exists():
     assert checkbook.file_exists("dummy_ledger_file1.csv")
     assert not checkbook.file_exists("nonexistentfile.csv")
+    # only a sharded ledger may be a directory
+    os.mkdir("dummy_directory.csv")
+    os.mkdir("dummy_directory.shards")
+    assert not checkbook.file_exists("dummy_directory.csv")
+    assert checkbook.file_exists("dummy_directory.shards")
+    os.rmdir("dummy_directory.csv")
+    os.rmdir("dummy_directory.shards")
+    assert not checkbook.file_exists("dummy_directory.shards")
 
 
 def test_create_ledger_file():
@@ -146,3 +208,1764 @@ def test_is_valid_transaction_id():
     assert not checkbook.is_valid_transaction_id("dummy_ledger_file4.csv", 1)
     assert checkbook.is_valid_transaction_id("dummy_ledger_file5.csv", 2)
 
+
+
+def test_view_balance_checkpoint(monkeypatch):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    dummy_filename = "balance_checkpoint_dummy.csv"
+    checkpoint_filename = checkbook.sidecar_filename(
+        dummy_filename, checkbook.BALANCE_SUFFIX
+    )
+    checkbook.create_ledger_file(dummy_filename)
+    checkbook.write_record(
+        dummy_filename,
+        {
+            checkbook.ID_COL: 1,
+            checkbook.TIMESTAMP_COL: "2016-04-03 12:43:12",
+            checkbook.CATEGORY_COL: "income",
+            checkbook.DESCRIPTION_COL: "paycheck",
+            checkbook.AMOUNT_COL: "100.00",
+        },
+    )
+    assert checkbook.view_balance(dummy_filename) == 100.00
+    assert checkbook.file_exists(checkpoint_filename)
+
+    # appends and modifications keep the checkpoint current
+    checkbook.write_record(
+        dummy_filename,
+        {
+            checkbook.ID_COL: 2,
+            checkbook.TIMESTAMP_COL: "2016-04-04 12:43:12",
+            checkbook.CATEGORY_COL: "grocery",
+            checkbook.DESCRIPTION_COL: "gum",
+            checkbook.AMOUNT_COL: "-1.50",
+        },
+    )
+    assert checkbook.read_sidecar(
+        dummy_filename, checkbook.BALANCE_SUFFIX
+    )["cents"] == 9850
+    checkbook.modify_transaction(
+        dummy_filename, 2, "2016-04-04", "12:43:12", "grocery", "gum", 2.50
+    )
+    assert checkbook.read_sidecar(
+        dummy_filename, checkbook.BALANCE_SUFFIX
+    )["cents"] == 9750
+    assert checkbook.view_balance(dummy_filename) == 97.50
+
+    # rows appended behind the checkpoint's back are picked up
+    with open(dummy_filename, "a") as df:
+        df.write("3,2016-04-05 12:00:00,income,refund,10.00\n")
+    assert checkbook.view_balance(dummy_filename) == 107.50
+
+    # an in-place edit of the same size forces a rebuild
+    with open(dummy_filename) as df:
+        contents = df.read()
+    with open(dummy_filename, "w") as df:
+        df.write(contents.replace("100.00", "900.00"))
+    assert checkbook.view_balance(dummy_filename) == 907.50
+
+    # so does an in-place edit hidden behind an append
+    with open(dummy_filename, "r+b") as df:
+        df.seek(df.read().index(b"900.00"))
+        df.write(b"100.00")
+    with open(dummy_filename, "a") as df:
+        df.write("4,2016-04-06 12:00:00,income,refund,1.00\n")
+    assert checkbook.view_balance(dummy_filename) == 108.50
+
+    # a checkpoint that cannot be saved does not fail the read
+    write_sidecar = checkbook.write_sidecar
+
+    def read_only(*args):
+        raise PermissionError("read-only")
+
+    monkeypatch.setattr(checkbook, "write_sidecar", read_only)
+    with open(dummy_filename, "a") as df:
+        df.write("5,2016-04-07 12:00:00,income,refund,1.00\n")
+    assert checkbook.view_balance(dummy_filename) == 109.50
+    monkeypatch.setattr(checkbook, "write_sidecar", write_sidecar)
+
+    checkbook.remove_ledger_file(dummy_filename)
+    assert not checkbook.file_exists(checkpoint_filename)
+
+
+def test_modify_transaction_change_log(monkeypatch):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    monkeypatch.setattr(checkbook, "COMPACT_LOG_BYTES", 10**9)
+    monkeypatch.setattr(checkbook, "COMPACT_LOG_RATIO", 10**9)
+    dummy_filename = "change_log_dummy.csv"
+    log_filename = checkbook.sidecar_filename(
+        dummy_filename, checkbook.LOG_SUFFIX
+    )
+    checkbook.create_ledger_file(dummy_filename)
+    for row_id, amount in enumerate(("10.00", "-2.00", "30.00"), 1):
+        checkbook.write_record(
+            dummy_filename,
+            {
+                checkbook.ID_COL: row_id,
+                checkbook.TIMESTAMP_COL: f"2016-04-0{row_id} 12:00:00",
+                checkbook.CATEGORY_COL: "cat",
+                checkbook.DESCRIPTION_COL: f"desc{row_id}",
+                checkbook.AMOUNT_COL: amount,
+            },
+        )
+    with open(dummy_filename) as df:
+        original = df.read()
+
+    checkbook.modify_transaction(
+        dummy_filename, 2, "2017-01-01", "01:02:03", "new", "changed", 5.00
+    )
+    checkbook.modify_transaction(
+        dummy_filename, 2, "2017-01-01", "01:02:03", "new", "again", 7.00
+    )
+
+    # the ledger is untouched and the latest amendment wins when read
+    with open(dummy_filename) as df:
+        assert df.read() == original
+    transactions = checkbook.get_trans(dummy_filename)
+    assert transactions[1][checkbook.DESCRIPTION_COL] == "again"
+    assert transactions[1][checkbook.AMOUNT_COL] == "-7.00"
+    assert transactions[1][checkbook.CATEGORY_COL] == "new"
+    assert checkbook.view_balance(dummy_filename) == 33.00
+    # a row missing from the ledger is amended from its logged amount
+    logged = checkbook.logged_original(dummy_filename, "2")
+    assert logged[checkbook.AMOUNT_COL] == "-2.00"
+    assert logged[checkbook.DESCRIPTION_COL] == "desc2"
+    with monkeypatch.context() as m:
+        m.setattr(checkbook, "find_row", lambda lf, row_id: None)
+        assert checkbook.view_balance(dummy_filename) == 33.00
+
+    checkbook.compact_ledger(dummy_filename)
+    assert not checkbook.file_exists(log_filename)
+    assert checkbook.get_trans(dummy_filename) == transactions
+    assert checkbook.view_balance(dummy_filename) == 33.00
+    assert not [
+        name
+        for name in os.listdir(".")
+        if name.startswith(dummy_filename) and name.endswith(".tmp")
+    ]
+
+    checkbook.remove_ledger_file(dummy_filename)
+
+
+def test_compaction_crash(monkeypatch):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    monkeypatch.setattr(checkbook, "COMPACT_LOG_RATIO", 10**9)
+    monkeypatch.setattr(checkbook, "COMPACT_LOG_BYTES", 10**9)
+    dummy_filename = "dummy_compaction_crash.csv"
+    log_filename = checkbook.sidecar_filename(
+        dummy_filename, checkbook.LOG_SUFFIX
+    )
+    checkbook.migrate_ledger("dummy_ledger_file1.csv", dummy_filename)
+    checkbook.modify_transaction(
+        dummy_filename, 1, "2017-02-03", "02:12:45", "cat1", "x", -20.00
+    )
+    # build the prefix sums and rollups over the log
+    end = checkbook.period_bounds("2020-12")[1]
+    checkbook.cents_before(dummy_filename, end)
+    checkbook.ledger_rollups(dummy_filename)
+
+    # crash after the compacted ledger is renamed, before the log is removed
+    remove = os.remove
+
+    def crash(filename):
+        if filename == log_filename:
+            raise KeyboardInterrupt
+        remove(filename)
+
+    with monkeypatch.context() as m:
+        m.setattr(os, "remove", crash)
+        with pytest.raises(KeyboardInterrupt):
+            checkbook.compact_ledger(dummy_filename)
+    assert checkbook.file_exists(log_filename)
+
+    # the log is not applied a second time over the compacted ledger
+    assert checkbook.view_balance(dummy_filename) == 20.00
+    assert not checkbook.file_exists(log_filename)
+    assert checkbook.cents_before(dummy_filename, end) == 2000
+    expected = checkbook.build_rollups(checkbook.get_trans(dummy_filename))
+    assert checkbook.ledger_rollups(dummy_filename) == expected
+
+    # a crash before the rename leaves the log to be applied
+    checkbook.modify_transaction(
+        dummy_filename, 2, "2017-02-03", "02:12:45", "cat2", "y", 5.00
+    )
+    replace = os.replace
+
+    def crash_before_rename(source, destination):
+        if destination == dummy_filename:
+            raise KeyboardInterrupt
+        replace(source, destination)
+
+    with monkeypatch.context() as m:
+        m.setattr(os, "replace", crash_before_rename)
+        with pytest.raises(KeyboardInterrupt):
+            checkbook.compact_ledger(dummy_filename)
+    assert checkbook.view_balance(dummy_filename) == 25.00
+    assert checkbook.cents_before(dummy_filename, end) == 2500
+    assert not checkbook.file_exists(
+        checkbook.sidecar_filename(dummy_filename, checkbook.COMPACTED_SUFFIX)
+    )
+
+    checkbook.remove_ledger_file(dummy_filename)
+
+
+def test_load_columns():
+    pytest.importorskip("numpy")
+    columns = checkbook.load_columns("dummy_ledger_file1.csv")
+    assert columns["ids"].tolist() == [1, 2, 3]
+    assert columns["cents"].tolist() == [2000, -1000, 5000]
+    assert columns["debits"].tolist() == [False, True, False]
+    assert columns["epochs"][0] == datetime.datetime(
+        2017, 2, 3, 2, 12, 45, tzinfo=datetime.timezone.utc
+    ).timestamp()
+    assert columns["categories"] == ["cat1", "cat2", "cat3"]
+    assert columns["category_codes"].tolist() == [0, 1, 2]
+
+
+def test_columnar_output_matches(capsys):
+    pytest.importorskip("numpy")
+    for ledger_file in (
+        "dummy_ledger_file1.csv",
+        "dummy_ledger_file2.csv",
+        "dummy_ledger_file3.csv",
+    ):
+        ledg_list = checkbook.get_trans(ledger_file)
+        columns = checkbook.load_columns(ledger_file)
+        for by_dicts, by_columns in (
+            (checkbook.print_by_date, checkbook.print_by_date_columns),
+            (checkbook.print_by_cat, checkbook.print_by_cat_columns),
+            (checkbook.print_by_desc, checkbook.print_by_desc_columns),
+        ):
+            for term in ("2017-03-10", "2018", "cat1", "desc", "nothing"):
+                by_dicts(term, ledg_list)
+                expected = capsys.readouterr().out
+                by_columns(term, columns)
+                assert capsys.readouterr().out == expected
+
+        checkbook.print_ledger_stats(ledg_list)
+        expected = capsys.readouterr().out
+        checkbook.print_ledger_stats_columns(columns)
+        assert capsys.readouterr().out == expected
+
+        transactions = checkbook.get_transactions(ledger_file)
+        checkbook.print_ledger(transactions)
+        checkbook.print_ledger_stats(transactions)
+        expected = capsys.readouterr().out
+        checkbook.print_history(ledger_file)
+        assert capsys.readouterr().out == expected
+
+
+def test_category_index(monkeypatch, capsys):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    monkeypatch.setattr(checkbook, "COMPACT_LOG_RATIO", 10**9)
+    dummy_filename = "category_index_dummy.csv"
+    index_filename = checkbook.sidecar_filename(
+        dummy_filename, checkbook.CATEGORY_INDEX_SUFFIX
+    )
+    checkbook.create_ledger_file(dummy_filename)
+
+    def write(row_id, category):
+        checkbook.write_record(
+            dummy_filename,
+            {
+                checkbook.ID_COL: row_id,
+                checkbook.TIMESTAMP_COL: "2016-04-03 12:43:12",
+                checkbook.CATEGORY_COL: category,
+                checkbook.DESCRIPTION_COL: f"desc{row_id}",
+                checkbook.AMOUNT_COL: f"-{row_id}.00",
+            },
+        )
+
+    for row_id, category in enumerate(("rent", "food", "rent", "fun"), 1):
+        write(row_id, category)
+    assert checkbook.category_ids(dummy_filename, "rent") == [1, 3]
+    assert checkbook.file_exists(index_filename)
+
+    # appends and category changes are reflected without a rebuild
+    write(5, "rent")
+    checkbook.modify_transaction(
+        dummy_filename, 1, "2016-04-03", "12:43:12", "food", "moved", 1.00
+    )
+    assert checkbook.category_ids(dummy_filename, "rent") == [3, 5]
+    assert checkbook.category_ids(dummy_filename, "food") == [1, 2]
+    assert checkbook.category_ids(dummy_filename, "none") == []
+
+    # the index survives compaction and matches a full scan
+    checkbook.refresh_category_index(dummy_filename)
+    checkbook.compact_ledger(dummy_filename)
+    header, _ = checkbook.read_index(
+        dummy_filename, checkbook.CATEGORY_INDEX_SUFFIX
+    )
+    assert checkbook.uncovered_bytes(dummy_filename, header["coverage"]) == 0
+    for category in ("rent", "food", "fun"):
+        checkbook.print_by_cat(
+            category, checkbook.get_trans(dummy_filename)
+        )
+        expected = capsys.readouterr().out
+        checkbook.print_by_cat(
+            category,
+            checkbook.category_transactions(dummy_filename, category),
+        )
+        assert capsys.readouterr().out == expected
+
+    # an out-of-band edit forces a rebuild
+    with open(dummy_filename) as df:
+        contents = df.read()
+    with open(dummy_filename, "w") as df:
+        df.write(contents.replace(",fun,", ",food,"))
+    assert checkbook.category_ids(dummy_filename, "food") == [1, 2, 4]
+
+    checkbook.remove_ledger_file(dummy_filename)
+
+
+def test_period_bounds():
+    day = 24 * 60 * 60
+    start, end = checkbook.period_bounds("2017-02-03")
+    assert start == checkbook.timestamp_to_epoch("2017-02-03 00:00:00")
+    assert end - start == day
+    start, end = checkbook.period_bounds("2016-02")
+    assert (end - start) == 29 * day
+    start, end = checkbook.period_bounds("2016")
+    assert end == checkbook.timestamp_to_epoch("2017-01-01 00:00:00")
+    assert checkbook.is_valid_period("2016-12")
+    assert not checkbook.is_valid_period("2016-13")
+    assert not checkbook.is_valid_period("2016-1")
+
+
+def test_timestamp_index(monkeypatch):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    monkeypatch.setattr(checkbook, "COMPACT_LOG_RATIO", 10**9)
+    dummy_filename = "timestamp_index_dummy.csv"
+    checkbook.create_ledger_file(dummy_filename)
+
+    def write(row_id, timestamp):
+        checkbook.write_record(
+            dummy_filename,
+            {
+                checkbook.ID_COL: row_id,
+                checkbook.TIMESTAMP_COL: timestamp,
+                checkbook.CATEGORY_COL: "cat",
+                checkbook.DESCRIPTION_COL: f"desc{row_id}",
+                checkbook.AMOUNT_COL: "1.00",
+            },
+        )
+
+    write(1, "2017-01-15 10:00:00")
+    write(2, "2017-02-03 02:12:45")
+    write(3, "2017-02-28 23:59:59")
+    assert checkbook.timestamp_ids(
+        dummy_filename, *checkbook.period_bounds("2017-02")
+    ) == [2, 3]
+
+    # out-of-order appends and modified timestamps
+    write(4, "2016-12-31 12:00:00")
+    write(5, "2017-02-10 08:00:00")
+    checkbook.modify_transaction(
+        dummy_filename, 1, "2017-02-01", "00:00:00", "cat", "moved", 1.00
+    )
+    assert checkbook.timestamp_ids(
+        dummy_filename, *checkbook.period_bounds("2017-02")
+    ) == [1, 2, 3, 5]
+    assert checkbook.timestamp_ids(
+        dummy_filename, *checkbook.period_bounds("2016")
+    ) == [4]
+
+    # the same answers once the changes are saved into the index
+    checkbook.refresh_timestamp_index(dummy_filename)
+    _, arrays = checkbook.read_index(
+        dummy_filename, checkbook.TIMESTAMP_INDEX_SUFFIX
+    )
+    assert list(arrays["ids"]) == [4, 1, 2, 5, 3]
+    start, _ = checkbook.period_bounds("2017-02-03")
+    _, end = checkbook.period_bounds("2017-02-10")
+    rows = checkbook.date_range_transactions(dummy_filename, start, end)
+    assert [row[checkbook.ID_COL] for row in rows] == ["2", "5"]
+
+    checkbook.remove_ledger_file(dummy_filename)
+
+
+def test_description_index(monkeypatch, capsys):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    monkeypatch.setattr(checkbook, "COMPACT_LOG_RATIO", 10**9)
+    dummy_filename = "description_index_dummy.csv"
+    checkbook.create_ledger_file(dummy_filename)
+
+    def write(row_id, description):
+        checkbook.write_record(
+            dummy_filename,
+            {
+                checkbook.ID_COL: row_id,
+                checkbook.TIMESTAMP_COL: "2016-04-03 12:43:12",
+                checkbook.CATEGORY_COL: "cat",
+                checkbook.DESCRIPTION_COL: description,
+                checkbook.AMOUNT_COL: f"-{row_id}.00",
+            },
+        )
+
+    def search_ids(terms, match_all=True, ignore_case=False):
+        return [
+            int(row[checkbook.ID_COL])
+            for row in checkbook.description_transactions(
+                dummy_filename, terms, match_all, ignore_case
+            )
+        ]
+
+    write(1, "ACH payment to landlord")
+    write(2, "ach refund from store")
+    write(3, "Groceries at the store")
+    assert search_ids(["ACH"]) == [1]
+    assert search_ids(["ACH"], ignore_case=True) == [1, 2]
+    assert search_ids(["store", "refund"]) == [2]
+    assert search_ids(["landlord", "Groceries"], match_all=False) == [1, 3]
+    assert search_ids(["at", "store"]) == [3]
+    assert search_ids(["at", "ACH"], match_all=False) == [1, 3]
+
+    # appended and modified descriptions are searched without a rebuild
+    write(4, "ACH transfer")
+    checkbook.modify_transaction(
+        dummy_filename, 1, "2016-04-03", "12:43:12", "cat", "rent check", 1.0
+    )
+    assert search_ids(["ACH"]) == [4]
+    assert search_ids(["rent"]) == [1]
+    checkbook.refresh_trigram_index(dummy_filename)
+    assert search_ids(["ACH"]) == [4]
+
+    for term in ("ACH", "store", "nothing", "e"):
+        checkbook.print_by_desc(term, checkbook.get_trans(dummy_filename))
+        expected = capsys.readouterr().out
+        checkbook.print_by_desc(
+            term, checkbook.description_transactions(dummy_filename, [term])
+        )
+        assert capsys.readouterr().out == expected
+
+    checkbook.remove_ledger_file(dummy_filename)
+
+
+def test_print_ledger_batched(monkeypatch, capsys):
+    monkeypatch.setattr(checkbook, "RENDER_BATCH_ROWS", 2)
+    ledg_list = checkbook.get_trans("dummy_ledger_file1.csv")
+    checkbook.print_ledger(ledg_list)
+    batched = capsys.readouterr().out
+    print(
+        f"\n{checkbook.ID_COL:<4}|{checkbook.TIMESTAMP_COL:<20}|"
+        f"{checkbook.CATEGORY_COL:<20}|{checkbook.DESCRIPTION_COL:<50}|"
+        f"{checkbook.AMOUNT_COL:<15}"
+    )
+    for transaction in ledg_list:
+        checkbook.print_transaction(transaction)
+    assert batched == capsys.readouterr().out
+
+    checkbook.print_ledger([])
+    assert capsys.readouterr().out.endswith("None.\n")
+
+
+def test_read_page(monkeypatch, capsys):
+    ledger_file = "dummy_ledger_file1.csv"
+    ledg_list = checkbook.get_trans(ledger_file)
+    assert checkbook.read_page(ledger_file, 1, 2) == ledg_list[:2]
+    assert checkbook.read_page(ledger_file, 2, 5) == ledg_list[1:]
+    assert checkbook.read_page(ledger_file, 4, 5) == []
+
+    # the menu pages large ledgers and only reads them whole for statistics
+    checkbook.print_ledger_stats(ledg_list)
+    stats = capsys.readouterr().out
+    monkeypatch.setattr(checkbook, "PAGE_ROWS", 2)
+    monkeypatch.setattr(checkbook, "LEDGER_FILENAME", ledger_file)
+    monkeypatch.setattr(checkbook, "get_trans", None)
+    answers = iter(["4", "n", "q", "n", "4", "s", "", "q", "n", "6"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+    checkbook.checkbook_loop()
+    out = capsys.readouterr().out
+    assert "Transactions 3-3 of 3" in out
+    first, second = out.split("What would you like to do?")[1:3]
+    assert stats not in first and stats in second
+
+
+def test_import_transactions(monkeypatch, capsys):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    dummy_filename = "dummy_import_ledger.csv"
+    csv_filename = "dummy_import.csv"
+    jsonl_filename = "dummy_import.jsonl"
+    checkbook.create_ledger_file(dummy_filename)
+    checkbook.write_record(
+        dummy_filename,
+        {
+            "ID": 1,
+            "Timestamp": "2016-04-03 12:43:12",
+            "Category": "cat",
+            "Description": "desc",
+            "Amount": "10.00",
+        },
+    )
+    checkbook.view_balance(dummy_filename)  # write a balance checkpoint
+
+    with open(csv_filename, "w") as imp:
+        imp.write(
+            "Date,Time,Category,Description,Amount\n"
+            "2017-01-02,08:00:00,income,paycheck,100.00\n"
+            "2017-01-32,08:00:00,income,bad date,1.00\n"
+            '2017-01-03,09:30:00,grocery,"milk, eggs",-12.50\n'
+            "2017-01-04,9am,grocery,bad time,1.00\n"
+            "2017-01-05,10:00:00,grocery,bad amount,12.5\n"
+        )
+    with open(jsonl_filename, "w") as imp:
+        imp.write(
+            '{"Timestamp": "2017-02-01 07:00:00", "Category": "rent", '
+            '"Description": "February", "Amount": -500}\n'
+            "not json\n"
+            "\n"
+            '{"Timestamp": "2017-02-02 07:00:00", "Amount": 0.5}\n'
+        )
+
+    records, rejected = checkbook.import_transactions(
+        dummy_filename, csv_filename
+    )
+    assert [record["ID"] for record in records] == [2, 3]
+    assert [line_num for line_num, _ in rejected] == [3, 5, 6]
+    status = checkbook.main(
+        ["--ledger", dummy_filename, "import", jsonl_filename]
+    )
+    assert status == 1
+    out, err = capsys.readouterr()
+    assert "Imported 2 transactions (IDs 4-5)." in out
+    assert "Rejected line 2: invalid JSON" in err
+
+    ledg_list = checkbook.get_trans(dummy_filename)
+    assert [row["Amount"] for row in ledg_list] == [
+        "10.00",
+        "100.00",
+        "-12.50",
+        "-500.00",
+        "0.50",
+    ]
+    assert ledg_list[2]["Description"] == "milk, eggs"
+    assert ledg_list[4]["Category"] == ""
+    assert checkbook.view_balance(dummy_filename) == -402.0
+    assert checkbook.read_sidecar(dummy_filename, ".balance")["rows"] == 5
+
+    checkbook.remove_ledger_file(dummy_filename)
+    os.remove(csv_filename)
+    os.remove(jsonl_filename)
+
+
+def test_storage_backends(monkeypatch, capsys):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    csv_filename = "dummy_backend_ledger.csv"
+    checkbook.migrate_ledger("dummy_ledger_file3.csv", csv_filename)
+    record = checkbook.create_withdraw_record(
+        "2019-05-06", "07:08:09", "cat9", "new desc", 12.5
+    )
+    record["ID"] = checkbook.next_row_id(csv_filename)
+    checkbook.write_record(csv_filename, record)
+    checkbook.modify_transaction(
+        csv_filename, 2, "2018-01-01", "00:00:00", "cat1", "changed", 7.3
+    )
+
+    for other_filename in (
+        "dummy_backend_ledger.db",
+        "dummy_backend_ledger.bin",
+        "dummy_backend_ledger.shards",
+    ):
+        status = checkbook.main(
+            ["migrate", "dummy_ledger_file3.csv", other_filename]
+        )
+        assert status == 0
+        assert checkbook.main(["migrate", csv_filename, other_filename]) == 1
+        capsys.readouterr()
+        checkbook.write_record(other_filename, record)
+        checkbook.modify_transaction(
+            other_filename, 2, "2018-01-01", "00:00:00", "cat1", "changed", 7.3
+        )
+
+        def same(func, *args):
+            result = func(csv_filename, *args)
+            assert func(other_filename, *args) == result
+            return result
+
+        assert len(same(checkbook.get_trans)) == 3
+        same(checkbook.view_balance)
+        same(checkbook.last_row_id)
+        same(checkbook.read_page, 2, 2)
+        same(checkbook.category_transactions, "cat1")
+        same(checkbook.category_transactions, "cat2")
+        same(
+            checkbook.date_range_transactions, *checkbook.period_bounds("2018")
+        )
+        same(checkbook.description_transactions, ["DESC"], False, True)
+        same(checkbook.description_transactions, ["desc", "new"])
+        same(checkbook.description_transactions, [], False)
+        assert checkbook.is_valid_transaction_id(other_filename, 2)
+        assert not checkbook.is_valid_transaction_id(other_filename, 99)
+
+        # converting back gives the same ledger
+        round_trip = "dummy_round_trip.csv"
+        checkbook.migrate_ledger(other_filename, round_trip)
+        assert checkbook.get_trans(round_trip) == checkbook.get_trans(
+            csv_filename
+        )
+        checkbook.remove_ledger_file(round_trip)
+        checkbook.remove_ledger_file(other_filename)
+        assert not os.path.exists(other_filename)
+
+    assert checkbook.last_row_id("no_such_ledger.db") == 0
+    assert checkbook.last_row_id("no_such_ledger.bin") == 0
+    with pytest.raises(FileNotFoundError):
+        checkbook.get_trans("no_such_ledger.db")
+    with pytest.raises(FileNotFoundError):
+        checkbook.get_trans("no_such_ledger.bin")
+    with pytest.raises(FileNotFoundError):
+        checkbook.get_trans("no_such_ledger.shards")
+    checkbook.remove_ledger_file(csv_filename)
+
+
+def test_binary_ledger(monkeypatch):
+    dummy_filename = "dummy_binary_ledger.bin"
+    checkbook.migrate_ledger("dummy_ledger_file1.csv", dummy_filename)
+    ledg_list = checkbook.get_trans("dummy_ledger_file1.csv")
+    assert checkbook.get_trans(dummy_filename) == ledg_list
+    balance = checkbook.view_balance("dummy_ledger_file1.csv")
+
+    # IDs that are not consecutive are found by binary search
+    record = dict(ledg_list[0], ID="10")
+    checkbook.write_record(dummy_filename, record)
+    assert checkbook.read_page(dummy_filename, 4, 5) == [record]
+    assert checkbook.is_valid_transaction_id(dummy_filename, 10)
+    assert not checkbook.is_valid_transaction_id(dummy_filename, 4)
+    # a record whose ID has been taken is given the next free one
+    checkbook.write_record(dummy_filename, record)
+    assert record["ID"] == 11
+    with pytest.raises(ValueError):
+        checkbook.BINARY_BACKEND["append_records"](dummy_filename, [record])
+
+    # a partial record left by an interrupted write is ignored
+    with open(dummy_filename, "ab") as lf:
+        lf.write(b"partial")
+    assert checkbook.last_row_id(dummy_filename) == 11
+    checkbook.write_record(dummy_filename, dict(record, ID="12"))
+    assert checkbook.last_row_id(dummy_filename) == 12
+
+    # modifications append their descriptions to the heap before the
+    # record is rewritten, never overwriting a description still in use
+    heap_filename = dummy_filename + checkbook.BINARY_HEAP_SUFFIX
+    heap_size = os.path.getsize(heap_filename)
+    descriptions = ("desc", "de", "desc", "longer description")
+    for description in descriptions:
+        checkbook.modify_transaction(
+            dummy_filename, 2, "2020-01-01", "00:00:00", "c", description, 10
+        )
+        assert checkbook.read_page(dummy_filename, 2, 1)[0] == {
+            "ID": "2",
+            "Timestamp": "2020-01-01 00:00:00",
+            "Category": "c",
+            "Description": description,
+            "Amount": "-10.00",
+        }
+    assert os.path.getsize(heap_filename) == heap_size + sum(
+        map(len, descriptions)
+    )
+    # a crash before the record is written leaves the old description
+    def crash(fd):
+        raise KeyboardInterrupt
+
+    with monkeypatch.context() as m:
+        m.setattr(os, "fsync", crash)
+        with pytest.raises(KeyboardInterrupt):
+            checkbook.modify_transaction(
+                dummy_filename, 2, "2020-01-01", "00:00:00", "c", "gum", 10
+            )
+    assert checkbook.read_page(dummy_filename, 2, 1)[0]["Description"] == (
+        "longer description"
+    )
+
+    with open(dummy_filename, "ab") as lf:
+        lf.write(b"partial")
+    monkeypatch.setattr(checkbook, "np", None)
+    assert checkbook.view_balance(dummy_filename) == balance + 60.0
+    with pytest.raises(ImportError):
+        checkbook.load_columns(dummy_filename)
+    checkbook.remove_ledger_file(dummy_filename)
+
+    with open("dummy_fractional.csv", "w") as lf:
+        lf.write("ID,Timestamp,Category,Description,Amount\n")
+        lf.write("1,2017-02-03 02:12:45.5,cat,desc,1.00\n")
+    with pytest.raises(ValueError):
+        checkbook.migrate_ledger("dummy_fractional.csv", dummy_filename)
+    assert not os.path.exists(dummy_filename)
+    os.remove("dummy_fractional.csv")
+
+
+def test_binary_columns(capsys):
+    pytest.importorskip("numpy")
+    dummy_filename = "dummy_binary_ledger.bin"
+    for ledger_file in (
+        "dummy_ledger_file1.csv",
+        "dummy_ledger_file2.csv",
+        "dummy_ledger_file3.csv",
+    ):
+        checkbook.migrate_ledger(ledger_file, dummy_filename)
+        columns = checkbook.load_columns(dummy_filename)
+        checkbook.print_ledger_stats(checkbook.get_trans(ledger_file))
+        expected = capsys.readouterr().out
+        checkbook.print_ledger_stats_columns(columns)
+        assert capsys.readouterr().out == expected
+        checkbook.print_by_cat("cat2", checkbook.get_trans(ledger_file))
+        expected = capsys.readouterr().out
+        checkbook.print_by_cat_columns("cat2", columns)
+        assert capsys.readouterr().out == expected
+        del columns
+        checkbook.remove_ledger_file(dummy_filename)
+
+
+def test_sharded_ledger(monkeypatch):
+    dummy_dirname = "dummy_sharded_ledger.shards"
+    checkbook.main(["migrate", "dummy_ledger_file1.csv", dummy_dirname])
+    manifest = checkbook.shard_manifest(dummy_dirname)
+    assert manifest["period"] == "month"
+    assert sorted(manifest["shards"]) == ["2017-02", "2017-03", "2018-05"]
+    assert manifest["shards"]["2017-03"]["cents"] == -1000
+    assert checkbook.view_balance(dummy_dirname) == checkbook.view_balance(
+        "dummy_ledger_file1.csv"
+    )
+
+    opened = []
+    read_shard = checkbook.read_shard
+    monkeypatch.setattr(
+        checkbook,
+        "read_shard",
+        lambda ledger_dir, period: opened.append(period)
+        or read_shard(ledger_dir, period),
+    )
+    rows = checkbook.date_range_transactions(
+        dummy_dirname, *checkbook.period_bounds("2017-03")
+    )
+    assert [row["ID"] for row in rows] == ["2"]
+    assert opened == ["2017-03"]
+
+    # modifying a transaction only rewrites its shard, or moves it
+    opened.clear()
+    checkbook.modify_transaction(
+        dummy_dirname, 1, "2017-02-04", "00:00:00", "cat", "desc", 25.0
+    )
+    assert opened == ["2017-02"]
+    checkbook.modify_transaction(
+        dummy_dirname, 2, "2018-05-01", "00:00:00", "cat", "desc", 5.0
+    )
+    manifest = checkbook.shard_manifest(dummy_dirname)
+    assert sorted(manifest["shards"]) == ["2017-02", "2018-05"]
+    assert manifest["shards"]["2018-05"]["first_id"] == 2
+    assert [row["ID"] for row in checkbook.get_trans(dummy_dirname)] == [
+        "1",
+        "2",
+        "3",
+    ]
+    assert checkbook.view_balance(dummy_dirname) == 25.0 - 5.0 + 50.0
+
+    # a shard changed behind the manifest's back is summarized again
+    with open(checkbook.shard_filename(dummy_dirname, "2017-02"), "a") as sf:
+        sf.write("4,2017-02-05 00:00:00,cat,desc,1.00\n")
+    assert checkbook.view_balance(dummy_dirname) == 71.0
+    assert checkbook.last_row_id(dummy_dirname) == 4
+
+    # a move interrupted after writing either shard leaves one copy
+    rewrite_shard = checkbook.rewrite_shard
+    for rewrites, balance in ((0, 71.0), (1, 72.0)):
+        written = []
+
+        def crash(*args):
+            if len(written) == rewrites:
+                raise KeyboardInterrupt
+            written.append(args[2])
+            rewrite_shard(*args)
+
+        with monkeypatch.context() as m:
+            m.setattr(checkbook, "rewrite_shard", crash)
+            with pytest.raises(KeyboardInterrupt):
+                checkbook.modify_transaction(
+                    dummy_dirname, 4, "2018-05-02", "00:00:00", "c", "d", 2.0
+                )
+        assert written == ["2018-05"][:rewrites]
+        ids = [row["ID"] for row in checkbook.get_trans(dummy_dirname)]
+        assert ids == ["1", "2", "3", "4"]
+        assert checkbook.view_balance(dummy_dirname) == balance
+    assert "moving" not in checkbook.shard_manifest(dummy_dirname)
+
+    checkbook.remove_ledger_file(dummy_dirname)
+    checkbook.main(
+        [
+            "migrate",
+            "--shard-period",
+            "year",
+            "dummy_ledger_file1.csv",
+            dummy_dirname,
+        ]
+    )
+    manifest = checkbook.shard_manifest(dummy_dirname)
+    assert sorted(manifest["shards"]) == ["2017", "2018"]
+    checkbook.remove_ledger_file(dummy_dirname)
+
+
+def test_parallel_parsing(monkeypatch):
+    dummy_filename = "dummy_parallel_ledger.csv"
+    with open(dummy_filename, "w", newline="") as lf:
+        writer = csv.writer(lf)
+        writer.writerow(checkbook.COL_NAMES)
+        for row_id in range(1, 201):
+            description = f"desc {row_id}"
+            if row_id % 7 == 0:
+                description = f'multi\nline, "quoted"\r\n{row_id}'
+            writer.writerow(
+                [
+                    row_id,
+                    "2017-02-03 02:12:45",
+                    f"cat{row_id % 3}",
+                    description,
+                    f"{(-1) ** row_id * row_id * 1.25:.2f}",
+                ]
+            )
+            if row_id % 50 == 0:
+                lf.write("\n")
+    serial_cents = checkbook.ledger_balance_cents(dummy_filename)
+    os.remove(dummy_filename + ".balance")
+
+    monkeypatch.setattr(checkbook, "PARALLEL_WORKERS", 2)
+    monkeypatch.setattr(checkbook, "PARALLEL_MIN_BYTES", 1)
+    monkeypatch.setattr(checkbook, "PARALLEL_CHUNK_BYTES", 97)
+    assert checkbook.ledger_balance_cents(dummy_filename) == serial_cents
+    # workers are not forked while another thread holds the ledger lock
+    assert checkbook.PROCESS_START_METHOD != "fork"
+    with checkbook.process_pool(1) as pool:
+        assert pool._mp_context.get_start_method() != "fork"
+
+    with open(dummy_filename, "a") as lf:
+        lf.write("201,2017-02-03 02:12:45,short\n")
+        lf.write("202,2017-02-03 02:12:45,long,desc,1.00,extra\n")
+    with monkeypatch.context() as serial_only:
+        serial_only.setattr(checkbook, "PARALLEL_WORKERS", 1)
+        serial = checkbook.get_trans(dummy_filename)
+    assert len(serial) == 202
+    for chunk_bytes in (50, 97, 4096):
+        monkeypatch.setattr(checkbook, "PARALLEL_CHUNK_BYTES", chunk_bytes)
+        assert checkbook.parallel_get_trans(dummy_filename) == serial
+        assert checkbook.get_trans(dummy_filename) == serial
+
+    checkbook.remove_ledger_file(dummy_filename)
+
+
+def test_ledger_cache(monkeypatch):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    monkeypatch.setattr(checkbook, "COMPACT_LOG_RATIO", 1000)
+    monkeypatch.setattr(checkbook, "LEDGER_CACHE", {})
+    dummy_filename = "dummy_cached_ledger.csv"
+    checkbook.migrate_ledger("dummy_ledger_file1.csv", dummy_filename)
+
+    parsed = []
+    parse_chunk_rows = checkbook.parse_chunk_rows
+    monkeypatch.setattr(
+        checkbook,
+        "parse_chunk_rows",
+        lambda filename, start, end, *args: parsed.append((filename, start))
+        or parse_chunk_rows(filename, start, end, *args),
+    )
+
+    def check(parses):
+        parsed.clear()
+        monkeypatch.setattr(checkbook, "CACHE_LEDGERS", True)
+        cached = (
+            checkbook.get_trans(dummy_filename),
+            checkbook.view_balance(dummy_filename),
+            checkbook.last_row_id(dummy_filename),
+            checkbook.is_valid_transaction_id(dummy_filename, 2),
+        )
+        monkeypatch.setattr(checkbook, "CACHE_LEDGERS", False)
+        assert cached == (
+            checkbook.get_trans(dummy_filename),
+            checkbook.view_balance(dummy_filename),
+            checkbook.last_row_id(dummy_filename),
+            True,
+        )
+        assert parsed == parses
+
+    check([(dummy_filename, 0)])
+    check([])
+
+    # the cache's own writes are applied without reading them back
+    monkeypatch.setattr(checkbook, "CACHE_LEDGERS", True)
+    record = dict(checkbook.get_trans(dummy_filename)[0], ID=4)
+    checkbook.write_record(dummy_filename, record)
+    checkbook.modify_transaction(
+        dummy_filename, 2, "2016-04-03", "12:43:12", "cat", "desc", 1.0
+    )
+    checkbook.modify_transaction(
+        dummy_filename, 3, "2016-04-03", "12:43:12", "cat", "desc", 2.0
+    )
+    check([])
+
+    # rows appended by someone else are parsed from where the cache ended
+    size = os.path.getsize(dummy_filename)
+    with open(dummy_filename, "a") as lf:
+        lf.write('5,2017-02-03 02:12:45,cat,"two\nlines",1.00\n')
+    check([(dummy_filename, size)])
+
+    # any other change reloads the whole ledger
+    with open(dummy_filename, "r+b") as lf:
+        lf.seek(lf.read().index(b"2017"))
+        lf.write(b"2015")
+    check([(dummy_filename, 0)])
+    with open(dummy_filename, "r+b") as lf:
+        lf.seek(lf.read().index(b"2015"))
+        lf.write(b"2014")
+    with open(dummy_filename, "a") as lf:
+        lf.write("6,2017-02-04 02:12:45,cat,desc,1.00\n")
+    check([(dummy_filename, 0)])
+    checkbook.compact_ledger(dummy_filename)
+    check([(dummy_filename, 0)])
+
+    checkbook.remove_ledger_file(dummy_filename)
+
+
+def test_command_line(monkeypatch, capsys, tmp_path):
+    monkeypatch.setattr(checkbook, "LEDGER_FILENAME", "ledger.csv")
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    dummy_filename = "dummy_command_ledger.csv"
+    checkbook.migrate_ledger("dummy_ledger_file1.csv", dummy_filename)
+    balance = checkbook.view_balance(dummy_filename)
+
+    def run(*argv):
+        status = checkbook.main(["--ledger", dummy_filename, *argv])
+        return status, capsys.readouterr()
+
+    status, (out, _) = run(
+        "deposit", "10.25", "--date", "2020-01-02", "--time", "03:04:05"
+    )
+    assert (status, out) == (0, "Recorded transaction 4.\n")
+    with pytest.raises(SystemExit):
+        run("withdraw", "1.0")
+    status, (out, _) = run("modify", "4", "--category", "pay")
+    assert status == 0
+    row = checkbook.get_trans(dummy_filename)[-1]
+    assert row["Timestamp"] == "2020-01-02 03:04:05"
+    assert (row["Category"], row["Amount"]) == ("pay", "10.25")
+    assert run("modify", "9")[0] == 1
+    status, (out, _) = run("search", "--category", "pay")
+    assert "Average transaction in pay: $10.25" in out
+
+    batch_file = tmp_path / "commands.txt"
+    batch_file.write_text(
+        "# one command per line\n"
+        "\n"
+        "withdraw 0.25 --date 2020-01-03 --time 00:00:00 "
+        '--description "two words"\n'
+        "balance\n"
+        "history --first 5\n"
+        "withdraw nope\n"
+        "batch\n"
+    )
+    status, (out, err) = run("batch", str(batch_file))
+    assert status == 1
+    assert f"Your current balance is : ${balance + 10:,.2f}" in out
+    assert "two words" in out
+    assert "Line 6 failed." in err and "Line 7: " in err
+    assert "Ran 5 commands, 2 failed." in err
+    assert not checkbook.CACHE_LEDGERS and not checkbook.LEDGER_CACHE
+
+    # the menu and its prompts loop instead of recursing
+    answers = iter(["x"] * 2000 + ["1", "x", "6"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+    monkeypatch.setattr(checkbook, "LEDGER_FILENAME", dummy_filename)
+    checkbook.checkbook_loop()
+    answers = iter(["x"] * 2000 + ["1.50"])
+    assert checkbook.get_valid_amount("") == 1.5
+
+    checkbook.remove_ledger_file(dummy_filename)
+
+
+def test_transactions(monkeypatch, capsys):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    dummy_filename = "dummy_transactions_ledger.csv"
+    checkbook.migrate_ledger("dummy_ledger_file1.csv", dummy_filename)
+    checkbook.modify_transaction(
+        dummy_filename, 2, "2020-02-03", "04:05:06", "pay", "bonus", 7.5
+    )
+    ledg_list = checkbook.get_trans(dummy_filename)
+    transactions = checkbook.get_transactions(dummy_filename)
+    assert transactions == [
+        checkbook.row_to_transaction(row) for row in ledg_list
+    ]
+    transaction = transactions[1]
+    assert transaction.id == 2 and transaction.category == "pay"
+    assert transaction.epoch == checkbook.timestamp_to_epoch(
+        "2020-02-03 04:05:06"
+    )
+    assert checkbook.transaction_to_row(transaction) == ledg_list[1]
+    assert not hasattr(transaction, "__dict__")
+
+    # every consumer prints Transactions as it prints dictionaries
+    for print_rows in (
+        checkbook.print_ledger,
+        checkbook.print_ledger_stats,
+        lambda rows: checkbook.print_by_date("2020-02", rows),
+        lambda rows: checkbook.print_by_date_range(
+            "2020-01-01", "2020-12-31", rows
+        ),
+        lambda rows: checkbook.print_by_cat("pay", rows),
+        lambda rows: checkbook.print_by_desc("bonus", rows),
+        lambda rows: checkbook.print_by_keywords(["BONUS"], rows, True, True),
+    ):
+        print_rows(ledg_list)
+        expected = capsys.readouterr().out
+        print_rows(transactions)
+        assert capsys.readouterr().out == expected
+    checkbook.print_transaction(transaction)
+    assert capsys.readouterr().out == checkbook.format_transaction(
+        ledg_list[1]
+    ) + "\n"
+
+    checkbook.print_ledger([])
+    assert capsys.readouterr().out.endswith("None.\n")
+
+    checkbook.remove_ledger_file(dummy_filename)
+
+
+def test_profiling(monkeypatch, capsys):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    monkeypatch.setattr(checkbook, "LEDGER_FILENAME", "ledger.csv")
+    monkeypatch.setattr(checkbook, "CACHE_LEDGERS", False)
+    monkeypatch.setattr(checkbook, "LEDGER_CACHE", {})
+    monkeypatch.delenv(checkbook.PROFILE_ENV_VAR, raising=False)
+    dummy_filename = "dummy_profile_ledger.csv"
+    checkbook.migrate_ledger("dummy_ledger_file1.csv", dummy_filename)
+    get_trans = checkbook.get_trans
+
+    argv = ["--ledger", dummy_filename, "--profile-json", "history"]
+    assert checkbook.main(argv) == 0
+    profile = json.loads(capsys.readouterr().err)
+    assert profile["action"] == "history"
+    assert profile["rows_parsed"] == 3
+    assert profile["file_opens"] >= 1
+    # with numpy, history loads the ledger as columns
+    if checkbook.np is None:
+        loader, printer = "get_transactions", "print_ledger"
+    else:
+        loader, printer = "load_columns", "print_ledger_columns"
+    assert profile["calls"][loader] == 1
+    assert profile["calls"][printer] == 1
+    assert profile["parse_seconds"] > 0 and profile["render_seconds"] > 0
+    # nothing stays wrapped once profiling is over
+    assert checkbook.get_trans is get_trans
+    assert "open" not in vars(checkbook) and "input" not in vars(checkbook)
+
+    # calls through the backend tables are profiled and unwrapped too
+    binary_filename = "dummy_profile_ledger.bin"
+    checkbook.migrate_ledger(dummy_filename, binary_filename)
+    backend = dict(checkbook.BINARY_BACKEND)
+    argv = ["--ledger", binary_filename, "--profile-json", "history"]
+    assert checkbook.main(argv) == 0
+    profile = json.loads(capsys.readouterr().err)
+    assert any(name.startswith("binary_") for name in profile["calls"])
+    assert profile["process_bytes_read"] is None or (
+        profile["process_bytes_read"] > 0
+    )
+    assert checkbook.BINARY_BACKEND == backend
+    checkbook.remove_ledger_file(binary_filename)
+
+    # each menu action is profiled, the balance also under cProfile
+    answers = iter(["1", "6"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+    monkeypatch.setenv(checkbook.PROFILE_ENV_VAR, "1")
+    argv = ["--ledger", dummy_filename, "--profile-session", "cprofile"]
+    assert checkbook.main([*argv, "--profile-action", "balance"]) == 0
+    err = capsys.readouterr().err
+    assert "profile of balance" in err and "view_balance()" in err
+    assert "process bytes read" in err and "function calls" in err
+    assert checkbook.get_trans is get_trans
+
+    checkbook.remove_ledger_file(dummy_filename)
+
+
+def test_ledger_server(monkeypatch):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    dummy_filename = "dummy_server_ledger.csv"
+    checkbook.migrate_ledger("dummy_ledger_file1.csv", dummy_filename)
+    # new IDs come from the served ledger, not from the menu's
+    other_filename = "dummy_other_server_ledger.csv"
+    checkbook.create_ledger_file(other_filename)
+    checkbook.write_record(
+        other_filename,
+        checkbook.create_deposit_record("2020-01-01", "00:00:00", "", "", 1),
+    )
+    checkbook.append_records(
+        other_filename,
+        [dict(checkbook.get_trans(other_filename)[0], ID=100)],
+    )
+    monkeypatch.setattr(checkbook, "LEDGER_FILENAME", other_filename)
+
+    async def request(port, method, path, payload=None):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        if payload is None or isinstance(payload, bytes):
+            body = payload or b""
+        else:
+            body = json.dumps(payload).encode()
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode()
+            + body
+        )
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(body)
+
+    async def session():
+        server, state = await checkbook.start_server(
+            dummy_filename, "127.0.0.1", 0
+        )
+        port = server.sockets[0].getsockname()[1]
+        try:
+            # concurrent writes are serialized by the ledger writer
+            responses = await asyncio.gather(
+                *(
+                    request(port, "POST", "/deposit", {"amount": amount})
+                    for amount in (1, 2.5, "3.25")
+                ),
+                request(port, "POST", "/withdraw", {"amount": -1}),
+                request(port, "POST", "/modify", {"id": 2, "amount": 9}),
+                request(port, "POST", "/modify", {"id": 2, "category": "x"}),
+            )
+            assert [status for status, _ in responses] == [
+                201,
+                201,
+                201,
+                400,
+                200,
+                200,
+            ]
+            ids = [body["transaction"]["ID"] for _, body in responses[:3]]
+            ids.sort()
+            assert ids == ["4", "5", "6"]
+            assert responses[-1][1]["transaction"]["Amount"] == "-9.00"
+
+            status, body = await request(port, "GET", "/balance")
+            assert body["balance"] == checkbook.view_balance(dummy_filename)
+            status, body = await request(port, "GET", "/history?first=2")
+            ledger_list = checkbook.get_trans(dummy_filename)
+            assert body == {"transactions": ledger_list[1:], "last_id": 6}
+            start, end = checkbook.period_bounds("2017")
+            for query, expected in (
+                (
+                    "date=2017",
+                    checkbook.date_range_transactions(
+                        dummy_filename, start, end
+                    ),
+                ),
+                (
+                    "category=x",
+                    checkbook.category_transactions(dummy_filename, "x"),
+                ),
+                (
+                    "keywords=DESC1+desc3&any=1&ignore_case=1",
+                    checkbook.description_transactions(
+                        dummy_filename, ["DESC1", "desc3"], False, True
+                    ),
+                ),
+            ):
+                status, body = await request(port, "GET", "/search?" + query)
+                assert body["transactions"] == expected
+                assert expected
+            status, body = await request(port, "GET", "/search?date=2016-13")
+            assert status == 400
+            status, body = await request(port, "DELETE", "/balance")
+            assert status == 404
+            status, body = await request(port, "POST", "/modify", {"id": 99})
+            assert status == 400
+            status, body = await request(port, "POST", "/deposit", b"[1]")
+            assert status == 400
+            monkeypatch.setattr(checkbook, "SERVER_MAX_BODY", 10)
+            status, body = await request(port, "POST", "/deposit", b" " * 11)
+            assert status == 400 and body["error"].endswith("over 10 bytes")
+        finally:
+            await checkbook.stop_server(server, state)
+
+    asyncio.run(session())
+    checkbook.remove_ledger_file(dummy_filename)
+    checkbook.remove_ledger_file(other_filename)
+
+
+def append_from_process(ledger_file, producer, count):
+    # half the records go through the group commit writer and half are
+    # written directly with an ID that is already taken, while row 1 is
+    # modified (and the ledger compacted) over and over
+    def append(i):
+        record = {
+            "ID": 1,
+            "Timestamp": "2020-01-01 00:00:00",
+            "Category": f"p{producer}",
+            "Description": f"p{producer} r{i}",
+            "Amount": "1.00",
+        }
+        if i % 2:
+            return checkbook.commit_record(ledger_file, record)
+        checkbook.write_record(ledger_file, record)
+        if i % 4 == 0:
+            checkbook.modify_transaction(
+                ledger_file, 1, "2020-01-01", "00:00:00", "x", "y", 1.0
+            )
+        return record["ID"]
+
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        return list(pool.map(append, range(count)))
+
+
+def test_concurrent_appends(monkeypatch):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    monkeypatch.setattr(checkbook, "COMPACT_LOG_RATIO", 0)
+    dummy_filename = "dummy_concurrent_ledger.csv"
+    checkbook.create_ledger_file(dummy_filename)
+    checkbook.write_record(
+        dummy_filename,
+        checkbook.create_deposit_record("2020-01-01", "00:00:00", "", "", 1),
+    )
+    processes, count = 4, 40
+
+    with concurrent.futures.ProcessPoolExecutor(
+        processes, mp_context=multiprocessing.get_context("fork")
+    ) as pool:
+        results = pool.map(
+            append_from_process,
+            [dummy_filename] * processes,
+            range(processes),
+            [count] * processes,
+        )
+        ids = sorted(row_id for result in results for row_id in result)
+
+    # no row is lost, duplicated or torn
+    total = processes * count + 1
+    assert ids == list(range(2, total + 1))
+    ledg_list = checkbook.get_trans(dummy_filename)
+    assert [int(row["ID"]) for row in ledg_list] == list(range(1, total + 1))
+    assert {row["Description"] for row in ledg_list[1:]} == {
+        f"p{producer} r{i}"
+        for producer in range(processes)
+        for i in range(count)
+    }
+    assert ledg_list[0]["Description"] == "y"
+    assert checkbook.view_balance(dummy_filename) == total
+    os.remove(dummy_filename + checkbook.BALANCE_SUFFIX)
+    assert checkbook.view_balance(dummy_filename) == total
+
+    checkbook.remove_ledger_file(dummy_filename)
+
+
+def test_query_engine(monkeypatch, capsys):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    monkeypatch.setattr(checkbook, "LEDGER_FILENAME", "ledger.csv")
+    dummy_filename = "dummy_query_ledger.csv"
+    checkbook.create_ledger_file(dummy_filename)
+    checkbook.append_records(
+        dummy_filename,
+        [
+            {
+                "ID": row_id,
+                "Timestamp": f"2023-{row_id % 12 + 1:02}-15 12:00:00",
+                "Category": ("rent", "utilities", "food")[row_id % 3],
+                "Description": ("ACH rent", "card", "ach")[row_id % 4 % 3],
+                "Amount": f"{(row_id * 37) % 1200 - 900:.2f}",
+            }
+            for row_id in range(1, 61)
+        ],
+    )
+    checkbook.modify_transaction(
+        dummy_filename, 7, "2023-02-01", "00:00:00", "rent", "ACH", 999
+    )
+
+    def brute_force(ledger_file, query):
+        return [
+            row
+            for row in checkbook.get_trans(ledger_file)
+            if checkbook.compile_query(query)(row)
+        ]
+
+    queries = [
+        checkbook.make_query(
+            categories=["rent", "utilities"],
+            start=checkbook.period_bounds("2023-01")[0],
+            end=checkbook.period_bounds("2023-06")[1],
+            terms=["ACH"],
+            max_amount=-500,
+        ),
+        checkbook.make_query(min_amount=-100, max_amount=100),
+        checkbook.make_query(terms=["ach"], ignore_case=True, sort="amount"),
+        checkbook.make_query(
+            categories=["food"], sort="timestamp", reverse=True, limit=3
+        ),
+        checkbook.make_query(start=checkbook.period_bounds("2023-11")[0]),
+        checkbook.make_query(reverse=True, limit=2),
+    ]
+    binary_filename = "dummy_query_ledger.bin"
+    sqlite_filename = "dummy_query_ledger.db"
+    checkbook.migrate_ledger(dummy_filename, binary_filename)
+    checkbook.migrate_ledger(dummy_filename, sqlite_filename)
+    for ledger_file in (dummy_filename, binary_filename, sqlite_filename):
+        for query in queries:
+            expected = brute_force(ledger_file, query)
+            if query["sort"]:
+                expected.sort(
+                    key=checkbook.query_sort_key(query["sort"]),
+                    reverse=query["reverse"],
+                )
+            elif query["reverse"]:
+                expected.reverse()
+            stats = {}
+            rows = list(
+                checkbook.query_transactions(ledger_file, query, stats)
+            )
+            assert rows == expected[: query["limit"]]
+            cents = [checkbook.amount_to_cents(r["Amount"]) for r in expected]
+            assert stats == {
+                "count": len(cents),
+                "total": sum(cents),
+                "min": min(cents, default=None),
+                "max": max(cents, default=None),
+            }
+    # the first query is answered from the indexes, without reading the
+    # whole ledger
+    with monkeypatch.context() as m:
+        m.setattr(checkbook, "ledger_row_stream", None)
+        m.setattr(checkbook, "get_trans", None)
+        list(checkbook.query_transactions(dummy_filename, queries[0], {}))
+    # a paused stream does not hold the ledger lock
+    rows = checkbook.ledger_row_stream(dummy_filename)
+    assert next(rows)["ID"] == "1"
+    locker = concurrent.futures.ThreadPoolExecutor(1)
+    assert locker.submit(checkbook.LEDGER_LOCK.acquire, timeout=1).result()
+    locker.submit(checkbook.LEDGER_LOCK.release).result()
+    locker.shutdown()
+    assert len(list(rows)) == 59
+
+    argv = ["--ledger", dummy_filename, "history", "--category", "rent"]
+    argv += ["--category", "utilities", "--from", "2023-01", "--to", "2023-06"]
+    argv += ["--description", "ACH"]
+    assert checkbook.main([*argv, "--max-amount", "-500"]) == 0
+    out = capsys.readouterr().out
+    matches = len(brute_force(dummy_filename, queries[0]))
+    assert f"\n{matches} matches ({matches} shown)" in out
+    assert "in category rent or utilities, 2023-01-01 to 2023-06-30, " in out
+    assert checkbook.main([*argv, "--count", "2"]) == 1
+
+    answers = iter(["rent, utilities", "2023-01", "x", "2023-06", "ACH", "a"])
+    answers = itertools.chain(answers, ["", "-500", "amount", "y", "2"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+    query = checkbook.get_query_input()
+    assert query == dict(queries[0], sort="amount", reverse=True, limit=2)
+
+    for ledger_file in (dummy_filename, binary_filename, sqlite_filename):
+        checkbook.remove_ledger_file(ledger_file)
+
+
+def test_rollups(monkeypatch, capsys):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    monkeypatch.setattr(checkbook, "LEDGER_FILENAME", "dummy_rollups.csv")
+    dummy_filename = "dummy_rollups.csv"
+    checkbook.migrate_ledger("dummy_ledger_file1.csv", dummy_filename)
+
+    def check():
+        rollups = checkbook.ledger_rollups(dummy_filename)
+        # the summary is kept up to date without reading every row
+        with monkeypatch.context() as m:
+            m.setattr(checkbook, "get_trans", None)
+            assert checkbook.ledger_rollups(dummy_filename) == rollups
+        expected = checkbook.build_rollups(checkbook.get_trans(dummy_filename))
+        assert rollups == expected
+        return rollups
+
+    rollups = check()
+    assert rollups["category"]["cat1"] == {
+        "count": 1,
+        "cents": 2000,
+        "min": 2000,
+        "max": 2000,
+    }
+    for amount in (5, 7.5):
+        checkbook.write_record(
+            dummy_filename,
+            checkbook.create_deposit_record(
+                "2017-02-04", "00:00:00", "cat1", "more", amount
+            ),
+        )
+    rollups = check()
+    assert rollups["month"]["2017-02"]["count"] == 3
+    assert rollups["category"]["cat1"]["min"] == 500
+
+    # moving the minimum to another month and category
+    checkbook.modify_transaction(
+        dummy_filename, 4, "2018-05-01", "00:00:00", "cat3", "moved", 1
+    )
+    header, _ = checkbook.read_index(dummy_filename, ".rollups", ())
+    assert header["rollups"]["category"]["cat1"]["min"] is None
+    rollups = check()
+    assert rollups["category"]["cat1"]["min"] == 750
+    assert rollups["category"]["cat3"]["cents"] == 5100
+    assert rollups["month"]["2018-05"]["min"] == 100
+
+    checkbook.compact_ledger(dummy_filename)
+    header, _ = checkbook.read_index(dummy_filename, ".rollups", ())
+    with checkbook.ledger_changes(dummy_filename, header["coverage"]) as c:
+        assert c["complete"]
+    check()
+
+    assert checkbook.main(["--ledger", dummy_filename, "summary"]) == 0
+    out, _ = capsys.readouterr()
+    assert "2018-05             |2         |$51.00" in out
+
+    # verify reports groups that drifted and rebuilds them
+    header["rollups"]["category"]["cat1"]["count"] = 9
+    del header["keys"]
+    checkbook.write_index(dummy_filename, ".rollups", header, {})
+    assert checkbook.main(["--ledger", dummy_filename, "verify"]) == 1
+    out, _ = capsys.readouterr()
+    assert "category 'cat1'" in out and "1 groups differed" in out
+    assert checkbook.verify_rollups(dummy_filename) == []
+
+    other_filename = "dummy_rollups.db"
+    checkbook.migrate_ledger(dummy_filename, other_filename)
+    assert checkbook.ledger_rollups(other_filename) == check()
+    checkbook.remove_ledger_file(other_filename)
+    checkbook.remove_ledger_file(dummy_filename)
+
+
+def test_archive(monkeypatch, capsys):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    monkeypatch.setattr(checkbook, "ARCHIVE_BLOCK_ROWS", 8)
+    dummy_filename = "dummy_archive_ledger.csv"
+    checkbook.create_ledger_file(dummy_filename)
+    checkbook.append_records(
+        dummy_filename,
+        [
+            {
+                "ID": row_id,
+                "Timestamp": f"{2020 + (row_id - 1) // 20 + (row_id > 35)}-"
+                f"{(row_id - 1) % 20 // 2 + 1:02}-01 12:00:00",
+                "Category": ("rent", "food", "travel")[row_id % 3],
+                "Description": f"payment {row_id}",
+                "Amount": f"{(row_id * 37) % 1200 - 900:.2f}",
+            }
+            for row_id in range(1, 51)
+        ],
+    )
+    # backdated past the history that will be archived
+    checkbook.modify_transaction(
+        dummy_filename, 40, "2021-01-01", "00:00:00", "rent", "late", 5
+    )
+    checkbook.modify_transaction(
+        dummy_filename, 3, "2020-02-01", "00:00:00", "food", "fixed", 7
+    )
+    expected = checkbook.get_trans(dummy_filename)
+    balance = checkbook.view_balance(dummy_filename)
+    rollups = checkbook.build_rollups(expected)
+
+    def check():
+        assert checkbook.get_trans(dummy_filename) == expected
+        assert checkbook.get_transactions(dummy_filename) == [
+            checkbook.row_to_transaction(row) for row in expected
+        ]
+        assert checkbook.view_balance(dummy_filename) == balance
+        assert checkbook.ledger_rollups(dummy_filename) == rollups
+        assert checkbook.last_row_id(dummy_filename) == 50
+        assert checkbook.read_page(dummy_filename, 18, 5) == expected[17:22]
+        assert checkbook.category_transactions(dummy_filename, "rent") == [
+            row for row in expected if row["Category"] == "rent"
+        ]
+        start, end = checkbook.period_bounds("2021")
+        rows = checkbook.date_range_transactions(dummy_filename, start, end)
+        assert rows == [
+            row
+            for row in expected
+            if start <= checkbook.timestamp_to_epoch(row["Timestamp"]) < end
+        ]
+        assert checkbook.description_transactions(
+            dummy_filename, ["payment 1"]
+        ) == [row for row in expected if "payment 1" in row["Description"]]
+        query = checkbook.make_query(categories=["food"], terms=["payment"])
+        assert list(
+            checkbook.query_transactions(dummy_filename, query, {})
+        ) == [
+            row
+            for row in expected
+            if row["Category"] == "food" and "payment" in row["Description"]
+        ]
+
+    assert checkbook.archive_ledger(dummy_filename, "2021", "gzip") == 20
+    with open(dummy_filename) as lf:
+        live = lf.read()
+    with open(dummy_filename) as lf:
+        ids = [row["ID"] for row in csv.DictReader(lf)]
+    assert ids == [str(row_id) for row_id in range(21, 51)]
+    assert not os.path.exists(dummy_filename + ".log")
+    index = checkbook.archive_index(dummy_filename)
+    assert [footer["rows"] for footer in index["blocks"]] == [8, 8, 4]
+    assert [footer["first_id"] for footer in index["blocks"]] == [1, 9, 17]
+    check()
+    assert checkbook.verify_rollups(dummy_filename) == []
+    check()
+
+    # only the blocks that can match are decompressed
+    blocks = []
+    read_archive_block = checkbook.read_archive_block
+
+    def counting_read(af, footer):
+        blocks.append(footer["first_id"])
+        return read_archive_block(af, footer)
+
+    monkeypatch.setattr(checkbook, "read_archive_block", counting_read)
+    start, end = checkbook.period_bounds("2020-06")
+    assert [
+        row["ID"]
+        for row in checkbook.date_range_transactions(
+            dummy_filename, start, end
+        )
+    ] == ["11", "12"]
+    assert checkbook.read_page(dummy_filename, 12, 2) == expected[11:13]
+    assert checkbook.read_page(dummy_filename, 30, 2) == expected[29:31]
+    assert blocks == [9, 9]
+    monkeypatch.setattr(checkbook, "read_archive_block", read_archive_block)
+
+    with pytest.raises(ValueError):
+        checkbook.modify_transaction(
+            dummy_filename, 5, "2020-01-01", "00:00:00", "", "", 1
+        )
+    assert checkbook.is_valid_transaction_id(dummy_filename, 5)
+    assert not checkbook.is_valid_transaction_id(dummy_filename, 51)
+    assert checkbook.main(["--ledger", dummy_filename, "modify", "5"]) == 1
+    assert "archived" in capsys.readouterr()[1]
+
+    assert checkbook.archive_ledger(dummy_filename, "2021") == 0
+    with open(dummy_filename) as lf:
+        assert lf.read() == live
+    check()
+
+    # an archive interrupted before or after rewriting the ledger reads
+    # the same, and the following rows go into new blocks
+    archive_filename = dummy_filename + ".archive"
+    pending_filename = dummy_filename + ".archive.pending"
+    with open(archive_filename, "rb") as af:
+        archived = af.read()
+    args = ["--ledger", dummy_filename, "archive", "2022", "--codec", "lzma"]
+    assert checkbook.main(args) == 0
+    assert "Archived 15 transactions" in capsys.readouterr()[0]
+    with open(dummy_filename) as lf:
+        rewritten = lf.read()
+    os.replace(archive_filename, pending_filename)
+    checkbook.replace_file(archive_filename, archived)
+    checkbook.replace_file(dummy_filename, live)
+    check()
+    assert os.path.exists(pending_filename)
+    checkbook.replace_file(dummy_filename, rewritten)
+    check()
+    assert not os.path.exists(pending_filename)
+    index = checkbook.archive_index(dummy_filename)
+    assert [footer["codec"] for footer in index["blocks"]] == (
+        ["gzip"] * 3 + ["lzma"] * 2
+    )
+    check()
+
+    # an archive of the whole ledger
+    assert checkbook.archive_ledger(dummy_filename, "2099") == 15
+    check()
+    record = checkbook.create_deposit_record(
+        "2024-01-01", "00:00:00", "pay", "salary", 10
+    )
+    checkbook.write_record(dummy_filename, record)
+    assert checkbook.last_row_id(dummy_filename) == 51
+    assert checkbook.view_balance(dummy_filename) == round(balance + 10, 2)
+
+    checkbook.remove_ledger_file(dummy_filename)
+    assert not os.path.exists(dummy_filename + ".archive")
+
+
+def test_consolidate_ledgers(monkeypatch, capsys, tmp_path):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    accounts = tmp_path / "accounts"
+    accounts.mkdir()
+    ledger_files = [str(accounts / f"account{i}.csv") for i in range(3)]
+    ledger_files.append(str(accounts / "savings.db"))
+    for i, ledger_file in enumerate(ledger_files):
+        checkbook.create_ledger_file(ledger_file)
+        checkbook.append_records(
+            ledger_file,
+            [
+                {
+                    "ID": row_id,
+                    "Timestamp": f"2023-0{(row_id * (i + 2)) % 9 + 1}-01 "
+                    f"12:00:0{i}",
+                    "Category": "cat",
+                    "Description": f"account {i}",
+                    "Amount": f"{(row_id * 37 + i) % 200 - 120:.2f}",
+                }
+                for row_id in range(1, 6 + i)
+            ],
+        )
+    checkbook.view_balance(ledger_files[0])
+
+    assert checkbook.find_ledgers([str(accounts)]) == ledger_files
+    pattern = str(accounts / "account*")
+    assert checkbook.find_ledgers([pattern, ledger_files[0]]) == (
+        ledger_files[:3]
+    )
+    with pytest.raises(FileNotFoundError):
+        checkbook.find_ledgers([str(accounts / "*.bin")])
+
+    combined, failed = checkbook.consolidate_ledgers(ledger_files)
+    out, _ = capsys.readouterr()
+    assert failed == []
+    assert combined["count"] == 5 + 6 + 7 + 8
+    assert combined["cents"] == sum(
+        checkbook.amount_to_cents(f"{checkbook.view_balance(f):.2f}")
+        for f in ledger_files
+    )
+    assert "account1" in out and "4 accounts" in out
+
+    expected = sorted(
+        (
+            (checkbook.timestamp_to_epoch(row["Timestamp"]), int(row["ID"]))
+            for ledger_file in ledger_files
+            for row in checkbook.get_trans(ledger_file)
+        )
+    )
+    outputs = []
+    for processes in (False, True):
+        assert checkbook.consolidate_ledgers(
+            ledger_files, True, processes, 2
+        ) == (combined, [])
+        outputs.append(capsys.readouterr()[0])
+    assert outputs[0] == outputs[1]
+    rows = [
+        line.split("|")
+        for line in outputs[0].split("\nAccount")[1].splitlines()
+        if line[:1] in ("a", "s")
+    ]
+    assert [
+        (checkbook.timestamp_to_epoch(row[2].strip()), int(row[1]))
+        for row in rows
+    ] == expected
+
+    with open(accounts / "broken.csv", "w") as bf:
+        bf.write("id,timestamp,category,description,amount\n")
+    with open(accounts / "short.csv", "w") as sf:
+        sf.write("ID,Timestamp,Category,Description,Amount\n1,2023-01-01\n")
+    with open(accounts / "overflow.csv", "w") as of:
+        of.write("ID,Timestamp,Category,Description,Amount\n")
+        of.write("1,2023-01-01 00:00:00,cat,desc,inf\n")
+    assert checkbook.main(["consolidate", str(accounts)]) == 1
+    out, err = capsys.readouterr()
+    for name in ("broken.csv", "short.csv", "overflow.csv"):
+        assert name in err
+    assert "4 accounts" in out
+
+
+def test_balance_as_of(monkeypatch, capsys):
+    monkeypatch.setattr(checkbook, "COMPACT_IN_BACKGROUND", False)
+    monkeypatch.setattr(checkbook, "COMPACT_LOG_RATIO", 10)
+    monkeypatch.setattr(checkbook, "ARCHIVE_BLOCK_ROWS", 4)
+    monkeypatch.setattr(checkbook, "LEDGER_FILENAME", "ledger.csv")
+    dummy_filename = "dummy_as_of_ledger.csv"
+    checkbook.create_ledger_file(dummy_filename)
+
+    def append(first, count):
+        checkbook.append_records(
+            dummy_filename,
+            [
+                {
+                    "ID": row_id,
+                    "Timestamp": f"20{20 + row_id // 12}-"
+                    f"{(row_id * 5) % 12 + 1:02}-{row_id % 3 + 1:02} 00:00:00",
+                    "Category": "cat",
+                    "Description": "desc",
+                    "Amount": f"{(row_id * 37) % 200 - 120:.2f}",
+                }
+                for row_id in range(first, first + count)
+            ],
+        )
+
+    def check(ledger_file=dummy_filename):
+        rows = [
+            (
+                checkbook.timestamp_to_epoch(row["Timestamp"]),
+                checkbook.amount_to_cents(row["Amount"]),
+            )
+            for row in checkbook.get_trans(ledger_file)
+        ]
+        epochs = sorted({epoch for epoch, _ in rows})
+        points = [0, *epochs, *(epoch + 1 for epoch in epochs), 2**40]
+        for point in points:
+            expected = sum(cents for epoch, cents in rows if epoch < point)
+            assert checkbook.cents_before(ledger_file, point) == expected
+        start, end = epochs[3], epochs[-3]
+        assert checkbook.net_change(ledger_file, start, end) == sum(
+            cents for epoch, cents in rows if start <= epoch < end
+        ) / 100
+
+    append(1, 30)
+    check()
+    header, arrays = checkbook.read_index(dummy_filename, ".prefix_sums")
+    assert list(arrays["sums"])[-1] == checkbook.amount_to_cents(
+        f"{checkbook.view_balance(dummy_filename):.2f}"
+    )
+
+    # appends and modifications are applied on top of the saved index
+    append(31, 5)
+    checkbook.modify_transaction(
+        dummy_filename, 3, "2019-06-01", "00:00:00", "cat", "moved", 500
+    )
+    checkbook.modify_transaction(
+        dummy_filename, 20, "2021-02-01", "00:00:00", "cat", "", 1
+    )
+    assert checkbook.read_index(dummy_filename, ".prefix_sums")[0] == header
+    check()
+    monkeypatch.setattr(checkbook, "INDEX_REFRESH_BYTES", 0)
+    checkbook.maintain_indexes(dummy_filename)
+    header = checkbook.read_index(dummy_filename, ".prefix_sums")[0]
+    with checkbook.ledger_changes(dummy_filename, header["coverage"]) as c:
+        assert c["complete"] and not list(c["rows"])
+    check()
+    monkeypatch.setattr(checkbook, "INDEX_REFRESH_BYTES", 1024 * 1024)
+    checkbook.compact_ledger(dummy_filename)
+    check()
+
+    for suffix in (".db", ".bin", ".shards"):
+        other_filename = "dummy_as_of_ledger" + suffix
+        checkbook.migrate_ledger(dummy_filename, other_filename)
+        check(other_filename)
+        checkbook.remove_ledger_file(other_filename)
+
+    # archived blocks count in full, or row by row if they straddle
+    checkbook.archive_ledger(dummy_filename, "2021-06")
+    assert checkbook.archive_index(dummy_filename)["blocks"]
+    check()
+
+    assert checkbook.main(
+        ["--ledger", dummy_filename, "as-of", "2021", "--since", "2020-06"]
+    ) == 0
+    out, _ = capsys.readouterr()
+    balance = checkbook.balance_as_of(
+        dummy_filename, checkbook.period_bounds("2021")[1]
+    )
+    change = checkbook.net_change(
+        dummy_filename,
+        checkbook.period_bounds("2020-06")[0],
+        checkbook.period_bounds("2021")[1],
+    )
+    assert f"end of 2021 was : ${balance:,.2f}" in out
+    assert f"start of 2020-06 : ${change:,.2f}" in out
+
+    answers = iter(["8", "7", "2021", "", "6"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+    monkeypatch.setattr(checkbook, "LEDGER_FILENAME", dummy_filename)
+    checkbook.checkbook_loop()
+    out, _ = capsys.readouterr()
+    assert f"end of 2021 was : ${balance:,.2f}" in out
+    assert "Net change" not in out
+    # Exit is listed last, still as 6
+    assert "7) View balance as of a past date\n6) Exit\n" in out
+    assert "Please enter 1-7" in out
+
+    checkbook.remove_ledger_file(dummy_filename)
+    assert not os.path.exists(dummy_filename + ".prefix_sums")